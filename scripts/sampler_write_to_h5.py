@@ -4,9 +4,15 @@ Description:
     an HDF5 file. See `config_examples/sample_h5.yml` for an example
     configuration file that can be modified & used to run this script.
 
+    The samples are written by `selene_sdk.samplers.H5Exporter`, which
+    can also be run from the command line with the `export` operation
+    (see `config_examples/export_h5.yml`). Running the script again with
+    the same arguments resumes an interrupted export.
+
 Usage:
     sampler_write_to_h5.py <config-yml> <mode> <n-steps>
                            [--seed=<rseed>] [--compress]
+                           [--n-workers=<n>]
     sampler_write_to_h5.py -h | --help
 
 Options:
@@ -20,13 +26,11 @@ Options:
     --seed=<rseed>          The random seed to use during sampling.
                             [default: 123]
     --compress              Whether to compress the data via np.packbits or not.
+    --n-workers=<n>         The number of sampling processes. [default: 1]
 """
 from docopt import docopt
-import os
-
-import h5py
-import numpy as np
 
+from selene_sdk.samplers import H5Exporter
 from selene_sdk.utils import load_path, instantiate
 
 
@@ -42,48 +46,14 @@ if __name__ == "__main__":
     output_dir = configs["sampler"].keywords["output_dir"]
     data_sampler = instantiate(configs["sampler"])
 
-    seq_len = configs["sampler"].keywords["sequence_length"]
     batch_size = configs["batch_size"]
-    n_steps = int(arguments["<n-steps>"])
-    packbits = arguments["--compress"]
-
-    with h5py.File(os.path.join(output_dir,
-                                "{0}_seed={1}_N={2}.h5".format(
-                                    arguments["<mode>"],
-                                    arguments["--seed"],
-                                    batch_size * n_steps)), "a") as fh:
-        seqs = None
-        tgts = None
-        for i in range(n_steps):
-            if i % 50 == 0:
-                print("processing step {0} for {1} records".format(i, arguments["<mode>"]))
-            sequences, targets = data_sampler.sample(batch_size=configs["batch_size"])
-            sequences_length = sequences.shape[1]
-            targets_length = targets.shape[1]
-            if packbits:
-                sequences = np.packbits(sequences > 0, axis=1)
-                targets = np.packbits(targets > 0, axis=1)
-            if seqs is None:
-                fh.create_dataset("sequences_length", data=sequences_length)
-                if packbits:
-                    seqs = fh.create_dataset(
-                        "sequences",
-                        (configs["batch_size"] * n_steps,
-                         sequences.shape[1],
-                         sequences.shape[2]),
-                        dtype='uint8')
-                else:
-                    seqs = fh.create_dataset(
-                        "sequences",
-                        (configs["batch_size"] * n_steps,
-                         sequences.shape[1],
-                         sequences.shape[2]),
-                        dtype='float')
-            if tgts is None:
-                fh.create_dataset("targets_length", data=targets_length)
-                tgts = fh.create_dataset(
-                    "targets",
-                    (configs["batch_size"] * n_steps, targets.shape[1]),
-                    dtype='uint8')
-            seqs[i*configs["batch_size"]:(i+1)*configs["batch_size"]] = sequences
-            tgts[i*configs["batch_size"]:(i+1)*configs["batch_size"],:] = targets
+    h5_exporter = H5Exporter(
+        data_sampler,
+        output_dir,
+        arguments["<mode>"],
+        batch_size * int(arguments["<n-steps>"]),
+        batch_size=batch_size,
+        num_workers=int(arguments["--n-workers"]),
+        seed=int(arguments["--seed"]),
+        packbits=arguments["--compress"])
+    h5_exporter.export()
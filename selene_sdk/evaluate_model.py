@@ -229,8 +229,9 @@ class EvaluateModel(object):
         batch_losses = []
         all_predictions = []
         for (inputs, targets) in self._test_data:
-            inputs = torch.Tensor(inputs)
-            targets = torch.Tensor(targets[:, self._use_testmat_ixs])
+            inputs = torch.from_numpy(np.asarray(inputs, dtype=np.float32))
+            targets = torch.from_numpy(np.asarray(
+                targets[:, self._use_testmat_ixs], dtype=np.float32))
 
             if self.use_cuda:
                 inputs = inputs.cuda()
@@ -6,6 +6,7 @@ import math
 import numpy as np
 import torch
 
+from ..sequences import reverse_complement_encoding
 from ..utils import _is_lua_trained_model
 
 
@@ -53,13 +54,12 @@ def get_reverse_complement_encoding(allele_encoding,
     -------
     np.ndarray
         The reverse complement encoding of the allele, shape
-        :math:`L \\times 4`.
+        :math:`L \\times 4`. This is a view of `allele_encoding` when
+        possible (see `selene_sdk.sequences.reverse_complement_encoding`).
 
     """
-    base_ixs = {b: i for (i, b) in enumerate(bases_arr)}
-    complement_indices = [
-        base_ixs[complementary_base_dict[b]] for b in bases_arr]
-    return allele_encoding[:, complement_indices][::-1, :]
+    return reverse_complement_encoding(
+        allele_encoding, bases_arr, complementary_base_dict)
 
 
 def predict(model, batch_sequences, use_cuda=False):
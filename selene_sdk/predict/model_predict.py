@@ -322,7 +322,7 @@ class AnalyzeSequences(object):
                 if 'chr' not in chrom and check_chr is True:
                     chrom = "chr{0}".format(chrom)
                 if not str.isdigit(start) or not str.isdigit(end) \
-                        or chrom not in self.reference_sequence.genome:
+                        or chrom not in self.reference_sequence.len_chrs:
                     na_rows.append(line)
                     continue
                 start, end = int(start), int(end)
@@ -413,30 +413,30 @@ class AnalyzeSequences(object):
             ["index", "chrom", "start", "end", "strand", "contains_unk"],
             output_size=len(labels),
             mode="prediction")[0]
-        sequences = None
-        batch_ids = []
-        for i, (label, coords) in enumerate(zip(labels, seq_coords)):
-            encoding, contains_unk = self.reference_sequence.get_encoding_from_coords_check_unk(
-                    *coords, pad=True)
-            if sequences is None:
-                sequences = np.zeros((self.batch_size, *encoding.shape))
-            if i and i % self.batch_size == 0:
-                preds = predict(self.model, sequences, use_cuda=self.use_cuda)
-                reporter.handle_batch_predictions(preds, batch_ids)
-                sequences = np.zeros((self.batch_size, *encoding.shape))
-                batch_ids = []
-            sequences[i % self.batch_size, :, :] = encoding
-            batch_ids.append(label+(contains_unk,))
-            if contains_unk:
-                warnings.warn(("For region {0}, "
-                               "reference sequence contains unknown "
-                               "base(s). --will be marked `True` in the "
-                               "`contains_unk` column of the .tsv or "
-                               "row_labels .txt file.").format(label))
-
-        sequences = sequences[:i % self.batch_size + 1, :, :]
-        preds = predict(self.model, sequences, use_cuda=self.use_cuda)
-        reporter.handle_batch_predictions(preds, batch_ids)
+        sequences = np.zeros(
+            (self.batch_size, self.sequence_length,
+             len(self.reference_sequence.BASES_ARR)),
+            dtype=np.float32)
+        for i in range(0, len(labels), self.batch_size):
+            batch_labels = labels[i:i + self.batch_size]
+            chroms, starts, ends, strands = zip(
+                *seq_coords[i:i + self.batch_size])
+            batch_sequences, _, n_unknown = \
+                self.reference_sequence.get_encodings_from_coords(
+                    chroms, starts, ends, strands=strands, pad=True,
+                    out=sequences[:len(batch_labels)])
+            batch_ids = []
+            for label, contains_unk in zip(batch_labels, n_unknown > 0):
+                batch_ids.append(label+(contains_unk,))
+                if contains_unk:
+                    warnings.warn(("For region {0}, "
+                                   "reference sequence contains unknown "
+                                   "base(s). --will be marked `True` in the "
+                                   "`contains_unk` column of the .tsv or "
+                                   "row_labels .txt file.").format(label))
+            preds = predict(
+                self.model, batch_sequences, use_cuda=self.use_cuda)
+            reporter.handle_batch_predictions(preds, batch_ids)
         reporter.write_to_file()
 
 
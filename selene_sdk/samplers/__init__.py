@@ -7,6 +7,8 @@ from .online_sampler import OnlineSampler
 from .intervals_sampler import IntervalsSampler
 from .random_positions_sampler import RandomPositionsSampler
 from .multi_sampler import MultiSampler, MultiFileSampler 
+from .prefetch_sampler import PrefetchSampler
+from .h5_exporter import H5Exporter
 from . import file_samplers
 
 __all__ = ["Sampler",
@@ -15,4 +17,6 @@ __all__ = ["Sampler",
            "RandomPositionsSampler",
            "MultiSampler",
            "MultiFileSampler",
+           "PrefetchSampler",
+           "H5Exporter",
            "file_samplers"]
@@ -3,6 +3,7 @@ This module provides the `SamplerDataLoader` and  `SamplerDataset` classes,
 which allow parallel sampling for any Sampler using
 torch DataLoader mechanism.
 """
+import glob
 import  sys
 
 import h5py
@@ -11,6 +12,10 @@ import torch
 
 from functools import wraps
 from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Sampler as IndexSampler
+
+from .sampler import _seed_worker
+from .sampler import _set_worker_partition
 
 
 class _SamplerDataset(Dataset):
@@ -90,7 +95,11 @@ class SamplerDataLoader(DataLoader):
     batch_size : int, optional
         Default to 1. The number of samples the iterator returns in one step.
     seed : int, optional
-        Default to 436. The seed for random number generators.
+        Default to 436. The seed for random number generators. Each worker
+        seeds `numpy.random` and `random` with its own stream spawned
+        from `seed`, so that workers do not draw the same samples and a
+        run is reproducible from `seed` and `num_workers`. Samplers that
+        draw without replacement divide their draws among the workers.
 
     Attributes
     ----------
@@ -109,22 +118,81 @@ class SamplerDataLoader(DataLoader):
                  seed=436):
         def worker_init_fn(worker_id):
             """
-            This function is called to initialize each worker with different
-            numpy seeds (torch seeds are set by DataLoader automatically).
+            This function is called to initialize each worker with
+            independent numpy and random streams (torch seeds are set by
+            DataLoader automatically, from `generator`), and with its
+            share of the draws of samplers with state.
             """
-            np.random.seed(seed + worker_id)
+            _seed_worker(seed, worker_id)
+            _set_worker_partition(worker_id, num_workers)
 
         args = {
             "batch_size": batch_size,
             "num_workers": num_workers,
             "pin_memory": True,
-            "worker_init_fn": worker_init_fn
+            "worker_init_fn": worker_init_fn,
+            "generator": torch.Generator().manual_seed(seed)
         }
 
         super(SamplerDataLoader, self).__init__(_SamplerDataset(sampler), **args)
         self.seed = seed
 
 
+# row `b` holds the 8 bits of the byte `b`, most significant first,
+# as in `numpy.unpackbits`
+_UNPACK_TABLE = np.unpackbits(
+    np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).astype(np.float32)
+
+
+def _unpack_batch(sequence, targets, s_len, t_len):
+    """
+    Unpacks sequences and targets that were packed with `numpy.packbits`
+    along the sequence length and features axes, respectively, directly
+    into `numpy.float32` arrays. Each byte is expanded through a
+    precomputed :math:`256 \\times 8` lookup table. Sequence positions
+    whose bits are all set are unknown bases, and are encoded as
+    :math:`1/N` everywhere.
+
+    Parameters
+    ----------
+    sequence : numpy.ndarray
+        The packed sequence(s), of shape :math:`\\lceil L/8 \\rceil
+        \\times N` or :math:`B \\times \\lceil L/8 \\rceil \\times N`.
+    targets : numpy.ndarray
+        The packed targets, of shape :math:`\\lceil F/8 \\rceil` or
+        :math:`B \\times \\lceil F/8 \\rceil`.
+    s_len : int
+        The sequence length :math:`L`.
+    t_len : int
+        The number of features :math:`F`.
+
+    Returns
+    -------
+    sequence, targets : tuple(numpy.ndarray, numpy.ndarray)
+        The unpacked sequence(s), of shape :math:`L \\times N` or
+        :math:`B \\times L \\times N`, and targets, of shape :math:`F`
+        or :math:`B \\times F`.
+
+    """
+    sequence = np.asarray(sequence, dtype=np.uint8)
+    targets = np.asarray(targets, dtype=np.uint8)
+    n_packed, n_bases = sequence.shape[-2:]
+    # a bit is set in all the bases exactly at the unknown positions
+    nulls = _UNPACK_TABLE[np.bitwise_and.reduce(sequence, axis=-1)]
+    nulls = nulls.reshape(sequence.shape[:-2] + (n_packed * 8,))[..., :s_len]
+
+    unpacked = _UNPACK_TABLE[np.swapaxes(sequence, -1, -2)]
+    unpacked = unpacked.reshape(
+        sequence.shape[:-2] + (n_bases, n_packed * 8))[..., :s_len]
+    sequence = np.ascontiguousarray(np.swapaxes(unpacked, -1, -2))
+    sequence[nulls.astype(bool)] = 1.0 / n_bases
+
+    targets = _UNPACK_TABLE[targets]
+    targets = targets.reshape(
+        targets.shape[:-2] + (targets.shape[-2] * 8,))[..., :t_len]
+    return sequence, np.ascontiguousarray(targets)
+
+
 class _H5Dataset(Dataset):
     """
     This class provides a Dataset that directly loads sequences and targets
@@ -198,20 +266,9 @@ class _H5Dataset(Dataset):
         sequence = self.sequences[index, :, :]
         targets = self.targets[index, :]
         if self.unpackbits:
-            sequence = np.unpackbits(sequence, axis=-2)
-            nulls = np.sum(sequence, axis=-1) == sequence.shape[-1]
-            sequence = sequence.astype(float)
-            sequence[nulls, :] = 1.0 / sequence.shape[-1]
-            targets = np.unpackbits(
-                targets, axis=-1).astype(float)
-            if sequence.ndim == 3:
-                sequence = sequence[:, :self.s_len, :]
-            else:
-                sequence = sequence[:self.s_len, :]
-            if targets.ndim == 2:
-                targets = targets[:, :self.t_len]
-            else:
-                targets = targets[:self.t_len]
+            sequence, targets = _unpack_batch(
+                sequence, targets, self.s_len, self.t_len)
+            return torch.from_numpy(sequence), torch.from_numpy(targets)
         return (torch.from_numpy(sequence.astype(np.float32)),
                 torch.from_numpy(targets.astype(np.float32)))
 
@@ -318,3 +375,256 @@ class H5DataLoader(DataLoader):
                        sequence_key=sequence_key,
                        targets_key=targets_key),
             **args)
+
+
+class _ShardedH5Dataset(Dataset):
+    """
+    This class provides a Dataset that loads sequences and targets from
+    several hdf5 files, as if they were concatenated in the order given.
+    `_ShardedH5Dataset` is intended to be used internally by
+    `ShardedH5DataLoader`.
+
+    Indexing the dataset with a sequence of indices (e.g. a `range`)
+    returns a batch. The indices that fall in each file are read with a
+    single h5py call, which is a contiguous slab if they are
+    consecutive.
+
+    Parameters
+    ----------
+    file_paths : list(str)
+        The file paths of the hdf5 files.
+    in_memory : bool, optional
+        Default is False. If True, load the entire dataset into shared
+        memory, so that worker processes do not copy it.
+    unpackbits : bool, optional
+        Default is False. If True, unpack binary-valued array from uint8
+        sequence and targets array. See `numpy.packbits` for details.
+    sequence_key : str, optional
+        Default is "sequences". Specify the name of the hdf5 dataset that contains
+        sequence data.
+    targets_key : str, optional
+        Default is "targets". Specify the name of the hdf5 dataset that contains
+        target data.
+
+    Attributes
+    ----------
+    file_paths : list(str)
+        The file paths of the hdf5 files.
+    in_memory : bool
+        If True, the entire dataset is loaded into shared memory.
+    unpackbits : bool
+        If True, unpack binary-valued array from uint8
+        sequence and targets array. See `numpy.packbits` for details.
+    """
+    def __init__(self,
+                 file_paths,
+                 in_memory=False,
+                 unpackbits=False,
+                 sequence_key="sequences",
+                 targets_key="targets"):
+        super(_ShardedH5Dataset, self).__init__()
+        self.file_paths = list(file_paths)
+        self.in_memory = in_memory
+        self.unpackbits = unpackbits
+
+        self._initialized = False
+        self._sequence_key = sequence_key
+        self._targets_key = targets_key
+
+        n_samples = []
+        sequences = []
+        targets = []
+        for file_path in self.file_paths:
+            with h5py.File(file_path, 'r') as db:
+                n_samples.append(db[sequence_key].shape[0])
+                if unpackbits:
+                    lengths = (
+                        int(db['{0}_length'.format(sequence_key)][()]),
+                        int(db['{0}_length'.format(targets_key)][()]))
+                    if getattr(self, "_lengths", lengths) != lengths:
+                        raise ValueError(
+                            "The files have different sequence or targets "
+                            "lengths.")
+                    self._lengths = lengths
+                if in_memory:
+                    sequences.append(np.asarray(db[sequence_key]))
+                    targets.append(np.asarray(db[targets_key]))
+        self._offsets = np.concatenate([[0], np.cumsum(n_samples)]).astype(
+            np.int64)
+        if in_memory:
+            # tensors in shared memory are passed to the worker
+            # processes without being copied
+            self._shared_sequences = torch.from_numpy(
+                np.concatenate(sequences)).share_memory_()
+            self._shared_targets = torch.from_numpy(
+                np.concatenate(targets)).share_memory_()
+
+    def init(func):
+        # delay initialization to allow multiprocessing
+        @wraps(func)
+        def dfunc(self, *args, **kwargs):
+            if not self._initialized:
+                if self.in_memory:
+                    self.sequences = self._shared_sequences.numpy()
+                    self.targets = self._shared_targets.numpy()
+                else:
+                    self.dbs = [h5py.File(file_path, 'r')
+                                for file_path in self.file_paths]
+                self._initialized = True
+            return func(self, *args, **kwargs)
+        return dfunc
+
+    def _read(self, indices):
+        """
+        Reads the sequences and targets at the sorted, unique
+        `indices` from the hdf5 files.
+        """
+        sequences = []
+        targets = []
+        file_indices = np.searchsorted(
+            self._offsets, indices, side="right") - 1
+        for file_index in np.unique(file_indices):
+            rows = indices[file_indices == file_index] - \
+                self._offsets[file_index]
+            db = self.dbs[file_index]
+            if rows[-1] - rows[0] + 1 == len(rows):
+                rows = slice(int(rows[0]), int(rows[-1]) + 1)
+            sequences.append(db[self._sequence_key][rows])
+            targets.append(db[self._targets_key][rows])
+        return np.concatenate(sequences), np.concatenate(targets)
+
+    @init
+    def __getitem__(self, index):
+        indices = np.asarray(index, dtype=np.int64) % len(self)
+        if self.in_memory:
+            sequence = self.sequences[indices]
+            targets = self.targets[indices]
+        elif indices.ndim == 0:
+            sequence, targets = self._read(indices.reshape(1))
+            sequence, targets = sequence[0], targets[0]
+        else:
+            # h5py reads indices in increasing order
+            unique_indices, inverse = np.unique(indices, return_inverse=True)
+            sequence, targets = self._read(unique_indices)
+            sequence, targets = sequence[inverse], targets[inverse]
+        if self.unpackbits:
+            sequence, targets = _unpack_batch(
+                sequence, targets, *self._lengths)
+            return torch.from_numpy(sequence), torch.from_numpy(targets)
+        return (torch.from_numpy(sequence.astype(np.float32)),
+                torch.from_numpy(targets.astype(np.float32)))
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+
+class _RangeBatchSampler(IndexSampler):
+    """
+    Yields batches of consecutive dataset indices, as `range` objects,
+    optionally in a random order. `_RangeBatchSampler` is intended to
+    be used internally by `ShardedH5DataLoader`.
+
+    Parameters
+    ----------
+    n_samples : int
+        The number of samples in the dataset.
+    batch_size : int
+        The number of samples in each batch. The last batch may be
+        smaller.
+    shuffle : bool, optional
+        Default is True. If True, the batches are yielded in a new random
+        order in each pass over the dataset.
+    """
+    def __init__(self, n_samples, batch_size, shuffle=True):
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+
+    def __iter__(self):
+        n_batches = len(self)
+        if self.shuffle:
+            order = torch.randperm(n_batches).tolist()
+        else:
+            order = range(n_batches)
+        for batch in order:
+            start = batch * self.batch_size
+            yield range(start, min(start + self.batch_size, self.n_samples))
+
+    def __len__(self):
+        return -(-self.n_samples // self.batch_size)
+
+
+class ShardedH5DataLoader(DataLoader):
+    """
+    ShardedH5DataLoader provides optionally parallel sampling from a
+    dataset split across several HDF5 files, such as the files written
+    by `scripts/sampler_write_to_h5.py` with different seeds. Each file
+    must have the layout described in `H5DataLoader`.
+
+    The samples are read a batch at a time: each batch is a range of
+    consecutive samples, so that it is read from each file with a single
+    h5py call. The order of the batches is shuffled, but the samples
+    within a batch keep their order in the files, which were sampled
+    at random when they were written.
+
+    Unlike `H5DataLoader`, `in_memory` can be used together with
+    `num_workers`: the data are loaded once into shared memory, which
+    the worker processes read without copying.
+
+    Parameters
+    ----------
+    file_paths : list(str) or str
+        The file paths of the hdf5 files, or a glob pattern matching
+        them (e.g. "train_seed=*.h5"), in which case the files are
+        sorted by name.
+    in_memory : bool, optional
+        Default is False. If True, load entire dataset into shared
+        memory.
+    num_workers : int, optional
+        Default is 1. If greater than 1, use multiple processes to parallelize data
+        sampling.
+    batch_size : int, optional
+        Default is 1. Specify the batch size of the DataLoader.
+    shuffle : bool, optional
+        Default is True. If False, load the data in the original order.
+    unpackbits : bool, optional
+        Default is False. If True, unpack binary-valued array from uint8
+        sequence and targets array. See `numpy.packbits` for details.
+    sequence_key : str, optional
+        Default is "sequences". Specify the name of the hdf5 dataset that contains
+        sequence data.
+    targets_key : str, optional
+        Default is "targets". Specify the name of the hdf5 dataset that contains
+        target data.
+
+    Attributes
+    ----------
+    dataset : `_ShardedH5Dataset`
+        The `_ShardedH5Dataset` to load data from.
+
+    """
+    def __init__(self,
+                 file_paths,
+                 in_memory=False,
+                 num_workers=1,
+                 batch_size=1,
+                 shuffle=True,
+                 unpackbits=False,
+                 sequence_key="sequences",
+                 targets_key="targets"):
+        if isinstance(file_paths, str):
+            file_paths = sorted(glob.glob(file_paths))
+        dataset = _ShardedH5Dataset(file_paths,
+                                    in_memory=in_memory,
+                                    unpackbits=unpackbits,
+                                    sequence_key=sequence_key,
+                                    targets_key=targets_key)
+        args = {
+            # the dataset returns whole batches
+            "batch_size": None,
+            "sampler": _RangeBatchSampler(
+                len(dataset), batch_size, shuffle=shuffle),
+            "num_workers": num_workers,
+            "pin_memory": True
+        }
+        super(ShardedH5DataLoader, self).__init__(dataset, **args)
@@ -5,6 +5,58 @@ import numpy as np
 
 from .file_sampler import FileSampler
 
+
+def _parse_bed_lines(lines, targets_avail):
+    """
+    Parses BED lines into columns.
+
+    Parameters
+    ----------
+    lines : list(str)
+        The lines to parse.
+    targets_avail : bool
+        Whether the last column of each line holds the indices of the
+        features of the sample, separated by semicolons.
+
+    Returns
+    -------
+    chroms, starts, ends, target_offsets, target_indices : \
+    tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray, \
+          numpy.ndarray or None, numpy.ndarray or None)
+        The chromosomes, starts and ends of the samples. If
+        `targets_avail`, the feature indices of sample `i` are
+        `target_indices[target_offsets[i]:target_offsets[i + 1]]`.
+
+    """
+    chroms = []
+    starts = []
+    ends = []
+    target_counts = []
+    target_indices = []
+    for line in lines:
+        cols = line.split('\t')
+        chroms.append(cols[0])
+        starts.append(int(cols[1]))
+        ends.append(int(cols[2]))
+        if targets_avail and len(cols) in (4, 5):
+            features = [int(f) for f in cols[-1].strip().split(';') if f]
+            target_counts.append(len(features))
+            target_indices.extend(features)
+        else:
+            target_counts.append(0)
+    if not targets_avail:
+        return (np.array(chroms, dtype=str),
+                np.array(starts, dtype=np.int64),
+                np.array(ends, dtype=np.int64),
+                None,
+                None)
+    return (np.array(chroms, dtype=str),
+            np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64),
+            np.concatenate([[0], np.cumsum(target_counts)]).astype(np.int64),
+            np.array(target_indices, dtype=np.int64))
+
+
 class BedFileSampler(FileSampler):
     """
     A sampler for which the dataset is loaded directly from a `*.bed` file.
@@ -35,6 +87,16 @@ class BedFileSampler(FileSampler):
     n_features : int or None, optional
         Default is None. If `targets_avail` is True, must specify
         `n_features`, the total number of features (classes).
+    in_memory : bool, optional
+        Default is False. If True, the file is parsed once into arrays
+        of coordinates and feature indices, and samples are read from
+        the arrays. Otherwise, lines are read from the file as they are
+        needed.
+    shuffle : bool, optional
+        Default is False. If True, the samples are drawn in a new random
+        order each time the whole file has been drawn. If `in_memory` is
+        False, the byte offset of each line is indexed once, so that
+        lines can be read in any order.
 
     Attributes
     ----------
@@ -70,23 +132,138 @@ class BedFileSampler(FileSampler):
                  n_samples,
                  sequence_length=None,
                  targets_avail=False,
-                 n_features=None):
+                 n_features=None,
+                 in_memory=False,
+                 shuffle=False):
         """
         Constructs a new `BedFileSampler` object.
         """
         super(BedFileSampler, self).__init__()
         self.filepath = filepath
-        self._file_handle = open(self.filepath, 'r')
         self.reference_sequence = reference_sequence
         self.sequence_length = sequence_length
         self.targets_avail = targets_avail
         self.n_features = n_features
         self.n_samples = n_samples
+        self.in_memory = in_memory
+        self.shuffle = shuffle
+
+        self._file_handle = None
+        self._columns = None
+        self._line_offsets = None
+        if in_memory:
+            with open(self.filepath, 'r') as file_handle:
+                self._columns = _parse_bed_lines(
+                    [line for line in file_handle if line.strip()],
+                    targets_avail)
+            n_rows = len(self._columns[0])
+        elif shuffle:
+            # byte offset of each non-empty line, to read the lines in
+            # any order
+            line_offsets = []
+            offset = 0
+            with open(self.filepath, 'rb') as file_handle:
+                for line in file_handle:
+                    if line.strip():
+                        line_offsets.append(offset)
+                    offset += len(line)
+            self._line_offsets = np.array(line_offsets, dtype=np.int64)
+            n_rows = len(line_offsets)
+            self._file_handle = open(self.filepath, 'rb')
+        else:
+            self._file_handle = open(self.filepath, 'r')
+        if in_memory or shuffle:
+            if n_rows == 0:
+                raise ValueError(
+                    "{0} has no samples.".format(self.filepath))
+            self._sample_order = np.arange(n_rows)
+            if shuffle:
+                np.random.shuffle(self._sample_order)
+            self._next_sample = 0
+
+    def _next_row_indices(self, n_rows):
+        """
+        Returns the indices of the next `n_rows` rows, starting a new
+        (shuffled, if `self.shuffle`) pass over the rows at the end of
+        the file.
+        """
+        indices = []
+        while n_rows > 0:
+            if self._next_sample == len(self._sample_order):
+                if self.shuffle:
+                    np.random.shuffle(self._sample_order)
+                self._next_sample = 0
+            # copied, since the order is shuffled in place at the end of
+            # the pass
+            taken = self._sample_order[
+                self._next_sample:self._next_sample + n_rows].copy()
+            self._next_sample += len(taken)
+            n_rows -= len(taken)
+            indices.append(taken)
+        return np.concatenate(indices)
+
+    def _next_rows(self, n_rows):
+        """
+        Reads the next `n_rows` rows, as columns (see
+        `_parse_bed_lines`).
+        """
+        if self._columns is not None:
+            indices = self._next_row_indices(n_rows)
+            chroms, starts, ends, target_offsets, target_indices = \
+                self._columns
+            if not self.targets_avail:
+                return (chroms[indices], starts[indices], ends[indices],
+                        None, None)
+            counts = target_offsets[indices + 1] - target_offsets[indices]
+            row_offsets = np.concatenate([[0], np.cumsum(counts)])
+            # the positions of the feature indices of the selected rows
+            positions = np.repeat(
+                target_offsets[indices] - row_offsets[:-1], counts) + \
+                np.arange(row_offsets[-1])
+            return (chroms[indices], starts[indices], ends[indices],
+                    row_offsets, target_indices[positions])
+
+        lines = []
+        if self._line_offsets is not None:
+            for index in self._next_row_indices(n_rows):
+                self._file_handle.seek(self._line_offsets[index])
+                lines.append(self._file_handle.readline().decode())
+        else:
+            reopened = False
+            while len(lines) < n_rows:
+                line = self._file_handle.readline()
+                if not line:
+                    if reopened:
+                        raise ValueError(
+                            "{0} has no samples.".format(self.filepath))
+                    self._file_handle.close()
+                    self._file_handle = open(self.filepath, 'r')
+                    reopened = True
+                elif line.strip():
+                    lines.append(line)
+                    reopened = False
+        return _parse_bed_lines(lines, self.targets_avail)
+
+    def _resize(self, starts, ends):
+        """
+        Truncates or expands the sample coordinates, around their
+        centers, to `self.sequence_length`.
+        """
+        if not self.sequence_length:
+            return starts, ends
+        diff = self.sequence_length - (ends - starts)
+        # expanded samples are padded by floor(diff / 2) on the left, and
+        # truncated samples keep their central `sequence_length` bases
+        starts = np.where(diff > 0,
+                          starts - diff // 2,
+                          starts + (-diff) // 2)
+        return starts, starts + self.sequence_length
 
     def sample(self, batch_size=1):
         """
         Draws a mini-batch of examples and their corresponding
-        labels.
+        labels. The sequences of a batch are encoded together, and
+        samples whose sequences cannot be retrieved are skipped.
 
         Parameters
         ----------
@@ -108,61 +285,28 @@ class BedFileSampler(FileSampler):
 
         """
         sequences = []
-        targets = None
-        if self.targets_avail:
-            targets = []
-        while len(sequences) < batch_size:
-            line = self._file_handle.readline()
-            if not line:
-                # TODO: add functionality to shuffle the file if sampler
-                # reaches the end of the file.
-                self._file_handle.close()
-                self._file_handle = open(self.filepath, 'r')
-                line = self._file_handle.readline()
-            cols = line.split('\t')
-            chrom = cols[0]
-            start = int(cols[1])
-            end = int(cols[2])
-            strand_side = None
-            features = None
-
-            if len(cols) == 5:
-                strand_side = cols[3]
-                features = cols[4].strip()
-            elif len(cols) == 4 and self.targets_avail:
-                features = cols[3].strip()
-            elif len(cols) == 4:
-                strand_side = cols[3].strip()
-
-            # if strand_side is None, assume strandedness does not matter.
-            # can change this to randomly selecting +/- later
-            strand_side = '+'
-            n = end - start
-            if self.sequence_length and n < self.sequence_length:
-                diff = (self.sequence_length - n) / 2
-                pad_l = int(np.floor(diff))
-                pad_r = int(np.ceil(diff))
-                start = start - pad_l
-                end = end + pad_r
-            elif self.sequence_length and n > self.sequence_length:
-                start = int((n - self.sequence_length) // 2)
-                end = int(start + self.sequence_length)
-
-            sequence = self.reference_sequence.get_encoding_from_coords(
-                chrom, start, end, strand=strand_side)
-            if sequence.shape[0] == 0:
-                continue
-
-            sequences.append(sequence)
+        targets = []
+        n_samples_drawn = 0
+        while n_samples_drawn < batch_size:
+            chroms, starts, ends, target_offsets, target_indices = \
+                self._next_rows(batch_size - n_samples_drawn)
+            starts, ends = self._resize(starts, ends)
+            # strandedness is assumed not to matter
+            encodings, valid, _ = \
+                self.reference_sequence.get_encodings_from_coords(
+                    chroms, starts, ends)
+            sequences.append(encodings[valid])
             if self.targets_avail:
-                tgts = np.zeros((self.n_features))
-                features = [int(f) for f in features.split(';') if f]
-                tgts[features] = 1
-                targets.append(tgts.astype(float))
+                batch_targets = np.zeros((len(chroms), self.n_features))
+                rows = np.repeat(np.arange(len(chroms)),
+                                 np.diff(target_offsets))
+                batch_targets[rows, target_indices] = 1
+                targets.append(batch_targets[valid])
+            n_samples_drawn += int(np.sum(valid))
 
-        sequences = np.array(sequences)
+        sequences = np.concatenate(sequences)
         if self.targets_avail:
-            targets = np.array(targets)
+            targets = np.concatenate(targets)
             return (sequences, targets)
         return sequences,
 
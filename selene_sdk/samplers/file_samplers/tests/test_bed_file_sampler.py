@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from selene_sdk.samplers.file_samplers import BedFileSampler
+from selene_sdk.sequences import Genome
+
+
+class TestBedFileSampler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        genome_path = os.path.join(self.tmp_dir, "genome.fa")
+        sequence = "".join(
+            np.random.RandomState(0).choice(list("ACGT"), 1000))
+        with open(genome_path, 'w') as file_handle:
+            file_handle.write(">1\n{0}\n".format(sequence))
+        self.genome = Genome(genome_path)
+        self.bed_path = os.path.join(self.tmp_dir, "samples.bed")
+        # one sample per 10 bases, with the features i % 3 and, for
+        # every other sample, 3
+        self.rows = [(10 * i, 10 * i + 10,
+                      [i % 3] + ([3] if i % 2 else []))
+                     for i in range(11)]
+        with open(self.bed_path, 'w') as file_handle:
+            for i, (start, end, features) in enumerate(self.rows):
+                file_handle.write("1\t{0}\t{1}\t{2}\n".format(
+                    start, end, ';'.join(str(f) for f in features)))
+                if i == 4:
+                    file_handle.write("\n")
+            file_handle.write("\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_sampler(self, **kwargs):
+        return BedFileSampler(self.bed_path,
+                              self.genome,
+                              len(self.rows),
+                              targets_avail=True,
+                              n_features=4,
+                              **kwargs)
+
+    def _expected_samples(self):
+        samples = []
+        for start, end, features in self.rows:
+            targets = np.zeros(4)
+            targets[features] = 1
+            samples.append(
+                (self.genome.get_encoding_from_coords('1', start, end),
+                 targets))
+        return samples
+
+    def _draw(self, sampler, n_samples, batch_size=3):
+        samples = []
+        while len(samples) < n_samples:
+            sequences, targets = sampler.sample(
+                batch_size=min(batch_size, n_samples - len(samples)))
+            samples.extend(zip(sequences, targets))
+        return samples
+
+    def _sort(self, samples):
+        return sorted(samples, key=lambda sample: (
+            sample[0].argmax(axis=1).tolist(), sample[1].tolist()))
+
+    def _assert_same_samples(self, samples, expected):
+        self.assertEqual(len(samples), len(expected))
+        for (sequence, targets), (expected_sequence, expected_targets) in \
+                zip(samples, expected):
+            np.testing.assert_array_equal(sequence, expected_sequence)
+            np.testing.assert_array_equal(targets, expected_targets)
+
+    def test_sample_reads_rows_in_order(self):
+        expected = self._expected_samples()
+        for in_memory in (False, True):
+            sampler = self._make_sampler(in_memory=in_memory)
+            # the second pass starts again at the first row
+            self._assert_same_samples(
+                self._draw(sampler, 2 * len(expected)), expected * 2)
+
+    def test_shuffled_samples_draw_each_row_once_per_pass(self):
+        expected = self._sort(self._expected_samples())
+        for in_memory in (False, True):
+            np.random.seed(1)
+            sampler = self._make_sampler(in_memory=in_memory, shuffle=True)
+            samples = self._draw(sampler, 2 * len(expected))
+            self._assert_same_samples(
+                self._sort(samples[:len(expected)]), expected)
+            self._assert_same_samples(
+                self._sort(samples[len(expected):]), expected)
+            self.assertFalse(all(
+                np.array_equal(a[0], b[0])
+                for a, b in zip(samples, self._expected_samples())))
+
+    def test_in_memory_and_file_reads_are_the_same(self):
+        for shuffle in (False, True):
+            draws = []
+            for in_memory in (False, True):
+                np.random.seed(1)
+                sampler = self._make_sampler(
+                    in_memory=in_memory, shuffle=shuffle)
+                draws.append(self._draw(sampler, 15, batch_size=4))
+            self._assert_same_samples(draws[0], draws[1])
+
+    def test_get_data_and_targets(self):
+        sampler = self._make_sampler(in_memory=True)
+        batches, targets = sampler.get_data_and_targets(4)
+        self.assertEqual([len(s) for (s, _) in batches], [4, 4, 3])
+        expected = self._expected_samples()
+        np.testing.assert_array_equal(
+            targets, np.array([t for (_, t) in expected]))
+
+    def test_resize(self):
+        with open(self.bed_path, 'w') as file_handle:
+            file_handle.write("1\t100\t120\t0\n1\t200\t205\t1\n")
+        for in_memory in (False, True):
+            sampler = self._make_sampler(
+                in_memory=in_memory, sequence_length=10)
+            sequences, _ = sampler.sample(batch_size=2)
+            # a longer sample keeps its central bases, and a shorter one
+            # is padded by floor(diff / 2) bases on the left
+            np.testing.assert_array_equal(
+                sequences[0],
+                self.genome.get_encoding_from_coords('1', 105, 115))
+            np.testing.assert_array_equal(
+                sequences[1],
+                self.genome.get_encoding_from_coords('1', 198, 208))
+
+    def test_empty_file_raises(self):
+        with open(self.bed_path, 'w') as file_handle:
+            file_handle.write("\n")
+        with self.assertRaises(ValueError):
+            self._make_sampler().sample(batch_size=1)
+        for in_memory, shuffle in ((True, False), (False, True)):
+            with self.assertRaises(ValueError):
+                self._make_sampler(in_memory=in_memory, shuffle=shuffle)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+import scipy.io
+
+from selene_sdk.samplers.file_samplers import MatFileSampler
+
+
+class TestMatFileSampler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        random_state = np.random.RandomState(0)
+        # 10 samples of length 5, with 3 features
+        self.sequences = np.eye(4)[random_state.randint(4, size=(10, 5))]
+        self.targets = random_state.randint(2, size=(10, 3))
+        # the default layout: batch, alphabet, length
+        self.mat_path = os.path.join(self.tmp_dir, "samples.mat")
+        scipy.io.savemat(self.mat_path, {
+            "x": self.sequences.transpose(0, 2, 1).astype(np.uint8),
+            "y": self.targets.astype(np.uint8)})
+        # alphabet, length, batch, and features, batch
+        self.h5_path = os.path.join(self.tmp_dir, "samples.h5")
+        with h5py.File(self.h5_path, 'w') as fh:
+            fh.create_dataset(
+                "x", data=self.sequences.transpose(2, 1, 0).astype(np.uint8))
+            fh.create_dataset("y", data=self.targets.T.astype(np.uint8))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_samplers(self, **kwargs):
+        return [MatFileSampler(self.mat_path, "x", targets_key="y",
+                               **kwargs),
+                MatFileSampler(self.h5_path, "x", targets_key="y",
+                               sequence_batch_axis=2,
+                               sequence_alphabet_axis=0,
+                               targets_batch_axis=1,
+                               **kwargs)]
+
+    def _draw(self, sampler, n_samples, batch_size=4):
+        sequences = []
+        targets = []
+        while n_samples > 0:
+            batch_sequences, batch_targets = sampler.sample(
+                batch_size=min(batch_size, n_samples))
+            sequences.append(batch_sequences)
+            targets.append(batch_targets)
+            n_samples -= len(batch_sequences)
+        return np.concatenate(sequences), np.concatenate(targets)
+
+    def _sort(self, sequences, targets):
+        keys = [(s.argmax(axis=1).tolist(), t.tolist())
+                for s, t in zip(sequences, targets)]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return sequences[order], targets[order]
+
+    def test_sample_in_order(self):
+        # the batches of 5 samples span the chunks, and the last chunk
+        # of 3 or 4 samples is a partial chunk
+        for chunk_size in (None, 3, 4):
+            for sampler in self._make_samplers(
+                    shuffle=False, chunk_size=chunk_size):
+                sequences, targets = self._draw(sampler, 20, batch_size=5)
+                np.testing.assert_array_equal(
+                    sequences, np.concatenate([self.sequences] * 2))
+                np.testing.assert_array_equal(
+                    targets, np.concatenate([self.targets] * 2))
+
+    def test_shuffled_samples_draw_each_sample_once_per_pass(self):
+        expected = self._sort(self.sequences, self.targets)
+        for chunk_size in (None, 3, 4):
+            for sampler in self._make_samplers(
+                    shuffle=True, chunk_size=chunk_size):
+                sequences, targets = self._draw(sampler, 10)
+                self.assertFalse(np.array_equal(sequences, self.sequences))
+                for actual, expected_data in zip(
+                        self._sort(sequences, targets), expected):
+                    np.testing.assert_array_equal(actual, expected_data)
+
+    def test_dtype(self):
+        for chunk_size in (None, 3):
+            for dtype in (float, np.float32):
+                for sampler in self._make_samplers(
+                        chunk_size=chunk_size, dtype=dtype):
+                    sequences, targets = sampler.sample(batch_size=2)
+                    self.assertEqual(sequences.shape, (2, 5, 4))
+                    self.assertEqual(targets.shape, (2, 3))
+                    self.assertEqual(sequences.dtype, np.dtype(dtype))
+                    self.assertEqual(targets.dtype, np.dtype(dtype))
+
+    def test_get_data_and_targets(self):
+        for sampler in self._make_samplers(shuffle=False, chunk_size=3):
+            batches, targets = sampler.get_data_and_targets(4)
+            self.assertEqual([len(s) for (s, _) in batches], [4, 4, 2])
+            np.testing.assert_array_equal(
+                np.concatenate([s for (s, _) in batches]), self.sequences)
+            np.testing.assert_array_equal(targets, self.targets)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,342 @@
+"""
+This module provides the `H5Exporter` class, which samples a dataset
+from an online sampler in parallel and writes it to an HDF5 file that
+can be read with `H5DataLoader` or `ShardedH5DataLoader`.
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+
+import h5py
+import numpy as np
+
+from ..utils import initialize_logger
+from ..version import __version__
+from .sampler import _get_worker_partition
+from .sampler import _seed_worker
+from .sampler import _set_worker_partition
+
+logger = logging.getLogger("selene")
+
+
+def _sample_block(sampler, block):
+    """
+    Draws a block of samples from `sampler`, with the random number
+    generators seeded for the block, and formats it for storage.
+
+    Parameters
+    ----------
+    sampler : selene_sdk.samplers.OnlineSampler
+        The sampler to draw the samples from.
+    block : tuple(str, int, int, bool, int, int, int)
+        The mode, batch size, number of samples, whether to pack the
+        samples with `numpy.packbits`, seed, index of the block and
+        number of blocks.
+
+    Returns
+    -------
+    block_id, sequences, targets, sequence_length, n_features : \
+            tuple(int, numpy.ndarray, numpy.ndarray, int, int)
+        The index of the block, the sequences and targets to store, and
+        the sequence length and number of features before packing.
+
+    """
+    mode, batch_size, n_samples, packbits, seed, block_id, n_blocks = block
+    # the samples of a block depend only on the seed and the block
+    # index, so they do not depend on the number of workers or on
+    # which blocks were written before an export was interrupted.
+    # Samplers that draw without replacement divide their draws among
+    # the blocks.
+    _seed_worker(seed, block_id)
+    _set_worker_partition(block_id, n_blocks)
+    sequences = None
+    targets = None
+    for start in range(0, n_samples, batch_size):
+        batch_sequences, batch_targets = sampler.sample(
+            batch_size=batch_size, mode=mode)
+        if sequences is None:
+            sequences = np.empty((n_samples,) + batch_sequences.shape[1:],
+                                 dtype=batch_sequences.dtype)
+            targets = np.empty((n_samples,) + batch_targets.shape[1:],
+                               dtype=batch_targets.dtype)
+        # the batches are copied, since a sampler with `output_buffers`
+        # overwrites them in later calls to `sample`
+        end = min(start + batch_size, n_samples)
+        sequences[start:end] = batch_sequences[:end - start]
+        targets[start:end] = batch_targets[:end - start]
+    sequence_length = sequences.shape[1]
+    n_features = targets.shape[1]
+    if packbits:
+        sequences = np.packbits(sequences > 0, axis=1)
+        targets = np.packbits(targets > 0, axis=1)
+    else:
+        sequences = sequences.astype(np.float32, copy=False)
+        targets = targets.astype(np.uint8)
+    return block_id, sequences, targets, sequence_length, n_features
+
+
+# the sampler of an export worker process, set by `_init_export_worker`
+_export_sampler = None
+
+
+def _init_export_worker(pickled_sampler):
+    global _export_sampler
+    _export_sampler = pickle.loads(pickled_sampler)
+
+
+def _sample_export_block(block):
+    return _sample_block(_export_sampler, block)
+
+
+class H5Exporter(object):
+    """
+    Samples a dataset from an online sampler and writes it to an HDF5
+    file, in the layout read by `H5DataLoader` and
+    `ShardedH5DataLoader`: the datasets "sequences" and "targets",
+    and the scalars "sequences_length" and "targets_length".
+
+    The samples are drawn in blocks of `batches_per_block` batches by
+    `num_workers` processes, each with its own copy of the sampler, and
+    are written by a single writer into chunked, optionally compressed,
+    datasets. The blocks are drawn from copies of the sampler made when
+    the export starts, with the random number generators seeded for
+    each block from `seed`, and samplers that draw without replacement
+    (e.g. `IntervalsSampler` with `without_replacement`) divide their
+    draws among the blocks as among workers. The file written therefore
+    does not depend on `num_workers`, for samplers whose draws only
+    depend on these.
+
+    The blocks written are recorded in the file, so that an interrupted
+    export can be resumed by running it again with the same parameters:
+    only the blocks that are missing are sampled. The export parameters,
+    the sampler configuration and the Selene version are saved as
+    attributes of the file.
+
+    Parameters
+    ----------
+    data_sampler : selene_sdk.samplers.OnlineSampler
+        The sampler to draw the samples from.
+    output_dir : str
+        The output directory. The file is named
+        "<mode>_seed=<seed>_N=<n_samples>.h5".
+    mode : str
+        The mode to sample in. Must be one of the sampler's modes.
+    n_samples : int
+        The number of samples to write.
+    batch_size : int, optional
+        Default is 64. The size of the batches drawn from the sampler,
+        which is also the number of samples in each chunk of the HDF5
+        datasets.
+    num_workers : int, optional
+        Default is 1. The number of processes that draw the samples.
+        If 1, the samples are drawn in the current process.
+    seed : int, optional
+        Default is 123. The random seed from which the seed of each
+        block is derived.
+    packbits : bool, optional
+        Default is False. If True, the sequences and targets are stored
+        as bits, with `numpy.packbits`. Read them with `unpackbits=True`.
+    compression : str or None, optional
+        Default is None. The compression filter of the HDF5 datasets,
+        e.g. "gzip" or "lzf".
+    batches_per_block : int, optional
+        Default is 16. The number of batches in a block, the unit of
+        work of a worker and of the progress saved.
+
+    Attributes
+    ----------
+    sampler : selene_sdk.samplers.OnlineSampler
+        The sampler to draw the samples from.
+    output_path : str
+        The path to the HDF5 file.
+    mode : str
+        The mode to sample in.
+    n_samples : int
+        The number of samples to write.
+    batch_size : int
+        The size of the batches drawn from the sampler.
+    num_workers : int
+        The number of processes that draw the samples.
+    seed : int
+        The random seed from which the seed of each block is derived.
+    n_blocks : int
+        The number of blocks in the export.
+
+    Notes
+    -----
+    By default, `selene_sdk.utils.parse_configs_and_run` writes to a new
+    subdirectory of `output_dir` each time it is run. Set
+    `create_subdirectory: False` in the configuration file to resume an
+    export from the command line.
+
+    If `num_workers` is 1, the blocks are drawn in the current process,
+    and its `numpy.random` and `random` generators are reseeded for
+    each block.
+
+    """
+
+    def __init__(self,
+                 data_sampler,
+                 output_dir,
+                 mode,
+                 n_samples,
+                 batch_size=64,
+                 num_workers=1,
+                 seed=123,
+                 packbits=False,
+                 compression=None,
+                 batches_per_block=16):
+        """
+        Constructs a new `H5Exporter` object.
+        """
+        self.sampler = data_sampler
+        self.mode = mode
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.seed = seed
+
+        self._packbits = packbits
+        self._compression = compression
+        self._batches_per_block = batches_per_block
+        self._block_size = batch_size * batches_per_block
+        self.n_blocks = -(-n_samples // self._block_size)
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_path = os.path.join(
+            output_dir, "{0}_seed={1}_N={2}.h5".format(mode, seed, n_samples))
+
+        initialize_logger(
+            os.path.join(output_dir, "{0}.log".format(__name__)),
+            verbosity=2)
+
+    def _provenance(self):
+        """
+        Returns the attributes that identify the export.
+        """
+        sampler_config = getattr(self.sampler, "yaml_src", None)
+        if not sampler_config:
+            sampler_config = "{0}.{1}".format(
+                type(self.sampler).__module__, type(self.sampler).__name__)
+        return {"mode": self.mode,
+                "n_samples": self.n_samples,
+                "batch_size": self.batch_size,
+                "batches_per_block": self._batches_per_block,
+                "seed": self.seed,
+                "packbits": self._packbits,
+                "sampler_config": sampler_config}
+
+    def _prepare_file(self, fh):
+        """
+        Saves the provenance of a new export to `fh`, or checks that an
+        export already in `fh` has the same provenance.
+        """
+        provenance = self._provenance()
+        if "completed_blocks" not in fh:
+            if "sequences" in fh:
+                raise ValueError(
+                    "{0} already contains a dataset that was not written "
+                    "by `H5Exporter`.".format(self.output_path))
+            fh.attrs.update(provenance)
+            fh.attrs["selene_version"] = __version__
+            fh.create_dataset("completed_blocks", (self.n_blocks,), dtype=bool)
+            return
+        for key, value in provenance.items():
+            if key not in fh.attrs or fh.attrs[key] != value:
+                raise ValueError(
+                    "{0} was written with a different {1}. Remove it to "
+                    "start a new export.".format(self.output_path, key))
+
+    def _write_block(self, fh, result):
+        """
+        Writes a block sampled by `_sample_block` to `fh`, and records
+        that it was written.
+        """
+        block_id, sequences, targets, sequence_length, n_features = result
+        if "sequences" not in fh:
+            fh.create_dataset("sequences_length", data=sequence_length)
+            fh.create_dataset("targets_length", data=n_features)
+            for key, data in (("sequences", sequences),
+                              ("targets", targets)):
+                fh.create_dataset(
+                    key,
+                    (self.n_samples,) + data.shape[1:],
+                    dtype=data.dtype,
+                    chunks=(min(self.batch_size, self.n_samples),) +
+                    data.shape[1:],
+                    compression=self._compression)
+        start = block_id * self._block_size
+        fh["sequences"][start:start + len(sequences)] = sequences
+        fh["targets"][start:start + len(targets)] = targets
+        # the block is only marked as written once its data are on disk
+        fh.flush()
+        fh["completed_blocks"][block_id] = True
+        fh.flush()
+
+    def export(self):
+        """
+        Samples the blocks that have not been written yet and writes
+        them to `self.output_path`.
+
+        Returns
+        -------
+        str
+            The path to the HDF5 file.
+
+        """
+        with h5py.File(self.output_path, "a") as fh:
+            self._prepare_file(fh)
+            pending = np.flatnonzero(~fh["completed_blocks"][()])
+            if len(pending) < self.n_blocks:
+                logger.info("Resuming the export to {0}: {1} of {2} blocks "
+                            "were already written.".format(
+                                self.output_path,
+                                self.n_blocks - len(pending),
+                                self.n_blocks))
+            blocks = [(self.mode,
+                       self.batch_size,
+                       min(self._block_size,
+                           self.n_samples - int(block_id) * self._block_size),
+                       self._packbits,
+                       self.seed,
+                       int(block_id),
+                       self.n_blocks) for block_id in pending]
+            report_every = max(1, len(blocks) // 20)
+            if self.num_workers <= 1:
+                # the blocks are drawn from a copy of the sampler, as in
+                # a worker, so that they do not depend on its state
+                sampler = pickle.loads(pickle.dumps(self.sampler))
+                worker_partition = _get_worker_partition()
+                try:
+                    results = (_sample_block(sampler, block)
+                               for block in blocks)
+                    self._write_blocks(
+                        fh, results, len(blocks), report_every)
+                finally:
+                    _set_worker_partition(*worker_partition)
+            else:
+                # the sampler is pickled even where processes are forked,
+                # so that each worker opens its own file handles
+                with multiprocessing.Pool(
+                        self.num_workers,
+                        initializer=_init_export_worker,
+                        initargs=(pickle.dumps(self.sampler),)) as pool:
+                    self._write_blocks(
+                        fh,
+                        pool.imap_unordered(_sample_export_block, blocks),
+                        len(blocks),
+                        report_every)
+        logger.info("Wrote {0} {1} samples to {2}.".format(
+            self.n_samples, self.mode, self.output_path))
+        return self.output_path
+
+    def _write_blocks(self, fh, results, n_blocks, report_every):
+        """
+        Writes the blocks in `results` to `fh` as they are sampled.
+        """
+        for index, result in enumerate(results, start=1):
+            self._write_block(fh, result)
+            if index % report_every == 0 or index == n_blocks:
+                logger.info("Wrote {0} of {1} blocks to {2}.".format(
+                    index, n_blocks, self.output_path))
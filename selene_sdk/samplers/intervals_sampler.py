@@ -9,7 +9,12 @@ import random
 import numpy as np
 
 from .online_sampler import OnlineSampler
+from .online_sampler import _describe_file
+from .random_positions_sampler import _MAX_UNKNOWN_FRACTION
+from .sampler import _get_worker_partition
+from ..utils import EpochPermutation
 from ..utils import get_indices_and_probabilities
+from ..utils import WeightedIndices
 
 logger = logging.getLogger(__name__)
 
@@ -92,6 +97,48 @@ class IntervalsSampler(OnlineSampler):
         a non-empty list, `output_dir` must be specified. If
         the path in `output_dir` does not exist it will be created
         automatically.
+    target_in_memory : bool, optional
+        Default is False. If True, the features in `target_path` are
+        loaded into a `selene_sdk.targets.InMemoryGenomicFeatures`
+        object instead of being queried from the tabix index, which
+        makes retrieving the targets of a batch much faster.
+    compress_saved_datasets : bool, optional
+        Default is False. If True, the datasets in `save_datasets` are
+        saved gzip-compressed, to `<mode>_data.bed.gz` files.
+    output_buffers : int, optional
+        Default is 0. If greater than 0, batches are written into a ring
+        of `output_buffers` preallocated float32 arrays. See
+        `selene_sdk.samplers.OnlineSampler`.
+    dataset_workers : int, optional
+        Default is 1. If greater than 1, the samples of
+        `get_data_and_targets` (e.g. the validation and test sets) are
+        drawn in this many worker processes. See
+        `selene_sdk.samplers.OnlineSampler`.
+    dataset_cache_dir : str or None, optional
+        Default is None. If not None, the datasets returned by
+        `get_data_and_targets` are saved to and reloaded from this
+        directory. See `selene_sdk.samplers.OnlineSampler`.
+    precompute_targets : bool, optional
+        Default is False. If True, the targets of every position in the
+        intervals are computed once, before the first sample is drawn,
+        and stored bit-packed as segments of positions with the same
+        targets. Retrieving the targets of a sample is then an array
+        lookup, and if `sample_negative` is False, the positions without
+        any positive label are never drawn instead of being drawn and
+        rejected.
+    without_replacement : bool, optional
+        Default is False. If True, positions are drawn without
+        replacement: in each epoch, every position of the intervals of a
+        mode (or, if `precompute_targets` is True, of the segments that
+        can be drawn) is drawn once, in a shuffled order, so intervals
+        are covered in proportion to their length. See
+        `selene_sdk.utils.EpochPermutation`. Positions that are rejected
+        (e.g. because too many bases are unknown) are skipped for the
+        rest of the epoch. The order of each epoch is drawn from `seed`,
+        and copies of the sampler in worker processes (see
+        `SamplerDataLoader` and `PrefetchSampler`) each draw their own
+        share of it, so that the workers together cover every position
+        once per epoch.
 
     Attributes
     ----------
@@ -146,7 +193,14 @@ class IntervalsSampler(OnlineSampler):
                  feature_thresholds=0.5,
                  mode="train",
                  save_datasets=["test"],
-                 output_dir=None):
+                 output_dir=None,
+                 target_in_memory=False,
+                 compress_saved_datasets=False,
+                 output_buffers=0,
+                 dataset_workers=1,
+                 dataset_cache_dir=None,
+                 precompute_targets=False,
+                 without_replacement=False):
         """
         Constructs a new `IntervalsSampler` object.
         """
@@ -162,13 +216,17 @@ class IntervalsSampler(OnlineSampler):
             feature_thresholds=feature_thresholds,
             mode=mode,
             save_datasets=save_datasets,
-            output_dir=output_dir)
+            output_dir=output_dir,
+            target_in_memory=target_in_memory,
+            compress_saved_datasets=compress_saved_datasets,
+            output_buffers=output_buffers,
+            dataset_workers=dataset_workers,
+            dataset_cache_dir=dataset_cache_dir)
 
         self._sample_from_mode = {}
-        self._randcache = {}
+        self._weighted_indices = {}
         for mode in self.modes:
             self._sample_from_mode[mode] = None
-            self._randcache[mode] = {"cache_indices": None, "sample_next": 0}
 
         self.sample_from_intervals = []
         self.interval_lengths = []
@@ -179,9 +237,22 @@ class IntervalsSampler(OnlineSampler):
             self._partition_dataset_proportion(intervals_path)
 
         for mode in self.modes:
-            self._update_randcache(mode=mode)
+            self._weighted_indices[mode] = WeightedIndices(
+                *self._sample_from_mode[mode])
+        self._interval_starts = np.array(
+            [start for (_, start, _) in self.sample_from_intervals])
+        self._interval_lengths = np.array(self.interval_lengths)
 
         self.sample_negative = sample_negative
+        self.precompute_targets = precompute_targets
+        self._segment_weighted_indices = None
+        self.without_replacement = without_replacement
+        self._dataset_config.update(
+            intervals=_describe_file(intervals_path),
+            sample_negative=sample_negative,
+            without_replacement=without_replacement)
+        self._epoch_positions = {}
+        self._drawable_modes = set()
 
     def _partition_dataset_proportion(self, intervals_path):
         """
@@ -283,7 +354,125 @@ class IntervalsSampler(OnlineSampler):
                 self._sample_from_mode[mode]._replace(
                     indices=indices, weights=weights)
 
-    def _retrieve(self, chrom, position):
+    def _init_target_segments(self):
+        """
+        Computes the targets of every position in the intervals, as
+        segments of positions with the same targets, and the weights to
+        draw positions uniformly from the segments of each mode.
+        """
+        segment_intervals = []
+        segment_starts = []
+        segment_ends = []
+        segment_targets = []
+        for index, (chrom, start, end) in enumerate(
+                self.sample_from_intervals):
+            starts, ends, packed_targets = \
+                self.target.get_feature_data_segments(
+                    chrom, start, end, self._start_radius, self._end_radius)
+            segment_intervals.append(np.full(len(starts), index))
+            segment_starts.append(starts)
+            segment_ends.append(ends)
+            segment_targets.append(packed_targets)
+        self._segment_intervals = np.concatenate(segment_intervals)
+        self._segment_starts = np.concatenate(segment_starts)
+        self._segment_lengths = np.concatenate(segment_ends) - \
+            self._segment_starts
+        self._segment_targets = np.concatenate(segment_targets)
+
+        drawable = self._segment_lengths > 0
+        if not self.sample_negative:
+            drawable &= np.any(self._segment_targets, axis=1)
+        self._segment_weighted_indices = {}
+        for mode in self.modes:
+            segments = np.nonzero(drawable & np.isin(
+                self._segment_intervals,
+                self._sample_from_mode[mode].indices))[0]
+            lengths = self._segment_lengths[segments]
+            self._segment_weighted_indices[mode] = WeightedIndices(
+                segments, lengths / max(np.sum(lengths), 1))
+
+    def _draw_from_segments(self, n_draws, mode):
+        """
+        Draws `n_draws` positions uniformly from the segments of `mode`,
+        and looks up their targets.
+        """
+        if self.without_replacement:
+            segments, positions = self._draw_without_replacement(
+                n_draws, mode)
+        else:
+            segments = self._segment_weighted_indices[mode].draw(n_draws)
+            positions = (
+                self._segment_starts[segments] +
+                np.random.random_sample(n_draws) *
+                self._segment_lengths[segments]).astype(np.int64)
+        targets = np.unpackbits(
+            self._segment_targets[segments], axis=1,
+            count=self.n_features).astype(float)
+        return self._segment_intervals[segments], positions, targets
+
+    def _init_epoch_positions(self, mode):
+        """
+        Lays out the positions that can be drawn in `mode` end to end,
+        so that positions are drawn by index from an `EpochPermutation`.
+        """
+        if self._segment_weighted_indices is not None:
+            units = self._segment_weighted_indices[mode].indices
+            starts = self._segment_starts[units]
+            lengths = self._segment_lengths[units]
+        else:
+            units = self._weighted_indices[mode].indices
+            starts = self._interval_starts[units]
+            lengths = self._interval_lengths[units]
+        unit_offsets = np.cumsum(lengths) - lengths
+        # the order does not depend on the state of `numpy.random`, so
+        # that it is the same in every worker
+        permutation = EpochPermutation(
+            np.sum(lengths), seed=[self.seed, self.modes.index(mode)])
+        self._epoch_positions[mode] = (
+            units, starts, unit_offsets, permutation)
+
+    def _draw_without_replacement(self, n_draws, mode):
+        """
+        Draws the next `n_draws` positions of the current epoch of
+        `mode`. Returns the indices of the intervals (or segments, if
+        the targets are precomputed) that the positions are in, and the
+        positions.
+        """
+        if mode not in self._epoch_positions:
+            self._init_epoch_positions(mode)
+        units, starts, unit_offsets, permutation = \
+            self._epoch_positions[mode]
+        if permutation.partition != _get_worker_partition():
+            permutation.set_partition(*_get_worker_partition())
+        draws = permutation.draw(n_draws)
+        unit_draws = unit_offsets.searchsorted(draws, side="right") - 1
+        positions = starts[unit_draws] + draws - unit_offsets[unit_draws]
+        return units[unit_draws], positions
+
+    def get_epoch(self, mode=None):
+        """
+        Returns the number of epochs completed in a mode, if positions
+        are drawn without replacement.
+
+        Parameters
+        ----------
+        mode : str, optional
+            Default is None. The mode to return the epoch of. If None,
+            will use the current mode `self.mode`.
+
+        Returns
+        -------
+        int
+            The number of times that all the positions of `mode` have
+            been drawn.
+
+        """
+        mode = mode if mode else self.mode
+        if mode not in self._epoch_positions:
+            return 0
+        return self._epoch_positions[mode][-1].epoch
+
+    def _retrieve(self, chrom, position, retrieved_targets=None):
         """
         Retrieves samples around a position in the `reference_sequence`.
 
@@ -294,6 +483,9 @@ class IntervalsSampler(OnlineSampler):
         position : int
             The position in the query region that we will search around
             for samples.
+        retrieved_targets : numpy.ndarray or None, optional
+            Default is None. The targets of the sample, if they are
+            already known. Otherwise they are queried from `self.target`.
 
         Returns
         -------
@@ -305,10 +497,11 @@ class IntervalsSampler(OnlineSampler):
             standards.
 
         """
-        bin_start = position - self._start_radius
-        bin_end = position + self._end_radius
-        retrieved_targets = self.target.get_feature_data(
-            chrom, bin_start, bin_end)
+        if retrieved_targets is None:
+            retrieved_targets = self.target.get_feature_data(
+                chrom,
+                position - self._start_radius,
+                position + self._end_radius)
         if not self.sample_negative and np.sum(retrieved_targets) == 0:
             logger.info("No features found in region surrounding "
                         "region \"{0}\" position {1}. Sampling again.".format(
@@ -326,7 +519,9 @@ class IntervalsSampler(OnlineSampler):
                         "{1} could not be retrieved. Sampling again.".format(
                             chrom, position))
             return None
-        elif np.sum(retrieved_seq) / float(retrieved_seq.shape[0]) < 0.60:
+        # unknown bases are encoded as 1/N in every base
+        n_unknown = np.count_nonzero(retrieved_seq.max(axis=1) < 1)
+        if n_unknown / retrieved_seq.shape[0] > _MAX_UNKNOWN_FRACTION:
             logger.info("Over 30% of the bases in the sequence centered "
                         "at region \"{0}\" position {1} are ambiguous ('N'). "
                         "Sampling again.".format(chrom, position))
@@ -345,28 +540,32 @@ class IntervalsSampler(OnlineSampler):
                 self.save_dataset_to_file(self.mode)
         return (retrieved_seq, retrieved_targets)
 
-    def _update_randcache(self, mode=None):
+    def _check_can_draw(self, mode):
         """
-        Updates the cache of indices of intervals. This allows us
-        to randomly sample from our data without having to use a
-        fixed-point approach or keeping all labels in memory.
-
-        Parameters
-        ----------
-        mode : str or None, optional
-            Default is `None`. The mode that these samples should be
-            used for. See `selene_sdk.samplers.IntervalsSampler.modes` for
-            more information.
-
+        Raises a ValueError if no sample can be drawn in `mode`, because
+        it has no intervals or, when negative samples are not drawn, no
+        feature overlaps the windows of its intervals. `sample` would
+        otherwise draw again forever.
         """
-        if not mode:
-            mode = self.mode
-        self._randcache[mode]["cache_indices"] = np.random.choice(
-            self._sample_from_mode[mode].indices,
-            size=len(self._sample_from_mode[mode].indices),
-            replace=True,
-            p=self._sample_from_mode[mode].weights)
-        self._randcache[mode]["sample_next"] = 0
+        if mode in self._drawable_modes:
+            return
+        interval_indices = self._weighted_indices[mode].indices
+        if len(interval_indices) == 0:
+            raise ValueError(
+                "There are no intervals to sample from in mode "
+                "'{0}'.".format(mode))
+        if not self.sample_negative and not any(
+                len(self.target.get_feature_rows(
+                    chrom,
+                    start - self._start_radius,
+                    end + self._end_radius)[0])
+                for (chrom, start, end) in (
+                    self.sample_from_intervals[index]
+                    for index in interval_indices)):
+            raise ValueError(
+                "No features overlap the intervals to sample from in mode "
+                "'{0}', and `sample_negative` is False.".format(mode))
+        self._drawable_modes.add(mode)
 
     def sample(self, batch_size=1, mode=None):
         """
@@ -394,33 +593,46 @@ class IntervalsSampler(OnlineSampler):
             The shape of `targets` will be :math:`B \\times F`,
             where :math:`F` is the number of features.
 
+        Raises
+        ------
+        ValueError
+            If no sample can be drawn in `mode`: it has no intervals or,
+            if `sample_negative` is False, no feature overlaps them.
+
         """
         mode = mode if mode else self.mode
-        sequences = np.zeros((batch_size, self.sequence_length, 4))
-        targets = np.zeros((batch_size, self.n_features))
+        self._check_can_draw(mode)
+        sequences, targets = self._get_output_arrays(batch_size)
         n_samples_drawn = 0
+        if self.precompute_targets and self._segment_weighted_indices is None:
+            self._init_target_segments()
         while n_samples_drawn < batch_size:
-            sample_index = self._randcache[mode]["sample_next"]
-            if sample_index == len(self._sample_from_mode[mode].indices):
-                self._update_randcache()
-                sample_index = 0
-
-            rand_interval_index = \
-                self._randcache[mode]["cache_indices"][sample_index]
-            self._randcache[mode]["sample_next"] += 1
-
-            interval_info = self.sample_from_intervals[rand_interval_index]
-            interval_length = self.interval_lengths[rand_interval_index]
-
-            chrom = interval_info[0]
-            position = int(
-                interval_info[1] + random.uniform(0, 1) * interval_length)
-
-            retrieve_output = self._retrieve(chrom, position)
-            if not retrieve_output:
-                continue
-            seq, seq_targets = retrieve_output
-            sequences[n_samples_drawn, :, :] = seq
-            targets[n_samples_drawn, :] = seq_targets
-            n_samples_drawn += 1
+            n_draws = batch_size - n_samples_drawn
+            if self._segment_weighted_indices is not None:
+                interval_indices, positions, drawn_targets = \
+                    self._draw_from_segments(n_draws, mode)
+            elif self.without_replacement:
+                interval_indices, positions = \
+                    self._draw_without_replacement(n_draws, mode)
+                drawn_targets = [None] * n_draws
+            else:
+                # intervals are chosen with a probability proportional
+                # to their length, and positions uniformly within them
+                interval_indices = self._weighted_indices[mode].draw(n_draws)
+                positions = (
+                    self._interval_starts[interval_indices] +
+                    np.random.random_sample(n_draws) *
+                    self._interval_lengths[interval_indices]).astype(np.int64)
+                drawn_targets = [None] * n_draws
+            for interval_index, position, seq_targets in zip(
+                    interval_indices, positions, drawn_targets):
+                chrom = self.sample_from_intervals[interval_index][0]
+                retrieve_output = self._retrieve(
+                    chrom, int(position), retrieved_targets=seq_targets)
+                if not retrieve_output:
+                    continue
+                seq, seq_targets = retrieve_output
+                sequences[n_samples_drawn, :, :] = seq
+                targets[n_samples_drawn, :] = seq_targets
+                n_samples_drawn += 1
         return (sequences, targets)
@@ -5,13 +5,206 @@ Objects of the class `OnlineSampler`, are samplers which load examples
 
 """
 from abc import ABCMeta
+import atexit
+import gzip
+import json
+import multiprocessing
 import os
+import pickle
+import queue
 import random
+import threading
 
 import numpy as np
 
 from .sampler import Sampler
+from .sampler import _seed_worker
 from ..targets import GenomicFeatures
+from ..targets import InMemoryGenomicFeatures
+
+
+class _DatasetWriter(object):
+    """
+    Writes the rows of a saved dataset to a file on a background
+    thread, so that saving samples does not stall sampling. Rows are
+    handed over in chunks through a bounded queue, and each chunk is
+    formatted and written at once.
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the output file. If it ends with `.gz`, the output
+        is gzip-compressed.
+    queue_size : int, optional
+        Default is 4. The maximum number of chunks waiting to be
+        written. `write` blocks while the queue is full.
+
+    """
+
+    _STOP = None
+
+    def __init__(self, file_path, queue_size=4):
+        self._file_path = file_path
+        if file_path.endswith(".gz"):
+            self._file_handle = gzip.open(file_path, "wt")
+        else:
+            self._file_handle = open(file_path, "w+")
+        self._chunks = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_chunks,
+                                        daemon=True)
+        self._thread.start()
+        # the thread is a daemon, so the queued rows are flushed at exit
+        atexit.register(self.close)
+
+    def _write_chunks(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is self._STOP:
+                break
+            if self._error is not None:
+                continue
+            try:
+                self._file_handle.write("".join(
+                    ["{0}\n".format('\t'.join([str(c) for c in cols]))
+                     for cols in chunk]))
+            except Exception as error:
+                self._error = error
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def write(self, rows):
+        """
+        Queues rows to be written.
+
+        Parameters
+        ----------
+        rows : list(list)
+            The rows to write. The columns of each row are written
+            tab-separated. The list must not be modified afterwards.
+
+        Raises
+        ------
+        ValueError
+            If there are rows to write and the writer was closed.
+
+        """
+        self._raise_error()
+        if rows:
+            if self._thread is None:
+                raise ValueError(
+                    "Cannot write to {0}: the file was closed.".format(
+                        self._file_path))
+            self._chunks.put(rows)
+
+    def close(self):
+        """
+        Writes the queued rows and closes the file. Calling `close`
+        again has no effect.
+
+        """
+        if self._thread is None:
+            return
+        atexit.unregister(self.close)
+        self._chunks.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+        self._file_handle.close()
+        self._raise_error()
+
+
+def _pack_batch(sequences, targets):
+    """
+    Packs a batch compactly, for transfer between processes and for
+    storage: each one-hot encoded base as its index in the alphabet
+    (unknown bases as the size of the alphabet), and the binary targets
+    as bits.
+    """
+    n_bases = sequences.shape[-1]
+    # with base i weighted by 2^i, the weighted sum of a one-hot row
+    # times N is N * 2^i, and that of an unknown row (1/N everywhere)
+    # is 2^N - 1, so a lookup table maps the sums to the codes
+    base_weights = (2. ** np.arange(n_bases)).astype(sequences.dtype)
+    sum_codes = np.full(n_bases * 2 ** n_bases + 1, n_bases, dtype=np.uint8)
+    sum_codes[n_bases * 2 ** np.arange(n_bases)] = np.arange(n_bases)
+    codes = sum_codes[np.rint(
+        sequences @ base_weights * n_bases).astype(np.intp)]
+    return codes, np.packbits(targets.astype(bool), axis=-1)
+
+
+def _unpack_dataset(codes, packed_targets, n_bases, n_features):
+    """
+    Unpacks the sequences and targets packed by `_pack_batch` into
+    float32 arrays, with unknown bases encoded as :math:`1/N`.
+    """
+    code_encodings = np.vstack(
+        [np.eye(n_bases), np.full((1, n_bases), 1. / n_bases)]).astype(
+            np.float32)
+    targets = np.unpackbits(
+        packed_targets, axis=-1, count=n_features).astype(np.float32)
+    return code_encodings[codes], targets
+
+
+def _sample_packed_batches(sampler, mode, batch_size, n_batches,
+                           collect_rows=False):
+    """
+    Draws `n_batches` batches in `mode` from `sampler`, and returns them
+    packed by `_pack_batch` and concatenated. If `collect_rows` is True,
+    the rows saved for `mode` (see `save_datasets`) are taken from the
+    sampler and returned too.
+    """
+    codes = []
+    packed_targets = []
+    rows = []
+    for _ in range(n_batches):
+        sequences, targets = sampler.sample(batch_size, mode=mode)
+        batch_codes, batch_targets = _pack_batch(sequences, targets)
+        codes.append(batch_codes)
+        packed_targets.append(batch_targets)
+        if collect_rows and mode in sampler._save_datasets:
+            rows.extend(sampler._save_datasets[mode])
+            sampler._save_datasets[mode] = []
+    n_bytes = -(-sampler.n_features // 8)
+    return (np.concatenate(
+                codes or [np.zeros((0, sampler.sequence_length), np.uint8)]),
+            np.concatenate(
+                packed_targets or [np.zeros((0, n_bytes), np.uint8)]),
+            rows)
+
+
+def _describe_file(file_path):
+    """
+    Describes a sampler input by its path and, if it is a file, its
+    size and modification time, so that the datasets cached for it are
+    drawn again when it changes.
+    """
+    if file_path is None or not os.path.isfile(file_path):
+        return file_path
+    file_stat = os.stat(file_path)
+    return [file_path, file_stat.st_size, file_stat.st_mtime_ns]
+
+
+# the sampler of a dataset worker process, set by `_init_dataset_worker`
+_dataset_sampler = None
+
+
+def _init_dataset_worker(pickled_sampler):
+    global _dataset_sampler
+    _dataset_sampler = pickle.loads(pickled_sampler)
+
+
+def _sample_dataset_shard(shard):
+    """
+    Draws a shard of a dataset in a worker process, with the random
+    number generators seeded for the shard.
+    """
+    mode, batch_size, n_batches, seed, shard_id = shard
+    _seed_worker(seed, shard_id)
+    return _sample_packed_batches(
+        _dataset_sampler, mode, batch_size, n_batches, collect_rows=True)
 
 
 class OnlineSampler(Sampler, metaclass=ABCMeta):
@@ -62,6 +255,36 @@ class OnlineSampler(Sampler, metaclass=ABCMeta):
         a non-empty list, `output_dir` must be specified. If
         the path in `output_dir` does not exist it will be created
         automatically.
+    target_in_memory : bool, optional
+        Default is False. If True, the features in `target_path` are
+        loaded into a `selene_sdk.targets.InMemoryGenomicFeatures`
+        object instead of being queried from the tabix index, which
+        makes retrieving the targets of a batch much faster.
+    compress_saved_datasets : bool, optional
+        Default is False. If True, the datasets in `save_datasets` are
+        saved gzip-compressed, to `<mode>_data.bed.gz` files.
+    output_buffers : int, optional
+        Default is 0. If greater than 0, `sample` writes each batch into
+        one of `output_buffers` preallocated float32 arrays (per batch
+        size), used in turn, instead of allocating new float64 arrays.
+        A returned batch is then overwritten `output_buffers` calls to
+        `sample` later, so it must be consumed (e.g. converted with
+        `torch.from_numpy` and copied to the GPU) before then. When
+        batches are queued, e.g. by a `PrefetchSampler`, `output_buffers`
+        must exceed the number of batches that can be held at once.
+    dataset_workers : int, optional
+        Default is 1. If greater than 1, `get_data_and_targets` (and so
+        the validation and test sets) draws its samples in this many
+        worker processes, each with its own random seed derived from
+        `seed`, and returns them as one contiguous float32 array.
+    dataset_cache_dir : str or None, optional
+        Default is None. If not None, the datasets returned by
+        `get_data_and_targets` are saved to `<mode>_dataset.npz` files
+        in this directory, and loaded from there by later calls (and
+        runs) that request as many samples, in batches of the same size,
+        from a sampler of the same configuration and unchanged input
+        files. Sequences and targets are stored bit-packed, so they must
+        be one-hot encoded and binary, respectively.
 
     Attributes
     ----------
@@ -119,7 +342,12 @@ class OnlineSampler(Sampler, metaclass=ABCMeta):
                  feature_thresholds=0.5,
                  mode="train",
                  save_datasets=[],
-                 output_dir=None):
+                 output_dir=None,
+                 target_in_memory=False,
+                 compress_saved_datasets=False,
+                 output_buffers=0,
+                 dataset_workers=1,
+                 dataset_cache_dir=None):
 
         """
         Creates a new `OnlineSampler` object.
@@ -213,10 +441,71 @@ class OnlineSampler(Sampler, metaclass=ABCMeta):
 
         self.reference_sequence = reference_sequence
         self.n_features = len(self._features)
-        self.target = GenomicFeatures(
-            target_path, self._features,
-            feature_thresholds=feature_thresholds)
+        if target_in_memory:
+            self.target = InMemoryGenomicFeatures(
+                target_path, self._features,
+                feature_thresholds=feature_thresholds)
+        else:
+            self.target = GenomicFeatures(
+                target_path, self._features,
+                feature_thresholds=feature_thresholds)
         self._save_filehandles = {}
+        self._compress_saved_datasets = compress_saved_datasets
+        self._n_output_buffers = output_buffers
+        self._output_buffers = {}
+        self._dataset_workers = dataset_workers
+        self._dataset_cache_dir = dataset_cache_dir
+        if dataset_cache_dir is not None:
+            os.makedirs(dataset_cache_dir, exist_ok=True)
+        # the configuration that the drawn datasets depend on, which
+        # keys the datasets saved to `dataset_cache_dir`. Subclasses add
+        # their own inputs.
+        self._dataset_config = {
+            "sampler": type(self).__name__,
+            "reference_sequence": [
+                type(reference_sequence).__name__,
+                _describe_file(
+                    getattr(reference_sequence, "input_path", None)),
+                _describe_file(
+                    getattr(reference_sequence, "blacklist_regions", None))],
+            "target": _describe_file(target_path),
+            "features": self._features,
+            "feature_thresholds": feature_thresholds,
+            "seed": seed,
+            "validation_holdout": self.validation_holdout,
+            "test_holdout": self.test_holdout,
+            "sequence_length": sequence_length,
+            "center_bin_to_predict": center_bin_to_predict,
+            "dataset_workers": dataset_workers
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the dataset writers and output buffers stay in this process
+        state["_save_filehandles"] = {}
+        state["_output_buffers"] = {}
+        return state
+
+    def _get_output_arrays(self, batch_size):
+        """
+        Returns the arrays that `sample` should write a batch of
+        `batch_size` sequences and targets into. Every element of the
+        arrays must be written, since reused buffers are not cleared.
+        """
+        if not self._n_output_buffers:
+            return (np.zeros((batch_size, self.sequence_length, 4)),
+                    np.zeros((batch_size, self.n_features)))
+        if batch_size not in self._output_buffers:
+            self._output_buffers[batch_size] = [
+                [(np.empty((batch_size, self.sequence_length, 4),
+                           dtype=np.float32),
+                  np.empty((batch_size, self.n_features),
+                           dtype=np.float32))
+                 for _ in range(self._n_output_buffers)], 0]
+        buffers, next_buffer = self._output_buffers[batch_size]
+        self._output_buffers[batch_size][1] = \
+            (next_buffer + 1) % self._n_output_buffers
+        return buffers[next_buffer]
 
     def get_feature_from_index(self, index):
         """
@@ -246,19 +535,23 @@ class OnlineSampler(Sampler, metaclass=ABCMeta):
             An :math:`L \\times N` array (where :math:`L` is the length
             of the sequence and :math:`N` is the size of the sequence
             type's alphabet) containing the one-hot encoding of the
-            sequence.
+            sequence, or a :math:`B \\times L \\times N` batch of
+            encodings.
 
         Returns
         -------
-        str
-            The sequence of :math:`L` characters decoded from the input.
+        str or list(str)
+            The sequence of :math:`L` characters decoded from the input,
+            or the :math:`B` sequences decoded from a batch.
         """
+        if encoding.ndim == 3:
+            return self.reference_sequence.encodings_to_sequences(encoding)
         return self.reference_sequence.encoding_to_sequence(encoding)
 
     def save_dataset_to_file(self, mode, close_filehandle=False):
         """
         Save samples for each partition (i.e. train/validate/test) to
-        disk.
+        disk. The samples are written on a background thread.
 
         Parameters
         ----------
@@ -273,19 +566,88 @@ class OnlineSampler(Sampler, metaclass=ABCMeta):
         """
         if mode not in self._save_datasets:
             return
-        samples = self._save_datasets[mode]
         if mode not in self._save_filehandles:
-            self._save_filehandles[mode] = open(
-                os.path.join(self._output_dir,
-                             "{0}_data.bed".format(mode)),
-                'w+')
-        file_handle = self._save_filehandles[mode]
-        while len(samples) > 0:
-            cols = samples.pop(0)
-            line = '\t'.join([str(c) for c in cols])
-            file_handle.write("{0}\n".format(line))
+            file_name = "{0}_data.bed".format(mode)
+            if self._compress_saved_datasets:
+                file_name += ".gz"
+            self._save_filehandles[mode] = _DatasetWriter(
+                os.path.join(self._output_dir, file_name))
+        writer = self._save_filehandles[mode]
+        # the rows are handed over to the writer's background thread
+        writer.write(self._save_datasets[mode])
+        self._save_datasets[mode] = []
         if close_filehandle:
-            file_handle.close()
+            writer.close()
+
+    def _sample_dataset(self, mode, batch_size, n_batches):
+        """
+        Draws `n_batches` batches in `mode`, packed by `_pack_batch`,
+        and returns them with the rows saved for `mode` while drawing
+        them (see `save_datasets`). The batches are divided among
+        `self._dataset_workers` processes.
+        """
+        if self._dataset_workers <= 1:
+            return _sample_packed_batches(
+                self, mode, batch_size, n_batches, collect_rows=True)
+
+        shard_batches = np.diff(np.linspace(
+            0, n_batches, self._dataset_workers + 1).astype(int))
+        # every (mode, shard) pair draws from its own random stream
+        shards = [(mode, batch_size, int(n), self.seed,
+                   index * len(self.modes) + self.modes.index(mode))
+                  for index, n in enumerate(shard_batches)]
+        # the sampler is pickled even where processes are forked, so
+        # that each worker opens its own file handles
+        with multiprocessing.Pool(self._dataset_workers,
+                                  initializer=_init_dataset_worker,
+                                  initargs=(pickle.dumps(self),)) as pool:
+            results = pool.map(_sample_dataset_shard, shards)
+        return (np.concatenate([codes for (codes, _, _) in results]),
+                np.concatenate([targets for (_, targets, _) in results]),
+                [row for (_, _, rows) in results for row in rows])
+
+    def _get_dataset(self, mode, batch_size, n_batches):
+        """
+        Returns the contiguous float32 arrays of sequences and targets of
+        `n_batches` batches in `mode`, loaded from
+        `self._dataset_cache_dir` if they were saved there before by a
+        sampler of the same configuration. The rows saved for `mode`
+        (see `save_datasets`) are cached with them.
+        """
+        save_rows = mode in self._save_datasets
+        metadata = {
+            "n_samples": np.int64(n_batches * batch_size),
+            "batch_size": np.int64(batch_size),
+            "config": np.array(json.dumps(
+                self._dataset_config, sort_keys=True, default=str))
+        }
+        dataset_path = None
+        dataset = None
+        if self._dataset_cache_dir is not None:
+            dataset_path = os.path.join(
+                self._dataset_cache_dir, "{0}_dataset.npz".format(mode))
+        if dataset_path is not None and os.path.exists(dataset_path):
+            with np.load(dataset_path) as cache:
+                if all(key in cache and np.array_equal(cache[key], value)
+                       for key, value in metadata.items()) and \
+                        (not save_rows or cache["has_rows"]):
+                    dataset = (cache["sequences"],
+                               cache["targets"],
+                               [row.split('\t') for row in cache["rows"]])
+        if dataset is None:
+            dataset = self._sample_dataset(mode, batch_size, n_batches)
+            if dataset_path is not None:
+                rows = ['\t'.join([str(c) for c in row])
+                        for row in dataset[2]]
+                np.savez(dataset_path,
+                         sequences=dataset[0],
+                         targets=dataset[1],
+                         rows=np.array(rows, dtype=str),
+                         has_rows=np.bool_(save_rows),
+                         **metadata)
+        if save_rows:
+            self._save_datasets[mode].extend(dataset[2])
+        return _unpack_dataset(dataset[0], dataset[1], 4, self.n_features)
 
     def get_data_and_targets(self, batch_size, n_samples=None, mode=None):
         """
@@ -323,7 +685,10 @@ class OnlineSampler(Sampler, metaclass=ABCMeta):
             :math:`N` is the size of the sequence type's alphabet, and
             :math:`F` is the number of features. Further,
             `target_matrix` is of the shape :math:`S \\times F`, where
-            :math:`S =` `n_samples`.
+            :math:`S =` `n_samples`. If `dataset_workers` is greater
+            than 1 or `dataset_cache_dir` is set, the batches are views
+            of contiguous float32 arrays, and `targets_matrix` is the
+            array of targets.
 
         """
         if mode is not None:
@@ -337,8 +702,22 @@ class OnlineSampler(Sampler, metaclass=ABCMeta):
             n_samples = 640000
 
         n_batches = int(n_samples / batch_size)
+        if self._dataset_workers > 1 or self._dataset_cache_dir is not None:
+            sequences, targets_mat = self._get_dataset(
+                mode, batch_size, n_batches)
+            for start in range(0, n_batches * batch_size, batch_size):
+                sequences_and_targets.append(
+                    (sequences[start:start + batch_size],
+                     targets_mat[start:start + batch_size]))
+            if mode in self._save_datasets:
+                self.save_dataset_to_file(mode, close_filehandle=True)
+            return sequences_and_targets, targets_mat
+
         for _ in range(n_batches):
             inputs, targets = self.sample(batch_size)
+            if self._n_output_buffers:
+                # the output buffers are reused by later batches
+                inputs, targets = inputs.copy(), targets.copy()
             sequences_and_targets.append((inputs, targets))
         targets_mat = np.vstack([t for (s, t) in sequences_and_targets])
         if mode in self._save_datasets:
@@ -0,0 +1,451 @@
+"""
+This module provides the `PrefetchSampler` class, which draws batches
+from another sampler ahead of time so that sampling overlaps with
+training.
+"""
+import multiprocessing
+import queue
+import threading
+from time import time
+
+from .sampler import Sampler
+from .sampler import _seed_worker
+from .sampler import _set_worker_partition
+
+
+def _put_until_stopped(batches, item, stop_event):
+    """
+    Puts `item` into the bounded queue `batches`, unless `stop_event` is
+    set while waiting for a free slot.
+    """
+    while not stop_event.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _produce_batches(sampler,
+                     batch_size,
+                     mode,
+                     batches,
+                     stop_event,
+                     lock=None,
+                     seed=None,
+                     worker_id=0,
+                     partition=None):
+    """
+    Draws batches from `sampler` and puts them into the `batches` queue
+    until `stop_event` is set. Any exception raised while sampling is put
+    into the queue, so that it is raised again when the batch is
+    requested.
+
+    Parameters
+    ----------
+    sampler : selene_sdk.samplers.Sampler
+        The sampler to draw batches from.
+    batch_size : int
+        The size of each batch.
+    mode : str
+        The mode to draw batches for.
+    batches : queue.Queue or multiprocessing.Queue
+        The bounded queue to put the batches into.
+    stop_event : threading.Event or multiprocessing.Event
+        Set when the batches are no longer needed.
+    lock : threading.Lock or None, optional
+        Default is None. Held while drawing a batch, if the sampler is
+        shared with other threads.
+    seed : int or None, optional
+        Default is None. If not None, the random number generators of
+        this worker are seeded with the stream spawned from `seed` for
+        `worker_id`.
+    worker_id : int, optional
+        Default is 0. The ID of the random stream of the worker.
+    partition : tuple(int, int) or None, optional
+        Default is None. If not None, the index of this worker process
+        among the workers and the number of workers (see
+        `selene_sdk.samplers.sampler._set_worker_partition`).
+
+    """
+    if seed is not None:
+        _seed_worker(seed, worker_id)
+    if partition is not None:
+        _set_worker_partition(*partition)
+    try:
+        while not stop_event.is_set():
+            if lock is None:
+                batch = sampler.sample(batch_size=batch_size, mode=mode)
+            else:
+                with lock:
+                    batch = sampler.sample(batch_size=batch_size, mode=mode)
+            _put_until_stopped(batches, batch, stop_event)
+    except Exception as error:
+        _put_until_stopped(batches, error, stop_event)
+
+
+class PrefetchSampler(Sampler):
+    """
+    Wraps a sampler and draws its batches ahead of time, on a background
+    thread or in worker processes, into bounded queues. This lets the
+    next batches be sampled while the model trains on the current one.
+
+    Batches of size `batch_size` are prefetched, for each mode in which
+    they are requested. Batches of other sizes, and all other methods,
+    are passed through to the wrapped sampler.
+
+    Parameters
+    ----------
+    sampler : selene_sdk.samplers.Sampler
+        The sampler to draw batches from.
+    batch_size : int
+        The size of the batches to prefetch.
+    queue_size : int, optional
+        Default is 4. The maximum number of batches prefetched by each
+        worker.
+    num_workers : int, optional
+        Default is 0. If 0, batches are drawn from `sampler` on a single
+        background thread. This works best with samplers that release
+        the GIL while they build a batch (e.g. `RandomPositionsSampler`).
+        Otherwise, each of the `num_workers` worker processes draws
+        batches from its own copy of `sampler`.
+    seed : int, optional
+        Default is 436. Each time prefetching starts for a mode, the
+        random number generators of the workers are seeded with new
+        streams spawned from `seed`. With `num_workers` equal to 0, these
+        are the generators of the current process, shared with the
+        background thread. With worker processes, batches are taken from
+        the workers in turn, so the batches drawn do not depend on the
+        timing of the workers.
+
+    Attributes
+    ----------
+    sampler : selene_sdk.samplers.Sampler
+        The wrapped sampler.
+    batch_size : int
+        The size of the batches that are prefetched.
+    modes : list(str)
+        The modes of the wrapped sampler.
+    mode : str
+        The current mode.
+    stall_time : float
+        The total time, in seconds, spent waiting for a prefetched batch
+        that was not ready yet.
+
+    Notes
+    -----
+    Only the batches of one mode are prefetched at a time. Switching
+    mode, with `set_mode` or by sampling in another mode, stops the
+    workers of the previous mode and discards the batches they
+    prefetched.
+
+    With `num_workers` equal to 0, starting to prefetch a mode reseeds
+    the global `numpy.random` and `random` generators of the calling
+    process, which the background thread then draws from. Random
+    numbers that the caller draws afterwards (e.g. to initialize or
+    shuffle anything else) therefore depend on `seed`, and they are
+    taken from the same stream as the thread, so that neither the
+    caller's numbers nor the prefetched batches are reproducible.
+    Use worker processes if both need to be reproducible.
+
+    With `num_workers` greater than 0, the samples saved by a wrapped
+    online sampler (see `save_datasets`) stay in the copies of the
+    workers, so they should not be saved for the prefetched modes.
+
+    """
+
+    def __init__(self,
+                 sampler,
+                 batch_size,
+                 queue_size=4,
+                 num_workers=0,
+                 seed=436):
+        """
+        Constructs a new `PrefetchSampler` object.
+        """
+        super(PrefetchSampler, self).__init__(
+            getattr(sampler, "_features", []))
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.modes = sampler.modes
+        self.mode = sampler.mode
+        self.stall_time = 0.
+
+        self._queue_size = queue_size
+        self._num_workers = num_workers
+        self._seed = seed
+        # guards the sampler when it is shared with the background thread
+        self._lock = threading.Lock()
+        self._producers = {}
+        # the number of times that prefetching was started, so that
+        # each start draws from new random streams
+        self._n_starts = 0
+
+    def _start_producers(self, mode):
+        """
+        Starts the workers that prefetch the batches of `mode`, after
+        stopping those of any other mode.
+        """
+        self._stop_producers()
+        start_index = self._n_starts
+        self._n_starts += 1
+        if self._num_workers == 0:
+            stop_event = threading.Event()
+            batches = [queue.Queue(maxsize=self._queue_size)]
+            # the background thread draws from the random number
+            # generators of this process
+            with self._lock:
+                _seed_worker(self._seed, start_index)
+            workers = [threading.Thread(
+                target=_produce_batches,
+                args=(self.sampler, self.batch_size, mode, batches[0],
+                      stop_event),
+                kwargs={"lock": self._lock},
+                daemon=True)]
+        else:
+            stop_event = multiprocessing.Event()
+            batches = [multiprocessing.Queue(maxsize=self._queue_size)
+                       for _ in range(self._num_workers)]
+            workers = [multiprocessing.Process(
+                target=_produce_batches,
+                args=(self.sampler, self.batch_size, mode, batches[i],
+                      stop_event),
+                kwargs={"seed": self._seed,
+                        "worker_id": start_index * self._num_workers + i,
+                        "partition": (i, self._num_workers)},
+                daemon=True) for i in range(self._num_workers)]
+        for worker in workers:
+            worker.start()
+        self._producers[mode] = {"batches": batches,
+                                 "workers": workers,
+                                 "stop_event": stop_event,
+                                 "next_worker": 0}
+
+    @property
+    def queue_depth(self):
+        """
+        The number of batches of the current mode that are ready.
+
+        Returns
+        -------
+        int
+            The number of batches prefetched for `self.mode`.
+
+        """
+        if self.mode not in self._producers:
+            return 0
+        return sum(batches.qsize()
+                   for batches in self._producers[self.mode]["batches"])
+
+    def _stop_producers(self, modes=None):
+        """
+        Stops the workers of `modes` (by default, of all modes) and
+        discards the batches they prefetched.
+        """
+        producers_by_mode = getattr(self, "_producers", {})
+        if modes is None:
+            modes = list(producers_by_mode.keys())
+        for mode in modes:
+            producers_by_mode[mode]["stop_event"].set()
+        for mode in modes:
+            for worker in producers_by_mode.pop(mode)["workers"]:
+                if isinstance(worker, threading.Thread):
+                    # wait for the batch being drawn, so that the
+                    # thread stops using the sampler
+                    worker.join()
+                    continue
+                worker.join(timeout=1)
+                if worker.is_alive():
+                    worker.terminate()
+
+    def set_mode(self, mode):
+        """
+        Sets the sampling mode, and stops prefetching the batches of
+        any other mode.
+
+        Parameters
+        ----------
+        mode : str
+            The name of the mode to use. It must be one of `self.modes`.
+
+        Raises
+        ------
+        ValueError
+            If `mode` is not a valid mode.
+
+        """
+        super(PrefetchSampler, self).set_mode(mode)
+        self._stop_producers(
+            [other for other in self._producers if other != mode])
+
+    def close(self):
+        """
+        Stops all the workers.
+
+        """
+        self._stop_producers()
+
+    def __del__(self):
+        self.close()
+
+    def get_feature_from_index(self, index):
+        """
+        Returns the feature corresponding to an index in the feature
+        vector.
+
+        Parameters
+        ----------
+        index : int
+            The index of the feature to retrieve the name for.
+
+        Returns
+        -------
+        str
+            The name of the feature occurring at the specified index.
+
+        """
+        return self.sampler.get_feature_from_index(index)
+
+    def sample(self, batch_size=1, mode=None):
+        """
+        Fetches a mini-batch of the data from the sampler. The first
+        call for a mode starts prefetching the batches of that mode, and
+        stops prefetching those of the mode sampled before.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            Default is 1. The size of the batch to retrieve. Only
+            batches of size `self.batch_size` are prefetched.
+        mode : str, optional
+            Default is None. The operating mode that the object should run in.
+            If None, will use the current mode `self.mode`.
+
+        Returns
+        -------
+        sequences, targets : tuple(numpy.ndarray, numpy.ndarray)
+            The batch returned by the wrapped sampler's `sample` method.
+
+        Raises
+        ------
+        Exception
+            Any exception raised by the wrapped sampler while drawing the
+            batch. The workers of `mode` are stopped first, so the next
+            call starts prefetching again.
+
+        """
+        mode = mode if mode else self.mode
+        if batch_size != self.batch_size:
+            with self._lock:
+                return self.sampler.sample(batch_size=batch_size, mode=mode)
+        if mode not in self._producers:
+            self._start_producers(mode)
+        producers = self._producers[mode]
+        batches = producers["batches"][producers["next_worker"]]
+        producers["next_worker"] = \
+            (producers["next_worker"] + 1) % len(producers["batches"])
+        try:
+            batch = batches.get_nowait()
+        except queue.Empty:
+            t_i = time()
+            batch = batches.get()
+            self.stall_time += time() - t_i
+        if isinstance(batch, Exception):
+            self._stop_producers([mode])
+            raise batch
+        return batch
+
+    def get_data_and_targets(self, batch_size, n_samples=None, mode=None):
+        """
+        This method fetches a subset of the data from the wrapped
+        sampler, divided into batches.
+
+        Parameters
+        ----------
+        batch_size : int
+            The size of the batches to divide the data into.
+        n_samples : int or None, optional
+            Default is None. The total number of samples to retrieve.
+        mode : str, optional
+            Default is None. The operating mode that the object should run in.
+            If None, will use the current mode `self.mode`.
+
+        Returns
+        -------
+        sequences_and_targets, targets_matrix : \
+        tuple(list(tuple(numpy.ndarray, numpy.ndarray)), numpy.ndarray)
+            See `selene_sdk.samplers.Sampler.get_data_and_targets`.
+
+        """
+        mode = mode if mode else self.mode
+        with self._lock:
+            return self.sampler.get_data_and_targets(
+                batch_size, n_samples=n_samples, mode=mode)
+
+    def get_validation_set(self, batch_size, n_samples=None):
+        """
+        This method returns a subset of validation data from the
+        wrapped sampler, divided into batches.
+
+        Parameters
+        ----------
+        batch_size : int
+            The size of the batches to divide the data into.
+        n_samples : int or None, optional
+            Default is None. The total number of validation examples to
+            retrieve.
+
+        Returns
+        -------
+        sequences_and_targets, targets_matrix : \
+        tuple(list(tuple(numpy.ndarray, numpy.ndarray)), numpy.ndarray)
+            See `selene_sdk.samplers.Sampler.get_validation_set`.
+
+        """
+        with self._lock:
+            return self.sampler.get_validation_set(
+                batch_size, n_samples=n_samples)
+
+    def get_test_set(self, batch_size, n_samples=None):
+        """
+        This method returns a subset of testing data from the wrapped
+        sampler, divided into batches.
+
+        Parameters
+        ----------
+        batch_size : int
+            The size of the batches to divide the data into.
+        n_samples : int or None, optional
+            Default is None. The total number of test examples to
+            retrieve.
+
+        Returns
+        -------
+        sequences_and_targets, targets_matrix : \
+        tuple(list(tuple(numpy.ndarray, numpy.ndarray)), numpy.ndarray)
+            See `selene_sdk.samplers.Sampler.get_test_set`.
+
+        """
+        with self._lock:
+            return self.sampler.get_test_set(
+                batch_size, n_samples=n_samples)
+
+    def save_dataset_to_file(self, mode, close_filehandle=False):
+        """
+        Saves the samples drawn by the wrapped sampler for a mode.
+
+        Parameters
+        ----------
+        mode : str
+            Must be one of the modes specified in `save_datasets` during
+            the wrapped sampler's initialization.
+        close_filehandle : bool, optional
+            Default is False. `close_filehandle=True` assumes that all
+            data corresponding to the input `mode` has been saved to
+            file and `save_dataset_to_file` will not be called with
+            `mode` again.
+
+        """
+        with self._lock:
+            return self.sampler.save_dataset_to_file(
+                mode, close_filehandle=close_filehandle)
@@ -5,18 +5,27 @@ TODO: Currently, only works with sequences from `selene_sdk.sequences.Genome`.
 We would like to generalize this to `selene_sdk.sequences.Sequence` if possible.
 """
 from collections import namedtuple
+import json
 import logging
-import random
+import os
 
 import numpy as np
 
 from functools import wraps
 from .online_sampler import OnlineSampler
+from .online_sampler import _describe_file
 from ..utils import get_indices_and_probabilities
+from ..utils import WeightedIndices
 
 logger = logging.getLogger(__name__)
 
 
+_MAX_UNKNOWN_FRACTION = 0.30
+"""
+Sequences with a larger fraction of unknown bases are not sampled.
+"""
+
+
 SampleIndices = namedtuple(
     "SampleIndices", ["indices", "weights"])
 """
@@ -44,6 +53,85 @@ weights : list(float)
 """
 
 
+def _valid_position_runs(unknown_mask,
+                         blacklist_starts,
+                         blacklist_ends,
+                         cstart,
+                         cend,
+                         start_window_radius,
+                         end_window_radius,
+                         chunk_size=2**24):
+    """
+    Finds the positions in `[cstart, cend)` of a chromosome that can be
+    sampled, i.e. those whose window does not overlap the blacklist and
+    does not have too many unknown bases.
+
+    Parameters
+    ----------
+    unknown_mask : numpy.ndarray, dtype=bool
+        Whether each base of the chromosome is unknown.
+    blacklist_starts : numpy.ndarray
+        The starts of the merged blacklist regions on the chromosome.
+    blacklist_ends : numpy.ndarray
+        The ends of the merged blacklist regions on the chromosome.
+    cstart : int
+        The first position that can be sampled. The window around it
+        must be in bounds.
+    cend : int
+        One past the last position that can be sampled. The window
+        around it must be in bounds.
+    start_window_radius : int
+        The number of bases in a window before its center position.
+    end_window_radius : int
+        The number of bases in a window from its center position on.
+    chunk_size : int, optional
+        Default is 2**24. The number of positions checked at a time.
+
+    Returns
+    -------
+    run_starts, run_ends : tuple(numpy.ndarray, numpy.ndarray)
+        The positions that can be sampled, as sorted runs
+        `[run_starts[i], run_ends[i])`.
+
+    """
+    sequence_length = start_window_radius + end_window_radius
+    run_starts = []
+    run_ends = []
+    for chunk_start in range(cstart, cend, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, cend)
+        n_positions = chunk_end - chunk_start
+        unknown_counts = np.concatenate([[0], np.cumsum(
+            unknown_mask[chunk_start - start_window_radius:
+                         chunk_end + end_window_radius],
+            dtype=np.int64)])
+        n_unknown = (
+            unknown_counts[sequence_length:sequence_length + n_positions] -
+            unknown_counts[:n_positions])
+        valid = ~(n_unknown / sequence_length > _MAX_UNKNOWN_FRACTION)
+
+        # the window of position `p` overlaps the blacklist region
+        # `[start, end)` if `start - end_window_radius < p` and
+        # `p < end + start_window_radius`
+        first = np.clip(blacklist_starts - end_window_radius + 1 - chunk_start,
+                        0, n_positions)
+        last = np.clip(blacklist_ends + start_window_radius - chunk_start,
+                       0, n_positions)
+        for f, l in zip(first[first < last], last[first < last]):
+            valid[f:l] = False
+
+        edges = np.diff(np.concatenate([[0], valid.view(np.int8), [0]]))
+        run_starts.append(np.nonzero(edges == 1)[0] + chunk_start)
+        run_ends.append(np.nonzero(edges == -1)[0] + chunk_start)
+    run_starts = np.concatenate(run_starts or [[]]).astype(np.int64)
+    run_ends = np.concatenate(run_ends or [[]]).astype(np.int64)
+    if len(run_starts) == 0:
+        return run_starts, run_ends
+    # join the runs that continue across chunks
+    joined = run_ends[:-1] == run_starts[1:]
+    return (run_starts[np.concatenate([[True], ~joined])],
+            run_ends[np.concatenate([~joined, [True]])])
+
+
 class RandomPositionsSampler(OnlineSampler):
     """This sampler randomly selects a position in the genome and queries for
     a sequence centered at that position for input to the model.
@@ -91,6 +179,38 @@ class RandomPositionsSampler(OnlineSampler):
         a non-empty list, `output_dir` must be specified. If
         the path in `output_dir` does not exist it will be created
         automatically.
+    target_in_memory : bool, optional
+        Default is False. If True, the features in `target_path` are
+        loaded into a `selene_sdk.targets.InMemoryGenomicFeatures`
+        object instead of being queried from the tabix index, which
+        makes retrieving the targets of a batch much faster.
+    compress_saved_datasets : bool, optional
+        Default is False. If True, the datasets in `save_datasets` are
+        saved gzip-compressed, to `<mode>_data.bed.gz` files.
+    output_buffers : int, optional
+        Default is 0. If greater than 0, batches are written into a ring
+        of `output_buffers` preallocated float32 arrays. See
+        `selene_sdk.samplers.OnlineSampler`.
+    dataset_workers : int, optional
+        Default is 1. If greater than 1, the samples of
+        `get_data_and_targets` (e.g. the validation and test sets) are
+        drawn in this many worker processes. See
+        `selene_sdk.samplers.OnlineSampler`.
+    dataset_cache_dir : str or None, optional
+        Default is None. If not None, the datasets returned by
+        `get_data_and_targets` are saved to and reloaded from this
+        directory. See `selene_sdk.samplers.OnlineSampler`.
+    valid_positions_path : str or None, optional
+        Default is None. Path to a `*.npz` file in which to cache the
+        positions that can be sampled, i.e. those whose sequence is in
+        bounds, does not overlap the reference sequence's blacklist and
+        is at most 30% unknown bases. They are found once by scanning
+        the whole reference sequence, and positions are then drawn
+        uniformly from them, so that no example is ever rejected. The
+        cache is rebuilt if it was created for different sequence
+        lengths, or if the sequence or blacklist file has changed. If
+        None, positions are drawn uniformly from each chromosome and
+        rejected examples are drawn again.
 
     Attributes
     ----------
@@ -130,7 +250,13 @@ class RandomPositionsSampler(OnlineSampler):
                  feature_thresholds=0.5,
                  mode="train",
                  save_datasets=[],
-                 output_dir=None):
+                 output_dir=None,
+                 target_in_memory=False,
+                 compress_saved_datasets=False,
+                 output_buffers=0,
+                 dataset_workers=1,
+                 dataset_cache_dir=None,
+                 valid_positions_path=None):
         super(RandomPositionsSampler, self).__init__(
             reference_sequence,
             target_path,
@@ -143,16 +269,22 @@ class RandomPositionsSampler(OnlineSampler):
             feature_thresholds=feature_thresholds,
             mode=mode,
             save_datasets=save_datasets,
-            output_dir=output_dir)
+            output_dir=output_dir,
+            target_in_memory=target_in_memory,
+            compress_saved_datasets=compress_saved_datasets,
+            output_buffers=output_buffers,
+            dataset_workers=dataset_workers,
+            dataset_cache_dir=dataset_cache_dir)
 
         self._sample_from_mode = {}
-        self._randcache = {}
+        self._weighted_indices = {}
         for mode in self.modes:
             self._sample_from_mode[mode] = None
-            self._randcache[mode] = {"cache_indices": None, "sample_next": 0}
 
         self.sample_from_intervals = []
         self.interval_lengths = []
+        self.valid_positions_path = valid_positions_path
+        self._valid_positions = None
         self._initialized = False
 
     def init(func):
@@ -165,8 +297,10 @@ class RandomPositionsSampler(OnlineSampler):
                 else:
                      self._partition_genome_by_proportion()
 
-                for mode in self.modes:
-                    self._update_randcache(mode=mode)
+                if self.valid_positions_path is not None:
+                    self._init_valid_positions()
+                else:
+                    self._init_weighted_indices()
                 self._initialized = True
             return func(self, *args, **kwargs)
         return dfunc
@@ -236,62 +370,202 @@ class RandomPositionsSampler(OnlineSampler):
                 self._sample_from_mode[mode]._replace(
                     indices=indices, weights=weights)
 
-    def _retrieve(self, chrom, position):
-        bin_start = position - self._start_radius
-        bin_end = position + self._end_radius
-        retrieved_targets = self.target.get_feature_data(
-            chrom, bin_start, bin_end)
-        window_start = position - self._start_window_radius
-        window_end = position + self._end_window_radius
-        if window_end - window_start < self.sequence_length:
-            print(bin_start, bin_end,
-                  self._start_radius, self._end_radius,
-                  self._start_window_radius, self._end_window_radius,)
-            return None
-        strand = self.STRAND_SIDES[random.randint(0, 1)]
-        retrieved_seq = \
-            self.reference_sequence.get_encoding_from_coords(
-                chrom, window_start, window_end, strand)
-
-        if retrieved_seq.shape[0] == 0:
+    def _init_weighted_indices(self):
+        """
+        Builds, for each mode, the cumulative weights used to choose the
+        interval of each position drawn.
+        """
+        for mode in self.modes:
+            self._weighted_indices[mode] = WeightedIndices(
+                *self._sample_from_mode[mode])
+        chroms, starts, ends = zip(*self.sample_from_intervals)
+        self._interval_chroms = np.array(chroms)
+        self._interval_starts = np.array(starts)
+        self._interval_ends = np.array(ends)
+
+    def _load_valid_position_runs(self):
+        """
+        Loads the runs of positions that can be sampled on every
+        chromosome from `self.valid_positions_path`, or finds them and
+        saves them there.
+        """
+        chr_lens = self.reference_sequence.get_chr_lens()
+        params = np.array([self._start_window_radius,
+                           self._end_window_radius], dtype=np.int64)
+        # the valid positions also depend on the sequence and blacklist
+        # files, which are identified by their paths, sizes and
+        # modification times
+        sources = json.dumps(
+            [_describe_file(self.reference_sequence.input_path),
+             _describe_file(self.reference_sequence._get_blacklist_path())])
+        if os.path.exists(self.valid_positions_path):
+            with np.load(self.valid_positions_path) as cache:
+                runs = dict(cache)
+            if (np.array_equal(runs["params"], params) and
+                    "sources" in runs and runs["sources"] == sources and
+                    runs["max_unknown_fraction"] == _MAX_UNKNOWN_FRACTION and
+                    runs["chroms"].tolist() == [c for (c, _) in chr_lens] and
+                    runs["chrom_lengths"].tolist() ==
+                    [l for (_, l) in chr_lens]):
+                return runs
+
+        run_starts = []
+        run_ends = []
+        for chrom, cstart, cend in self.sample_from_intervals:
+            if cend <= cstart:
+                starts = ends = np.zeros(0, dtype=np.int64)
+            else:
+                blacklist_starts, blacklist_ends = \
+                    self.reference_sequence.get_blacklist_intervals(chrom)
+                starts, ends = _valid_position_runs(
+                    self.reference_sequence.get_unknown_mask_from_coords(
+                        chrom, 0, cend + self._end_window_radius),
+                    blacklist_starts,
+                    blacklist_ends,
+                    cstart,
+                    cend,
+                    self._start_window_radius,
+                    self._end_window_radius)
+            run_starts.append(starts)
+            run_ends.append(ends)
+        runs = {
+            "params": params,
+            "sources": np.array(sources),
+            "max_unknown_fraction": np.float64(_MAX_UNKNOWN_FRACTION),
+            "chroms": np.array([c for (c, _) in chr_lens], dtype=str),
+            "chrom_lengths": np.array([l for (_, l) in chr_lens],
+                                      dtype=np.int64),
+            "chrom_offsets": np.concatenate(
+                [[0], np.cumsum([len(r) for r in run_starts])]).astype(
+                    np.int64),
+            "run_starts": np.concatenate(run_starts),
+            "run_ends": np.concatenate(run_ends),
+        }
+        tmp_path = "{0}.{1}.tmp".format(self.valid_positions_path, os.getpid())
+        with open(tmp_path, 'wb') as file_handle:
+            np.savez(file_handle, **runs)
+        os.replace(tmp_path, self.valid_positions_path)
+        return runs
+
+    def _init_valid_positions(self):
+        """
+        Builds, for each mode, the runs of positions that can be sampled
+        on the chromosomes of that mode and their cumulative lengths.
+        """
+        runs = self._load_valid_position_runs()
+        offsets = runs["chrom_offsets"]
+        self._valid_positions = {}
+        for mode in self.modes:
+            run_chroms = []
+            run_starts = []
+            run_ends = []
+            # `sample_from_intervals` has one interval per chromosome, in
+            # the order of `get_chr_lens`
+            for index in self._sample_from_mode[mode].indices:
+                rows = slice(offsets[index], offsets[index + 1])
+                run_starts.append(runs["run_starts"][rows])
+                run_ends.append(runs["run_ends"][rows])
+                run_chroms.append(np.full(
+                    offsets[index + 1] - offsets[index],
+                    self.sample_from_intervals[index][0]))
+            run_starts = np.concatenate(run_starts or [[]]).astype(np.int64)
+            run_ends = np.concatenate(run_ends or [[]]).astype(np.int64)
+            run_lengths = run_ends - run_starts
+            cumulative_lengths = np.cumsum(run_lengths)
+            if len(cumulative_lengths) == 0 or cumulative_lengths[-1] == 0:
+                raise ValueError(
+                    "No positions can be sampled in mode '{0}'.".format(mode))
+            self._valid_positions[mode] = (np.concatenate(run_chroms),
+                                           run_starts,
+                                           cumulative_lengths - run_lengths,
+                                           cumulative_lengths)
+
+    def _draw_valid_positions(self, n_positions, mode):
+        """
+        Draws `n_positions` positions uniformly from the positions of
+        `mode` that can be sampled.
+        """
+        run_chroms, run_starts, run_first_draws, cumulative_lengths = \
+            self._valid_positions[mode]
+        # draw the index of a position among all the positions of the
+        # mode, then find the run it falls in
+        draws = np.random.randint(
+            0, cumulative_lengths[-1], size=n_positions, dtype=np.int64)
+        runs = np.searchsorted(cumulative_lengths, draws, side="right")
+        return (run_chroms[runs],
+                run_starts[runs] + draws - run_first_draws[runs])
+
+    def _draw_positions(self, n_positions, mode):
+        """
+        Draws `n_positions` random positions from the intervals of
+        `mode`, choosing each interval with a probability proportional
+        to its length.
+        """
+        if self._valid_positions is not None:
+            return self._draw_valid_positions(n_positions, mode)
+        interval_indices = self._weighted_indices[mode].draw(n_positions)
+        positions = np.random.randint(self._interval_starts[interval_indices],
+                                      self._interval_ends[interval_indices])
+        return self._interval_chroms[interval_indices], positions
+
+    def _sample_block(self, n_samples, mode, sequences, targets):
+        """
+        Draws a block of `n_samples` candidate positions and writes the
+        examples that pass the checks in `_retrieve` into the first rows
+        of `sequences` and `targets`. Returns the number of examples
+        written.
+        """
+        chroms, positions = self._draw_positions(n_samples, mode)
+        strands = np.array(self.STRAND_SIDES)[
+            np.random.randint(0, 2, size=n_samples)]
+        window_starts = positions - self._start_window_radius
+        window_ends = positions + self._end_window_radius
+        encodings, valid, n_unknown = \
+            self.reference_sequence.get_encodings_from_coords(
+                chroms, window_starts, window_ends, strands=strands)
+
+        too_many_unknown = \
+            n_unknown / self.sequence_length > _MAX_UNKNOWN_FRACTION
+        for i in np.nonzero(~valid)[0]:
             logger.info("Full sequence centered at {0} position {1} "
                         "could not be retrieved. Sampling again.".format(
-                            chrom, position))
-            return None
-        elif np.mean(retrieved_seq==0.25) > 0.30:
+                            chroms[i], positions[i]))
+        for i in np.nonzero(valid & too_many_unknown)[0]:
             logger.info("Over 30% of the bases in the sequence centered "
                         "at {0} position {1} are ambiguous ('N'). "
-                        "Sampling again.".format(chrom, position))
-            return None
-
-        if self.mode in self._save_datasets:
-            feature_indices = ';'.join(
-                [str(f) for f in np.nonzero(retrieved_targets)[0]])
-            self._save_datasets[self.mode].append(
-                [chrom,
-                 window_start,
-                 window_end,
-                 strand,
-                 feature_indices])
-            if len(self._save_datasets[self.mode]) > 200000:
-                self.save_dataset_to_file(self.mode)
-        return (retrieved_seq, retrieved_targets)
-
-    def _update_randcache(self, mode=None):
-        if not mode:
-            mode = self.mode
-        self._randcache[mode]["cache_indices"] = np.random.choice(
-            self._sample_from_mode[mode].indices,
-            size=200000,
-            replace=True,
-            p=self._sample_from_mode[mode].weights)
-        self._randcache[mode]["sample_next"] = 0
+                        "Sampling again.".format(chroms[i], positions[i]))
+        keep = np.nonzero(valid & ~too_many_unknown)[0]
+        n_kept = len(keep)
+        if n_kept == 0:
+            return 0
+
+        sequences[:n_kept] = encodings[keep]
+        self.target.get_feature_data_batch(
+            chroms[keep],
+            positions[keep] - self._start_radius,
+            positions[keep] + self._end_radius,
+            targets=targets[:n_kept])
+
+        if mode in self._save_datasets:
+            for i, row in enumerate(keep):
+                feature_indices = ';'.join(
+                    [str(f) for f in np.nonzero(targets[i])[0]])
+                self._save_datasets[mode].append(
+                    [chroms[row],
+                     int(window_starts[row]),
+                     int(window_ends[row]),
+                     strands[row],
+                     feature_indices])
+            if len(self._save_datasets[mode]) > 200000:
+                self.save_dataset_to_file(mode)
+        return n_kept
 
     @init
     def sample(self, batch_size=1, mode=None):
         """
         Randomly draws a mini-batch of examples and their corresponding
-        labels.
+        labels. Candidate positions are drawn, retrieved and checked a
+        block at a time, and only the rejected examples are drawn again.
 
         Parameters
         ----------
@@ -316,28 +590,12 @@ class RandomPositionsSampler(OnlineSampler):
 
         """
         mode = mode if mode else self.mode
-        sequences = np.zeros((batch_size, self.sequence_length, 4))
-        targets = np.zeros((batch_size, self.n_features))
+        sequences, targets = self._get_output_arrays(batch_size)
         n_samples_drawn = 0
         while n_samples_drawn < batch_size:
-            sample_index = self._randcache[mode]["sample_next"]
-            if sample_index == len(self._randcache[mode]["cache_indices"]):
-                self._update_randcache()
-                sample_index = 0
-
-            rand_interval_index = \
-                self._randcache[mode]["cache_indices"][sample_index]
-            self._randcache[mode]["sample_next"] += 1
-
-            chrom, cstart, cend = \
-                self.sample_from_intervals[rand_interval_index]
-            position = np.random.randint(cstart, cend)
-
-            retrieve_output = self._retrieve(chrom, position)
-            if not retrieve_output:
-                continue
-            seq, seq_targets = retrieve_output
-            sequences[n_samples_drawn, :, :] = seq
-            targets[n_samples_drawn, :] = seq_targets
-            n_samples_drawn += 1
+            n_samples_drawn += self._sample_block(
+                batch_size - n_samples_drawn,
+                mode,
+                sequences[n_samples_drawn:],
+                targets[n_samples_drawn:])
         return (sequences, targets)
@@ -5,6 +5,69 @@ a way to query some training/validation/test data for examples.
 from abc import ABCMeta
 from abc import abstractmethod
 import os
+import random
+
+import numpy as np
+
+
+def _seed_worker(seed, worker_id):
+    """
+    Seeds `numpy.random` and `random` in a worker process with streams
+    spawned from `seed` for `worker_id`. The streams of different
+    workers are independent, and the streams of a run depend only on
+    `seed` and the worker IDs.
+
+    Parameters
+    ----------
+    seed : int
+        The seed of the run.
+    worker_id : int
+        The ID of the worker, from 0 to the number of workers - 1.
+
+    """
+    worker_seed = np.random.SeedSequence(seed, spawn_key=(worker_id,))
+    state = worker_seed.generate_state(8)
+    np.random.seed(state[:4])
+    random.seed(int.from_bytes(state[4:].tobytes(), "little"))
+
+
+# the index of this process among the worker processes that draw from
+# copies of the same sampler, and the number of those processes
+_worker_partition = (0, 1)
+
+
+def _set_worker_partition(worker_id, num_workers):
+    """
+    Records that this process is the worker `worker_id` of
+    `num_workers` worker processes that draw from copies of the same
+    sampler, so that samplers with state (e.g. `IntervalsSampler` with
+    `without_replacement`) can divide their draws among the workers
+    instead of repeating them in each worker.
+
+    Parameters
+    ----------
+    worker_id : int
+        The ID of the worker, from 0 to `num_workers` - 1.
+    num_workers : int
+        The number of workers.
+
+    """
+    global _worker_partition
+    _worker_partition = (worker_id, num_workers)
+
+
+def _get_worker_partition():
+    """
+    Returns the partition set by `_set_worker_partition`.
+
+    Returns
+    -------
+    worker_id, num_workers : tuple(int, int)
+        The ID of this worker and the number of workers, `(0, 1)` if
+        this process is not a worker.
+
+    """
+    return _worker_partition
 
 
 class Sampler(metaclass=ABCMeta):
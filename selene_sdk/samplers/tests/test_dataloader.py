@@ -0,0 +1,210 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from selene_sdk.samplers.dataloader import SamplerDataLoader
+from selene_sdk.samplers.dataloader import ShardedH5DataLoader
+from selene_sdk.samplers.dataloader import _RangeBatchSampler
+from selene_sdk.samplers.dataloader import _ShardedH5Dataset
+from selene_sdk.samplers.dataloader import _unpack_batch
+from selene_sdk.samplers.sampler import Sampler
+from selene_sdk.samplers.sampler import _get_worker_partition
+
+
+class WorkerSampler(Sampler):
+    """
+    Draws a random number from `numpy.random` for each sample, along
+    with the worker partition of the process it is drawn in.
+    """
+
+    def __init__(self):
+        super(WorkerSampler, self).__init__([])
+
+    def get_feature_from_index(self, index):
+        return str(index)
+
+    def sample(self, batch_size=1, mode=None):
+        worker_id, num_workers = _get_worker_partition()
+        sequences = np.random.random_sample((batch_size, 1))
+        targets = np.tile([worker_id, num_workers], (batch_size, 1))
+        return sequences, targets
+
+    def get_data_and_targets(self, batch_size, n_samples=None, mode=None):
+        raise NotImplementedError
+
+    def get_validation_set(self, batch_size, n_samples=None):
+        raise NotImplementedError
+
+    def get_test_set(self, batch_size, n_samples=None):
+        raise NotImplementedError
+
+    def save_dataset_to_file(self, mode, close_filehandle=False):
+        pass
+
+
+class TestSamplerDataLoader(unittest.TestCase):
+
+    def _draw(self, seed, n_batches=4):
+        dataloader = SamplerDataLoader(
+            WorkerSampler(), num_workers=2, batch_size=3, seed=seed)
+        batches = []
+        for sequences, targets in dataloader:
+            batches.append((sequences.numpy(), targets.numpy()))
+            if len(batches) == n_batches:
+                break
+        return batches
+
+    def test_workers_have_own_streams_and_partitions(self):
+        batches = self._draw(3)
+        partitions = set()
+        for sequences, targets in batches:
+            self.assertEqual(len(np.unique(targets, axis=0)), 1)
+            partitions.add(tuple(targets[0].tolist()))
+        self.assertEqual(partitions, {(0, 2), (1, 2)})
+        values = np.concatenate([sequences for sequences, _ in batches])
+        self.assertEqual(len(np.unique(values)), len(values))
+
+    def test_seed_determines_samples(self):
+        first = self._draw(3)
+        second = self._draw(3)
+        other = self._draw(4)
+        for (a, _), (b, _), (c, _) in zip(first, second, other):
+            self.assertTrue(np.array_equal(a, b))
+            self.assertFalse(np.array_equal(a, c))
+
+
+def unpack_with_unpackbits(sequence, targets, s_len, t_len):
+    """
+    Unpacks the sequences and targets with `numpy.unpackbits`.
+    """
+    sequence = np.unpackbits(sequence, axis=-2)
+    nulls = np.sum(sequence, axis=-1) == sequence.shape[-1]
+    sequence = sequence.astype(float)
+    sequence[nulls, :] = 1.0 / sequence.shape[-1]
+    targets = np.unpackbits(targets, axis=-1).astype(float)
+    return (sequence[..., :s_len, :].astype(np.float32),
+            targets[..., :t_len].astype(np.float32))
+
+
+class TestUnpackBatch(unittest.TestCase):
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        # the lengths are not multiples of 8
+        sequences = np.eye(4, dtype=np.uint8)[
+            random_state.randint(4, size=(5, 13))]
+        # unknown bases have all their bits set
+        sequences[random_state.random_sample((5, 13)) < 0.3] = 1
+        sequences[2] = 1
+        targets = random_state.randint(2, size=(5, 11)).astype(np.uint8)
+        self.sequences = np.packbits(sequences, axis=-2)
+        self.targets = np.packbits(targets, axis=-1)
+
+    def _assert_unpacked(self, sequences, targets):
+        expected = unpack_with_unpackbits(sequences, targets, 13, 11)
+        for data, expected_data in zip(
+                _unpack_batch(sequences, targets, 13, 11), expected):
+            self.assertEqual(data.dtype, np.float32)
+            self.assertTrue(data.flags["C_CONTIGUOUS"])
+            np.testing.assert_array_equal(data, expected_data)
+
+    def test_unpack_batch(self):
+        self._assert_unpacked(self.sequences, self.targets)
+
+    def test_unpack_single_sample(self):
+        for index in range(len(self.sequences)):
+            self._assert_unpacked(self.sequences[index], self.targets[index])
+
+
+class TestShardedH5DataLoader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        random_state = np.random.RandomState(0)
+        self.sequences = np.eye(4, dtype=np.uint8)[
+            random_state.randint(4, size=(12, 6))]
+        self.targets = random_state.randint(2, size=(12, 3)).astype(np.uint8)
+        # the files hold the samples 0-4, 5-7 and 8-11
+        self.file_paths = []
+        for shard, (start, end) in enumerate([(0, 5), (5, 8), (8, 12)]):
+            file_path = os.path.join(
+                self.tmp_dir, "shard_{0}.h5".format(shard))
+            with h5py.File(file_path, 'w') as fh:
+                fh.create_dataset("sequences", data=self.sequences[start:end])
+                fh.create_dataset("targets", data=self.targets[start:end])
+            self.file_paths.append(file_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _assert_samples(self, data, indices):
+        sequences, targets = data
+        np.testing.assert_array_equal(
+            sequences.numpy(), self.sequences[indices])
+        np.testing.assert_array_equal(targets.numpy(), self.targets[indices])
+
+    def test_read_across_files(self):
+        for in_memory in (False, True):
+            dataset = _ShardedH5Dataset(self.file_paths, in_memory=in_memory)
+            self.assertEqual(len(dataset), 12)
+            for indices in (range(0, 5), range(3, 10), range(4, 12)):
+                self._assert_samples(dataset[indices], list(indices))
+            self._assert_samples(dataset[7], 7)
+            self._assert_samples(dataset[[0, 4, 5, 11, 2]], [0, 4, 5, 11, 2])
+            self._assert_samples(dataset[[7, 7, 1, 7]], [7, 7, 1, 7])
+            # the indices wrap around the end of the dataset
+            self._assert_samples(dataset[range(10, 14)], [10, 11, 0, 1])
+
+    def test_range_batch_sampler(self):
+        sampler = _RangeBatchSampler(12, 5, shuffle=False)
+        self.assertEqual(len(sampler), 3)
+        self.assertEqual(list(sampler),
+                         [range(0, 5), range(5, 10), range(10, 12)])
+        sampler = _RangeBatchSampler(12, 5)
+        self.assertEqual(sorted(list(sampler), key=lambda r: r.start),
+                         [range(0, 5), range(5, 10), range(10, 12)])
+
+    def test_dataloader(self):
+        for in_memory in (False, True):
+            for num_workers in (0, 2):
+                dataloader = ShardedH5DataLoader(self.file_paths,
+                                                 in_memory=in_memory,
+                                                 num_workers=num_workers,
+                                                 batch_size=5,
+                                                 shuffle=False)
+                batches = list(dataloader)
+                self.assertEqual([len(s) for s, _ in batches], [5, 5, 2])
+                for batch, start in zip(batches, (0, 5, 10)):
+                    self._assert_samples(
+                        batch, list(range(start, min(start + 5, 12))))
+
+                dataloader = ShardedH5DataLoader(self.file_paths,
+                                                 in_memory=in_memory,
+                                                 num_workers=num_workers,
+                                                 batch_size=5)
+                sequences = np.concatenate(
+                    [s.numpy() for s, _ in dataloader])
+                self.assertEqual(
+                    sorted(sequences.argmax(axis=-1).tolist()),
+                    sorted(self.sequences.argmax(axis=-1).tolist()))
+
+    def test_glob(self):
+        dataloader = ShardedH5DataLoader(
+            os.path.join(self.tmp_dir, "shard_*.h5"), batch_size=12)
+        self.assertEqual(dataloader.dataset.file_paths, self.file_paths)
+        self._assert_samples(next(iter(dataloader)), list(range(12)))
+
+    def test_different_lengths_raise(self):
+        for file_path, length in zip(self.file_paths, (6, 6, 7)):
+            with h5py.File(file_path, 'a') as fh:
+                fh.create_dataset("sequences_length", data=length)
+                fh.create_dataset("targets_length", data=3)
+        _ShardedH5Dataset(self.file_paths[:2], unpackbits=True)
+        with self.assertRaises(ValueError):
+            _ShardedH5Dataset(self.file_paths, unpackbits=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from selene_sdk.samplers import H5Exporter
+from selene_sdk.samplers import IntervalsSampler
+from selene_sdk.sequences import Genome
+from selene_sdk.utils import load_path
+from selene_sdk.utils import parse_configs_and_run
+
+
+FEATURES = ["CTCF", "GABP", "Pbx3", "Pol2", "TBP", "eGFP-FOS"]
+TARGET_PATH = os.path.abspath(
+    "selene_sdk/targets/tests/files/sorted_aggregate.bed.gz")
+
+
+class TestH5Exporter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        random_state = np.random.RandomState(0)
+        self.genome_path = os.path.join(self.tmp_dir, "genome.fa")
+        with open(self.genome_path, 'w') as file_handle:
+            for chrom in ("1", "10"):
+                sequence = "".join(random_state.choice(list("ACGT"), 20000))
+                file_handle.write(">{0}\n{1}\n".format(chrom, sequence))
+        self.intervals_path = os.path.join(self.tmp_dir, "intervals.bed")
+        with open(self.intervals_path, 'w') as file_handle:
+            file_handle.write("1\t16100\t16200\n1\t17000\t17100\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_sampler(self, **kwargs):
+        return IntervalsSampler(Genome(self.genome_path),
+                                TARGET_PATH,
+                                FEATURES,
+                                self.intervals_path,
+                                sample_negative=True,
+                                validation_holdout=["10"],
+                                test_holdout=[],
+                                sequence_length=100,
+                                center_bin_to_predict=20,
+                                save_datasets=[],
+                                **kwargs)
+
+    def _export(self, output_name, sampler_kwargs={}, **kwargs):
+        exporter = H5Exporter(self._make_sampler(**sampler_kwargs),
+                              os.path.join(self.tmp_dir, output_name),
+                              "train",
+                              30,
+                              batch_size=4,
+                              batches_per_block=4,
+                              **kwargs)
+        return exporter, exporter.export()
+
+    def _read(self, output_path):
+        with h5py.File(output_path, 'r') as fh:
+            return (fh["sequences"][()],
+                    fh["targets"][()],
+                    fh["completed_blocks"][()])
+
+    def _assert_same_export(self, output_path, other_path):
+        for data, other in zip(self._read(output_path),
+                               self._read(other_path)):
+            self.assertTrue(np.array_equal(data, other))
+
+    def test_export(self):
+        _, output_path = self._export("export")
+        self.assertEqual(os.path.basename(output_path),
+                         "train_seed=123_N=30.h5")
+        sequences, targets, completed_blocks = self._read(output_path)
+        self.assertEqual(sequences.shape, (30, 100, 4))
+        self.assertEqual(sequences.dtype, np.float32)
+        self.assertEqual(targets.shape, (30, len(FEATURES)))
+        self.assertTrue(np.all(sequences.sum(axis=-1) == 1))
+        self.assertTrue(np.all(completed_blocks))
+        # the blocks are drawn from different streams
+        self.assertFalse(np.array_equal(sequences[:14], sequences[16:]))
+
+    def test_output_buffers_do_not_change_export(self):
+        # the blocks have more batches than the sampler has buffers
+        _, output_path = self._export("unbuffered")
+        _, buffered_path = self._export(
+            "buffered", sampler_kwargs={"output_buffers": 2})
+        self._assert_same_export(output_path, buffered_path)
+
+    def test_num_workers_do_not_change_export(self):
+        for sampler_kwargs in ({}, {"without_replacement": True}):
+            _, output_path = self._export(
+                "one_worker", sampler_kwargs=sampler_kwargs)
+            _, workers_path = self._export(
+                "two_workers", sampler_kwargs=sampler_kwargs, num_workers=2)
+            self._assert_same_export(output_path, workers_path)
+            os.remove(output_path)
+            os.remove(workers_path)
+
+    def test_without_replacement_divides_draws_among_blocks(self):
+        _, output_path = self._export(
+            "export", sampler_kwargs={"without_replacement": True})
+        sequences, _, _ = self._read(output_path)
+        # the 30 samples are drawn from 200 positions
+        n_distinct = len(np.unique(sequences.argmax(axis=-1), axis=0))
+        self.assertGreaterEqual(n_distinct, 29)
+
+    def test_resume(self):
+        _, output_path = self._export("export")
+        exporter, resumed_path = self._export("resumed")
+        with h5py.File(resumed_path, 'a') as fh:
+            fh["completed_blocks"][1] = False
+            fh["sequences"][16:] = 0
+        self.assertEqual(exporter.export(), resumed_path)
+        self._assert_same_export(output_path, resumed_path)
+
+    def test_resume_with_other_parameters_raises(self):
+        self._export("export")
+        with self.assertRaises(ValueError):
+            self._export("export", packbits=True)
+
+    def test_export_operation(self):
+        _, output_path = self._export("export", packbits=True)
+        config_path = os.path.join(self.tmp_dir, "export.yml")
+        with open(config_path, 'w') as file_handle:
+            file_handle.write("""
+ops: [export]
+sampler: !obj:selene_sdk.samplers.IntervalsSampler {{
+    reference_sequence: !obj:selene_sdk.sequences.Genome {{
+        input_path: {0}
+    }},
+    target_path: {1},
+    features: {2},
+    intervals_path: {3},
+    sample_negative: True,
+    validation_holdout: ["10"],
+    test_holdout: [],
+    sequence_length: 100,
+    center_bin_to_predict: 20
+}}
+export_h5: !obj:selene_sdk.samplers.H5Exporter {{
+    mode: train,
+    n_samples: 30,
+    batch_size: 4,
+    batches_per_block: 4,
+    packbits: True
+}}
+output_dir: {4}
+create_subdirectory: False
+""".format(self.genome_path, TARGET_PATH, FEATURES, self.intervals_path,
+           os.path.join(self.tmp_dir, "cli")))
+        parse_configs_and_run(load_path(config_path, instantiate=False))
+        self._assert_same_export(
+            output_path,
+            os.path.join(self.tmp_dir, "cli", "train_seed=123_N=30.h5"))
+
+
+if __name__ == "__main__":
+    unittest.main()
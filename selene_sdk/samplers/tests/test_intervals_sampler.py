@@ -0,0 +1,197 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from selene_sdk.samplers import IntervalsSampler
+from selene_sdk.samplers.sampler import _set_worker_partition
+from selene_sdk.sequences import Genome
+
+
+FEATURES = ["CTCF", "GABP", "Pbx3", "Pol2", "TBP", "eGFP-FOS"]
+TARGET_PATH = "selene_sdk/targets/tests/files/sorted_aggregate.bed.gz"
+
+
+def write_genome(directory, chrom_length=130000, unknown=None):
+    """
+    Writes a random genome with the chromosomes of the targets file.
+    The bases `[start, end)` of chromosome "1" are unknown if `unknown`
+    is `(start, end)`.
+    """
+    random_state = np.random.RandomState(0)
+    path = os.path.join(directory, "genome.fa")
+    with open(path, 'w') as file_handle:
+        for chrom in ("1", "10"):
+            sequence = "".join(random_state.choice(list("ACGT"), chrom_length))
+            if chrom == "1" and unknown is not None:
+                start, end = unknown
+                sequence = (sequence[:start] + "N" * (end - start) +
+                            sequence[end:])
+            file_handle.write(">{0}\n".format(chrom))
+            for start in range(0, chrom_length, 60):
+                file_handle.write("{0}\n".format(sequence[start:start + 60]))
+    return path
+
+
+class TestIntervalsSampler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.genome_path = write_genome(self.tmp_dir)
+        self.intervals_path = os.path.join(self.tmp_dir, "intervals.bed")
+        with open(self.intervals_path, 'w') as file_handle:
+            # the intervals at 16100 on "1" and 119900 on "10" overlap
+            # features of the targets file
+            for chrom, start, end in [("1", 16100, 16200),
+                                      ("1", 30000, 30050),
+                                      ("1", 40000, 40150),
+                                      ("10", 119900, 120000)]:
+                file_handle.write("{0}\t{1}\t{2}\n".format(chrom, start, end))
+
+    def tearDown(self):
+        _set_worker_partition(0, 1)
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_sampler(self, **kwargs):
+        config = dict(sample_negative=True,
+                      seed=3,
+                      validation_holdout=["10"],
+                      test_holdout=[],
+                      sequence_length=100,
+                      center_bin_to_predict=20,
+                      save_datasets=[])
+        config.update(kwargs)
+        return IntervalsSampler(Genome(self.genome_path),
+                                TARGET_PATH,
+                                FEATURES,
+                                self.intervals_path,
+                                **config)
+
+    def _train_positions(self, sampler):
+        units = sampler._weighted_indices["train"].indices
+        return sorted(
+            (unit, position) for unit in units
+            for position in range(
+                sampler._interval_starts[unit],
+                sampler._interval_starts[unit] +
+                sampler._interval_lengths[unit]))
+
+    def _draw(self, sampler, n_draws):
+        units, positions = sampler._draw_without_replacement(n_draws, "train")
+        return list(zip(units.tolist(), positions.tolist()))
+
+    def test_without_replacement_draws_each_position_once_per_epoch(self):
+        sampler = self._make_sampler(without_replacement=True)
+        expected = self._train_positions(sampler)
+        self.assertEqual(len(expected), 300)
+        for epoch in range(2):
+            self.assertEqual(sampler.get_epoch("train"), epoch)
+            self.assertEqual(sorted(self._draw(sampler, 300)), expected)
+        self.assertEqual(sampler.get_epoch("train"), 2)
+
+    def test_without_replacement_order_depends_on_seed_only(self):
+        orders = []
+        for global_seed in (1, 2):
+            sampler = self._make_sampler(without_replacement=True)
+            np.random.seed(global_seed)
+            orders.append(self._draw(sampler, 300))
+        self.assertEqual(orders[0], orders[1])
+
+    def test_workers_divide_each_epoch(self):
+        sampler = self._make_sampler(without_replacement=True)
+        expected = self._train_positions(sampler)
+        draws = []
+        for worker_id in range(3):
+            worker_sampler = pickle.loads(pickle.dumps(sampler))
+            _set_worker_partition(worker_id, 3)
+            draws.extend(self._draw(worker_sampler, 100))
+            self.assertEqual(worker_sampler.get_epoch("train"), 1)
+        self.assertEqual(sorted(draws), expected)
+
+    def _get_validation_set(self, sampler):
+        batches, targets = sampler.get_data_and_targets(
+            4, n_samples=16, mode="validate")
+        with open(os.path.join(self.tmp_dir, "validate_data.bed")) as rows:
+            n_rows = len(rows.readlines())
+        return np.concatenate([s for (s, _) in batches]), targets, n_rows
+
+    def test_parallel_dataset_matches_sequential(self):
+        results = [self._get_validation_set(self._make_sampler(
+                        dataset_workers=dataset_workers,
+                        save_datasets=["validate"],
+                        output_dir=self.tmp_dir))
+                   for dataset_workers in (1, 2)]
+        for sequences, targets, n_rows in results:
+            self.assertEqual(sequences.shape, (16, 100, 4))
+            self.assertEqual(targets.shape, (16, len(FEATURES)))
+            self.assertTrue(np.all(sequences.sum(axis=-1) == 1))
+            self.assertEqual(n_rows, 16)
+
+    def test_dataset_cache(self):
+        cache_dir = os.path.join(self.tmp_dir, "cache")
+
+        def make_sampler(**kwargs):
+            return self._make_sampler(dataset_cache_dir=cache_dir,
+                                      save_datasets=["validate"],
+                                      output_dir=self.tmp_dir,
+                                      **kwargs)
+
+        sequences, targets, _ = self._get_validation_set(make_sampler())
+        sampler = make_sampler()
+        with mock.patch.object(sampler, "_sample_dataset") as sample:
+            cached = self._get_validation_set(sampler)
+        sample.assert_not_called()
+        self.assertTrue(np.array_equal(cached[0], sequences))
+        self.assertTrue(np.array_equal(cached[1], targets))
+        self.assertEqual(cached[2], 16)
+
+        sampler = make_sampler(sample_negative=False)
+        with mock.patch.object(sampler, "_sample_dataset",
+                               wraps=sampler._sample_dataset) as sample:
+            _, targets, _ = self._get_validation_set(sampler)
+        sample.assert_called_once()
+        self.assertTrue(np.all(targets.sum(axis=1) > 0))
+
+        with open(self.intervals_path, 'a') as file_handle:
+            file_handle.write("10\t119800\t119900\n")
+        os.utime(self.intervals_path, ns=(0, 10 ** 18))
+        sampler = make_sampler(sample_negative=False)
+        with mock.patch.object(sampler, "_sample_dataset",
+                               wraps=sampler._sample_dataset) as sample:
+            self._get_validation_set(sampler)
+        sample.assert_called_once()
+
+    def test_sample_raises_if_nothing_can_be_drawn(self):
+        sampler = self._make_sampler(validation_holdout=["X"])
+        with self.assertRaises(ValueError):
+            sampler.sample(batch_size=2, mode="validate")
+        with open(self.intervals_path, 'w') as file_handle:
+            file_handle.write("1\t30000\t30050\n10\t50000\t50100\n")
+        sampler = self._make_sampler(sample_negative=False)
+        with self.assertRaises(ValueError):
+            sampler.sample(batch_size=2, mode="validate")
+        with self.assertRaises(ValueError):
+            sampler.sample(batch_size=2, mode="train")
+
+    def test_retrieve_skips_sequences_with_many_unknown_bases(self):
+        self.genome_path = write_genome(self.tmp_dir, unknown=(29980, 30020))
+        sampler = self._make_sampler()
+        # the windows of 100 bases have 40, 31, 30 and 0 unknown bases
+        self.assertIsNone(sampler._retrieve("1", 30000))
+        self.assertIsNone(sampler._retrieve("1", 30039))
+        sequence, _ = sampler._retrieve("1", 30040)
+        self.assertEqual(np.sum(sequence.max(axis=1) < 1), 30)
+        self.assertIsNotNone(sampler._retrieve("1", 30100))
+
+    def test_sample(self):
+        sampler = self._make_sampler(without_replacement=True)
+        sequences, targets = sampler.sample(batch_size=8)
+        self.assertEqual(sequences.shape, (8, 100, 4))
+        self.assertEqual(targets.shape, (8, len(FEATURES)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import gzip
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from selene_sdk.samplers import IntervalsSampler
+from selene_sdk.samplers.online_sampler import _DatasetWriter
+from selene_sdk.sequences import Genome
+
+
+FEATURES = ["CTCF", "GABP", "Pbx3", "Pol2", "TBP", "eGFP-FOS"]
+TARGET_PATH = "selene_sdk/targets/tests/files/sorted_aggregate.bed.gz"
+
+
+class Unprintable(object):
+    def __str__(self):
+        raise RuntimeError("cannot format")
+
+
+class TestDatasetWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _rows(self, start, stop):
+        return [["chr1", i, i + 10, "+", "0;2"] for i in range(start, stop)]
+
+    def _expected_lines(self, start, stop):
+        return ["chr1\t{0}\t{1}\t+\t0;2".format(i, i + 10)
+                for i in range(start, stop)]
+
+    def test_write_keeps_order(self):
+        file_path = os.path.join(self.tmp_dir, "train_data.bed")
+        writer = _DatasetWriter(file_path, queue_size=1)
+        for start in range(0, 100, 10):
+            writer.write(self._rows(start, start + 10))
+        writer.write([])
+        writer.close()
+        with open(file_path) as file_handle:
+            lines = file_handle.read().splitlines()
+        self.assertEqual(lines, self._expected_lines(0, 100))
+
+    def test_write_gzip(self):
+        file_path = os.path.join(self.tmp_dir, "train_data.bed.gz")
+        writer = _DatasetWriter(file_path)
+        writer.write(self._rows(0, 5))
+        writer.close()
+        with gzip.open(file_path, "rt") as file_handle:
+            lines = file_handle.read().splitlines()
+        self.assertEqual(lines, self._expected_lines(0, 5))
+
+    def test_error_is_raised(self):
+        file_path = os.path.join(self.tmp_dir, "train_data.bed")
+        writer = _DatasetWriter(file_path)
+        writer.write([["chr1", Unprintable()]])
+        with self.assertRaises(RuntimeError):
+            writer.close()
+
+    def test_write_after_close_raises(self):
+        file_path = os.path.join(self.tmp_dir, "train_data.bed")
+        writer = _DatasetWriter(file_path)
+        writer.write(self._rows(0, 5))
+        writer.close()
+        # closing again has no effect
+        writer.close()
+        writer.write([])
+        with self.assertRaises(ValueError):
+            writer.write(self._rows(5, 10))
+        with open(file_path) as file_handle:
+            lines = file_handle.read().splitlines()
+        self.assertEqual(lines, self._expected_lines(0, 5))
+
+
+class TestOutputBuffers(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        random_state = np.random.RandomState(0)
+        self.genome_path = os.path.join(self.tmp_dir, "genome.fa")
+        with open(self.genome_path, 'w') as file_handle:
+            for chrom in ("1", "10"):
+                sequence = "".join(random_state.choice(list("ACGT"), 20000))
+                file_handle.write(">{0}\n{1}\n".format(chrom, sequence))
+        self.intervals_path = os.path.join(self.tmp_dir, "intervals.bed")
+        with open(self.intervals_path, 'w') as file_handle:
+            file_handle.write("1\t16100\t16200\n1\t17000\t17100\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_sampler(self, **kwargs):
+        return IntervalsSampler(Genome(self.genome_path),
+                                TARGET_PATH,
+                                FEATURES,
+                                self.intervals_path,
+                                sample_negative=True,
+                                seed=3,
+                                validation_holdout=["10"],
+                                test_holdout=[],
+                                sequence_length=100,
+                                center_bin_to_predict=20,
+                                save_datasets=[],
+                                **kwargs)
+
+    def _sample(self, sampler, batch_sizes):
+        return [sampler.sample(batch_size=batch_size)
+                for batch_size in batch_sizes]
+
+    def test_without_buffers(self):
+        batches = self._sample(self._make_sampler(), [4, 4])
+        for sequences, targets in batches:
+            self.assertEqual(sequences.dtype, np.float64)
+            self.assertEqual(targets.dtype, np.float64)
+        self.assertFalse(np.shares_memory(batches[0][0], batches[1][0]))
+
+    def test_buffers_are_reused_in_turn(self):
+        sampler = self._make_sampler(output_buffers=2)
+        batches = self._sample(sampler, [4, 4, 3, 4, 3])
+        for sequences, targets in batches:
+            self.assertEqual(sequences.dtype, np.float32)
+            self.assertEqual(targets.dtype, np.float32)
+            self.assertTrue(sequences.flags["C_CONTIGUOUS"])
+        self.assertEqual(batches[2][0].shape, (3, 100, 4))
+        # each batch size has its own buffers
+        for i, j in [(0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (3, 4)]:
+            self.assertFalse(np.shares_memory(batches[i][0], batches[j][0]))
+            self.assertFalse(np.shares_memory(batches[i][1], batches[j][1]))
+        # the third batch of 4 samples reuses the first buffer
+        self.assertTrue(np.shares_memory(batches[0][0], batches[3][0]))
+        self.assertTrue(np.shares_memory(batches[0][1], batches[3][1]))
+
+    def test_buffers_do_not_change_samples(self):
+        sampler = self._make_sampler(output_buffers=2)
+        buffered = []
+        for _ in range(5):
+            sequences, targets = sampler.sample(batch_size=4)
+            buffered.append((sequences.copy(), targets.copy()))
+        unbuffered = self._sample(self._make_sampler(), [4] * 5)
+        for (sequences, targets), (expected_sequences, expected_targets) in \
+                zip(buffered, unbuffered):
+            np.testing.assert_array_equal(
+                sequences, expected_sequences.astype(np.float32))
+            np.testing.assert_array_equal(
+                targets, expected_targets.astype(np.float32))
+
+    def test_buffers_are_not_pickled(self):
+        sampler = self._make_sampler(output_buffers=2)
+        sampler.sample(batch_size=4)
+        copy = pickle.loads(pickle.dumps(sampler))
+        self.assertEqual(copy._output_buffers, {})
+        sequences, _ = copy.sample(batch_size=4)
+        self.assertEqual(sequences.dtype, np.float32)
+
+
+if __name__ == "__main__":
+    unittest.main()
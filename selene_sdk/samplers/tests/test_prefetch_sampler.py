@@ -0,0 +1,101 @@
+import threading
+import unittest
+
+import numpy as np
+
+from selene_sdk.samplers.prefetch_sampler import PrefetchSampler
+from selene_sdk.samplers.sampler import Sampler
+
+
+class RandomSampler(Sampler):
+    """
+    Draws batches of random numbers from `numpy.random`, and raises a
+    ValueError for the batch of index `fail_at` of each producer.
+    """
+    BASE_MODES = ("train", "validate")
+
+    def __init__(self, fail_at=None):
+        super(RandomSampler, self).__init__([])
+        self.fail_at = fail_at
+        self.n_batches = 0
+
+    def get_feature_from_index(self, index):
+        return str(index)
+
+    def sample(self, batch_size=1, mode=None):
+        self.n_batches += 1
+        if self.n_batches == self.fail_at:
+            raise ValueError("sampling failed")
+        return np.random.random_sample((batch_size, 2)), \
+            np.full((batch_size, 1), self.modes.index(mode))
+
+    def get_data_and_targets(self, batch_size, n_samples=None, mode=None):
+        return [self.sample(batch_size, mode=mode)], None
+
+    def get_validation_set(self, batch_size, n_samples=None):
+        return self.get_data_and_targets(batch_size, mode="validate")
+
+    def get_test_set(self, batch_size, n_samples=None):
+        raise ValueError("no test set")
+
+    def save_dataset_to_file(self, mode, close_filehandle=False):
+        pass
+
+
+class TestPrefetchSampler(unittest.TestCase):
+
+    def _draw(self, sampler, n_batches, mode="train"):
+        return [sampler.sample(batch_size=4, mode=mode)[0]
+                for _ in range(n_batches)]
+
+    def test_sample(self):
+        for num_workers in (0, 2):
+            sampler = PrefetchSampler(
+                RandomSampler(), 4, num_workers=num_workers)
+            sampler.set_mode("train")
+            sequences, targets = sampler.sample(batch_size=4)
+            self.assertEqual(sequences.shape, (4, 2))
+            self.assertSequenceEqual(targets.ravel().tolist(), [0] * 4)
+            sampler.close()
+
+    def test_seed_determines_batches(self):
+        for num_workers in (0, 2):
+            draws = []
+            for _ in range(2):
+                sampler = PrefetchSampler(
+                    RandomSampler(), 4, num_workers=num_workers, seed=7)
+                draws.append(np.stack(self._draw(sampler, 6)))
+                sampler.close()
+            self.assertTrue(np.array_equal(draws[0], draws[1]))
+
+    def test_producer_error_is_raised(self):
+        for num_workers in (0, 2):
+            sampler = PrefetchSampler(
+                RandomSampler(fail_at=2), 4, num_workers=num_workers)
+            with self.assertRaises(ValueError):
+                self._draw(sampler, 10)
+            self.assertNotIn("train", sampler._producers)
+            # the producers are started again, so this does not block
+            self.assertEqual(len(self._draw(sampler, 1)), 1)
+            sampler.close()
+
+    def test_set_mode_stops_other_modes(self):
+        sampler = PrefetchSampler(RandomSampler(), 4)
+        sampler.set_mode("train")
+        self._draw(sampler, 2)
+        workers = sampler._producers["train"]["workers"]
+        sampler.set_mode("validate")
+        self.assertNotIn("train", sampler._producers)
+        self.assertFalse(any(worker.is_alive() for worker in workers))
+        _, targets = sampler.sample(batch_size=4)
+        self.assertSequenceEqual(targets.ravel().tolist(), [1] * 4)
+        self.assertSequenceEqual(list(sampler._producers.keys()),
+                                 ["validate"])
+        sampler.close()
+        self.assertEqual(
+            [thread for thread in threading.enumerate()
+             if thread in workers], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
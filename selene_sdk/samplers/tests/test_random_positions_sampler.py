@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from selene_sdk.samplers import RandomPositionsSampler
+from selene_sdk.sequences import Genome
+
+
+FEATURES = ["CTCF", "GABP", "Pbx3", "Pol2", "TBP", "eGFP-FOS"]
+TARGET_PATH = "selene_sdk/targets/tests/files/sorted_aggregate.bed.gz"
+
+
+class TestRandomPositionsSampler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.genome_path = os.path.join(self.tmp_dir, "genome.fa")
+        self.blacklist_path = os.path.join(self.tmp_dir, "blacklist.bed")
+        self.valid_positions_path = os.path.join(
+            self.tmp_dir, "valid_positions.npz")
+        self.sequences = {
+            chrom: "".join(np.random.RandomState(0).choice(
+                list("ACGT"), 2000))
+            for chrom in ("1", "10")}
+        self._write_genome()
+        self._write_blacklist(500, 600)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_genome(self):
+        with open(self.genome_path, 'w') as file_handle:
+            for chrom, sequence in self.sequences.items():
+                file_handle.write(">{0}\n{1}\n".format(chrom, sequence))
+        self._touch(self.genome_path)
+
+    def _write_blacklist(self, start, end):
+        with open(self.blacklist_path, 'w') as file_handle:
+            file_handle.write("1\t{0}\t{1}\n".format(start, end))
+        self._touch(self.blacklist_path)
+
+    def _touch(self, path):
+        # the files are rewritten within the resolution of some file
+        # systems' modification times
+        self._n_touched = getattr(self, "_n_touched", 0) + 1
+        os.utime(path, ns=(0, self._n_touched * 10 ** 9))
+
+    def _get_valid_runs(self):
+        sampler = RandomPositionsSampler(
+            Genome(self.genome_path,
+                   blacklist_regions=self.blacklist_path,
+                   blacklist_in_memory=True),
+            TARGET_PATH,
+            FEATURES,
+            validation_holdout=["10"],
+            test_holdout=[],
+            sequence_length=100,
+            center_bin_to_predict=20,
+            valid_positions_path=self.valid_positions_path)
+        sequences, _ = sampler.sample(batch_size=4)
+        self.assertEqual(sequences.shape, (4, 100, 4))
+        with np.load(self.valid_positions_path) as runs:
+            offsets = runs["chrom_offsets"]
+            return list(zip(runs["run_starts"][offsets[0]:offsets[1]],
+                            runs["run_ends"][offsets[0]:offsets[1]]))
+
+    def test_valid_positions_exclude_blacklist(self):
+        runs = self._get_valid_runs()
+        # positions are drawn from [100, 1900), and the windows
+        # [p - 50, p + 50) overlap [500, 600) for p in [451, 650)
+        self.assertEqual(runs, [(100, 451), (650, 1900)])
+
+    def test_valid_positions_are_rebuilt_if_blacklist_changes(self):
+        self._get_valid_runs()
+        self._write_blacklist(1000, 1100)
+        self.assertEqual(self._get_valid_runs(), [(100, 951), (1150, 1900)])
+
+    def test_valid_positions_are_rebuilt_if_sequence_changes(self):
+        self._get_valid_runs()
+        sequence = self.sequences["1"]
+        self.sequences["1"] = sequence[:1200] + "N" * 100 + sequence[1300:]
+        self._write_genome()
+        # windows with more than 30 unknown bases are not sampled
+        self.assertEqual(self._get_valid_runs(),
+                         [(100, 451), (650, 1181), (1320, 1900)])
+
+
+if __name__ == "__main__":
+    unittest.main()
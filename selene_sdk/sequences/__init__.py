@@ -4,9 +4,15 @@ This module provides the types for representing biological sequences.
 from .sequence import Sequence
 from .sequence import sequence_to_encoding
 from .sequence import encoding_to_sequence
+from .sequence import encodings_to_sequences
 from .sequence import get_reverse_encoding
+from .sequence import reverse_complement_encoding
 from .genome import Genome
+from .packed_genome import PackedGenome
+from .onehot_genome import OneHotGenome
 from .proteome import Proteome
 
-__all__ = ["Sequence", "Genome", "Proteome", "sequence_to_encoding",
-           "encoding_to_sequence", "get_reverse_encoding"]
+__all__ = ["Sequence", "Genome", "PackedGenome", "OneHotGenome", "Proteome",
+           "sequence_to_encoding", "encoding_to_sequence",
+           "encodings_to_sequences", "get_reverse_encoding",
+           "reverse_complement_encoding"]
@@ -5,21 +5,142 @@ cimport cython
 cimport numpy as np
 
 ctypedef np.float32_t FDTYPE_t
+ctypedef np.int8_t LDTYPE_t
 
 @cython.boundscheck(False) # turn off bounds-checking for entire function
 @cython.wraparound(False)  # turn off negative index wrapping for entire function
-def _fast_sequence_to_encoding(str sequence, dict base_to_index, int bases_size):
-    cdef int sequence_len = len(sequence)
-    cdef np.ndarray[FDTYPE_t, ndim=2] encoding = np.zeros(
-        (sequence_len, bases_size), dtype=np.float32)
-    cdef int index
-    cdef str base
-    cdef FDTYPE_t n_fill = np.divide(1, bases_size, dtype=np.float32)
+cdef int _encode_bytes(const unsigned char[:] sequence,
+                       const LDTYPE_t[:] lookup_table,
+                       FDTYPE_t[:, :] encoding) nogil:
+    cdef Py_ssize_t sequence_len = sequence.shape[0]
+    cdef Py_ssize_t bases_size = encoding.shape[1]
+    cdef Py_ssize_t index, col
+    cdef LDTYPE_t base_index
+    cdef FDTYPE_t n_fill = 1.0 / bases_size
+    cdef int n_unknown = 0
 
     for index in range(sequence_len):
-        base = sequence[index]
-        if base in base_to_index:
-            encoding[index, base_to_index[base]] = 1
+        base_index = lookup_table[sequence[index]]
+        if base_index >= 0:
+            for col in range(bases_size):
+                encoding[index, col] = 0
+            encoding[index, base_index] = 1
         else:
-            encoding[index, :] = n_fill
+            for col in range(bases_size):
+                encoding[index, col] = n_fill
+            n_unknown += 1
+    return n_unknown
+
+
+def _fast_sequence_to_encoding(str sequence,
+                               const LDTYPE_t[:] lookup_table,
+                               int bases_size):
+    cdef np.ndarray[FDTYPE_t, ndim=2] encoding = np.empty(
+        (len(sequence), bases_size), dtype=np.float32)
+    _fast_sequence_into_encoding(sequence, lookup_table, encoding)
     return encoding
+
+
+def _fast_sequence_into_encoding(str sequence,
+                                 const LDTYPE_t[:] lookup_table,
+                                 FDTYPE_t[:, :] encoding):
+    # characters outside of the ASCII range are never part of an
+    # alphabet, so they are replaced by '?' and encoded as unknown
+    cdef bytes sequence_bytes = sequence.encode("ascii", "replace")
+    cdef const unsigned char[:] sequence_view = sequence_bytes
+    cdef int n_unknown
+    if encoding.shape[0] != sequence_view.shape[0]:
+        raise ValueError(
+            "Encoding buffer has {0} rows but the sequence has length "
+            "{1}.".format(encoding.shape[0], sequence_view.shape[0]))
+    with nogil:
+        n_unknown = _encode_bytes(sequence_view, lookup_table, encoding)
+    return n_unknown
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def _fast_unpack_codes(const unsigned char[:] data,
+                       Py_ssize_t bases_offset,
+                       Py_ssize_t mask_offset,
+                       Py_ssize_t start,
+                       Py_ssize_t end,
+                       bint reverse_complement,
+                       unsigned char unk_code,
+                       unsigned char[:] codes):
+    # decodes 2-bit packed bases (4 per byte, most significant bits
+    # first) and the N-mask (8 per byte) for positions [start, end)
+    cdef Py_ssize_t n_bases = end - start
+    cdef Py_ssize_t index, position, out_index
+    cdef unsigned char code
+    with nogil:
+        for index in range(n_bases):
+            position = start + index
+            if (data[mask_offset + position // 8] >>
+                    (7 - position % 8)) & 1:
+                code = unk_code
+            else:
+                code = (data[bases_offset + position // 4] >>
+                        (6 - 2 * (position % 4))) & 3
+            if reverse_complement:
+                out_index = n_bases - index - 1
+                if code != unk_code:
+                    code = 3 - code
+            else:
+                out_index = index
+            codes[out_index] = code
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _fast_codes_into_encoding(const unsigned char[:] codes,
+                              const FDTYPE_t[:, :] code_encodings,
+                              unsigned char unk_code,
+                              FDTYPE_t[:, :] encoding):
+    cdef Py_ssize_t sequence_len = codes.shape[0]
+    cdef Py_ssize_t bases_size = encoding.shape[1]
+    cdef Py_ssize_t index, col
+    cdef int n_unknown = 0
+    if encoding.shape[0] != sequence_len:
+        raise ValueError(
+            "Encoding buffer has {0} rows but the sequence has length "
+            "{1}.".format(encoding.shape[0], sequence_len))
+    with nogil:
+        for index in range(sequence_len):
+            if codes[index] == unk_code:
+                n_unknown += 1
+            for col in range(bases_size):
+                encoding[index, col] = code_encodings[codes[index], col]
+    return n_unknown
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _fast_onehot_into_encoding(const unsigned char[:, :] onehot,
+                               const Py_ssize_t[:] columns,
+                               FDTYPE_t[:, :] encoding):
+    # converts uint8 one-hot rows (all zeros for unknown bases) to
+    # float32, reading column `columns[col]` into column `col`
+    cdef Py_ssize_t sequence_len = onehot.shape[0]
+    cdef Py_ssize_t bases_size = encoding.shape[1]
+    cdef Py_ssize_t index, col
+    cdef FDTYPE_t n_fill = 1.0 / bases_size
+    cdef int n_unknown = 0
+    cdef unsigned char value, row_sum
+    if encoding.shape[0] != sequence_len:
+        raise ValueError(
+            "Encoding buffer has {0} rows but the sequence has length "
+            "{1}.".format(encoding.shape[0], sequence_len))
+    with nogil:
+        for index in range(sequence_len):
+            row_sum = 0
+            for col in range(bases_size):
+                value = onehot[index, columns[col]]
+                encoding[index, col] = value
+                row_sum |= value
+            if row_sum == 0:
+                for col in range(bases_size):
+                    encoding[index, col] = n_fill
+                n_unknown += 1
+    return n_unknown
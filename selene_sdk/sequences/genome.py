@@ -5,6 +5,11 @@ parts of the sequence and converting these parts into their one-hot
 encodings.
 
 """
+import gzip
+import os
+from bisect import bisect_left
+
+import numpy as np
 import pkg_resources
 import pyfaidx
 import tabix
@@ -13,6 +18,128 @@ from functools import wraps
 from .sequence import Sequence
 from .sequence import sequence_to_encoding
 from .sequence import encoding_to_sequence
+from .sequence import encodings_to_sequences
+from .sequence import get_lookup_table
+from ._sequence import _fast_sequence_into_encoding
+
+class _BlacklistIndex(object):
+    """
+    An in-memory index of blacklist regions, loaded once from a BED file
+    into per-chromosome sorted arrays. Overlapping regions are merged,
+    so that checking whether a region overlaps the blacklist is a single
+    binary search.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to a BED file (optionally gzipped) of blacklist regions.
+
+    """
+
+    def __init__(self, input_path):
+        intervals = {}
+        open_file = gzip.open if input_path.endswith(".gz") else open
+        with open_file(input_path, 'rt') as file_handle:
+            for line in file_handle:
+                if line.startswith(("#", "track", "browser")) or \
+                        not line.strip():
+                    continue
+                cols = line.split('\t')
+                intervals.setdefault(cols[0], []).append(
+                    (int(cols[1]), int(cols[2])))
+
+        self._starts = {}
+        self._ends = {}
+        for chrom, chrom_intervals in intervals.items():
+            merged = []
+            for start, end in sorted(chrom_intervals):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            # lists are faster than arrays for single queries
+            self._starts[chrom] = [start for (start, _) in merged]
+            self._ends[chrom] = [end for (_, end) in merged]
+
+    def overlaps(self, chrom, start, end):
+        """
+        Checks whether the region `[start, end)` on `chrom` overlaps any
+        blacklist region.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome, e.g. "chr1".
+        start : int
+            The 0-based start coordinate of the region.
+        end : int
+            One past the last coordinate of the region.
+
+        Returns
+        -------
+        bool
+            Whether the region overlaps a blacklist region.
+
+        """
+        if chrom not in self._starts:
+            return False
+        # the last blacklist region starting before `end` is the only
+        # one that can overlap, since merged regions do not overlap
+        index = bisect_left(self._starts[chrom], end) - 1
+        return index >= 0 and self._ends[chrom][index] > start
+
+    def get_intervals(self, chrom):
+        """
+        Gets the merged blacklist regions on `chrom`.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome, e.g. "chr1".
+
+        Returns
+        -------
+        starts, ends : tuple(numpy.ndarray, numpy.ndarray)
+            The sorted, non-overlapping regions `[starts[i], ends[i])`.
+
+        """
+        return (np.asarray(self._starts.get(chrom, []), dtype=np.int64),
+                np.asarray(self._ends.get(chrom, []), dtype=np.int64))
+
+    def overlaps_batch(self, chroms, starts, ends):
+        """
+        Checks whether each region `[starts[i], ends[i])` on `chroms[i]`
+        overlaps any blacklist region.
+
+        Parameters
+        ----------
+        chroms : list(str) or numpy.ndarray
+            The names of the chromosomes, one per region.
+        starts : list(int) or numpy.ndarray
+            The 0-based start coordinates of the regions.
+        ends : list(int) or numpy.ndarray
+            One past the last coordinates of the regions.
+
+        Returns
+        -------
+        numpy.ndarray, dtype=bool
+            Whether each region overlaps a blacklist region.
+
+        """
+        chroms = np.asarray(chroms)
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+        overlaps = np.zeros(len(chroms), dtype=bool)
+        for chrom in np.unique(chroms):
+            if chrom not in self._starts:
+                continue
+            rows = np.nonzero(chroms == chrom)[0]
+            index = np.searchsorted(
+                self._starts[chrom], ends[rows], side="left") - 1
+            chrom_ends = np.asarray(self._ends[chrom])
+            overlaps[rows] = (index >= 0) & (chrom_ends[index] > starts[rows])
+        return overlaps
+
 
 def _not_blacklist_region(chrom, start, end, blacklist_tabix):
     """
@@ -26,9 +153,9 @@ def _not_blacklist_region(chrom, start, end, blacklist_tabix):
         The 0-based start coordinate of the sequence.
     end : int
         One past the last coordinate of the sequence.
-    blacklist_tabix : tabix.open or None, optional
-        Default is `None`. Tabix file handle if a file of blacklist regions
-        is available.
+    blacklist_tabix : tabix.open or _BlacklistIndex or None, optional
+        Default is `None`. Tabix file handle or in-memory index if a file
+        of blacklist regions is available.
 
     Returns
     -------
@@ -38,6 +165,8 @@ def _not_blacklist_region(chrom, start, end, blacklist_tabix):
 
 
     """
+    if isinstance(blacklist_tabix, _BlacklistIndex):
+        return not blacklist_tabix.overlaps(chrom, start, end)
     if blacklist_tabix is not None:
         try:
             rows = blacklist_tabix.query(chrom, start, end)
@@ -48,6 +177,33 @@ def _not_blacklist_region(chrom, start, end, blacklist_tabix):
     return True
 
 
+def _get_fasta_signature(input_path):
+    """
+    Returns the line that identifies the current version of the FASTA
+    file `input_path` (its size and modification time) in the index of
+    a file built from it.
+    """
+    stat = os.stat(input_path)
+    return "#source\t{0}\t{1}".format(stat.st_size, stat.st_mtime_ns)
+
+
+def _is_built_from_current_fasta(input_path, output_path):
+    """
+    Returns whether the file `output_path` and its index
+    `<output_path>.idx` exist and were built from the current version of
+    the FASTA file `input_path`. A file whose FASTA file does not exist
+    anymore is used as is.
+    """
+    index_path = "{0}.idx".format(output_path)
+    if not os.path.exists(output_path) or not os.path.exists(index_path):
+        return False
+    if not os.path.exists(input_path):
+        return True
+    with open(index_path, 'r') as file_handle:
+        signature = file_handle.readline().rstrip('\n')
+    return signature == _get_fasta_signature(input_path)
+
+
 def _check_coords(len_chrs,
                   chrom,
                   start,
@@ -197,6 +353,11 @@ class Genome(Sequence):
         DataLoader. Set `init_unpicklable` to True if you are using this class
         directly through Selene's API and want to access class attributes
         without having to call on a specific method in Genome.
+    blacklist_in_memory : bool, optional
+        Default is False. Load `blacklist_regions` into memory once
+        instead of querying the tabix-indexed file for every region.
+        Overlap checks then become a binary search over per-chromosome
+        sorted arrays. Any BED file, gzipped or not, can be used.
 
     Attributes
     ----------
@@ -254,13 +415,15 @@ class Genome(Sequence):
     from the alphabet, but we are uncertain which.
     """
 
-    def __init__(self, input_path, blacklist_regions=None, bases_order=None, init_unpicklable=False):
+    def __init__(self, input_path, blacklist_regions=None, bases_order=None, init_unpicklable=False,
+                 blacklist_in_memory=False):
         """
         Constructs a `Genome` object.
         """
 
         self.input_path = input_path
         self.blacklist_regions = blacklist_regions
+        self.blacklist_in_memory = blacklist_in_memory
         self._initialized =False
 
         if bases_order is not None:
@@ -290,23 +453,41 @@ class Genome(Sequence):
             self.genome = pyfaidx.Fasta(self.input_path)
             self.chrs = sorted(self.genome.keys())
             self.len_chrs = self._get_len_chrs()
-            self._blacklist_tabix = None
-
-            if self.blacklist_regions == "hg19":
-                self._blacklist_tabix = tabix.open(
-                    pkg_resources.resource_filename(
-                        "selene_sdk",
-                        "sequences/data/hg19_blacklist_ENCFF001TDO.bed.gz"))
-            elif self.blacklist_regions == "hg38":
-                self._blacklist_tabix = tabix.open(
-                    pkg_resources.resource_filename(
-                        "selene_sdk",
-                        "sequences/data/hg38.blacklist.bed.gz"))
-            elif self.blacklist_regions is not None:  # user-specified file
-                self._blacklist_tabix = tabix.open(
-                    self.blacklist_regions)
+            self._init_blacklist()
             self._initialized = True
 
+    def __getstate__(self):
+        # open file handles are not shared with other processes, since
+        # their file offsets would be; they are reopened when needed
+        state = self.__dict__.copy()
+        for attr in ("genome", "_data", "_blacklist_tabix"):
+            state.pop(attr, None)
+        state["_initialized"] = False
+        return state
+
+    def _get_blacklist_path(self):
+        if self.blacklist_regions == "hg19":
+            return pkg_resources.resource_filename(
+                "selene_sdk",
+                "sequences/data/hg19_blacklist_ENCFF001TDO.bed.gz")
+        elif self.blacklist_regions == "hg38":
+            return pkg_resources.resource_filename(
+                "selene_sdk",
+                "sequences/data/hg38.blacklist.bed.gz")
+        # user-specified file or None
+        return self.blacklist_regions
+
+    def _init_blacklist(self):
+        self._blacklist_tabix = None
+        blacklist_path = self._get_blacklist_path()
+        if blacklist_path is None:
+            return
+
+        if self.blacklist_in_memory:
+            self._blacklist_tabix = _BlacklistIndex(blacklist_path)
+        else:
+            self._blacklist_tabix = tabix.open(blacklist_path)
+
     def init(func):
         # delay initialization to allow  multiprocessing
         @wraps(func)
@@ -433,6 +614,78 @@ class Genome(Sequence):
                                          pad=pad,
                                          blacklist_tabix=self._blacklist_tabix)
 
+    @init
+    def get_blacklist_intervals(self, chrom):
+        """Gets the blacklist regions on a chromosome, merged so that
+        they do not overlap.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome, e.g. "chr1".
+
+        Returns
+        -------
+        starts, ends : tuple(numpy.ndarray, numpy.ndarray)
+            The sorted regions `[starts[i], ends[i])`. Both arrays are
+            empty if there are no blacklist regions.
+
+        """
+        if self._blacklist_tabix is None:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        if not isinstance(self._blacklist_tabix, _BlacklistIndex):
+            # the whole file is only loaded when it is needed here
+            self._blacklist_tabix = _BlacklistIndex(self._get_blacklist_path())
+        return self._blacklist_tabix.get_intervals(chrom)
+
+    @init
+    def get_unknown_mask_from_coords(self, chrom, start, end, chunk_size=2**22):
+        """Finds the unknown bases (those that are encoded as unknown by
+        `get_encoding_from_coords`) in a region of a chromosome. The
+        blacklist is not checked, so that whole chromosomes can be
+        scanned.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome, e.g. "chr1".
+        start : int
+            The 0-based start coordinate of the region.
+        end : int
+            One past the 0-based last position in the region. Must not
+            be greater than the length of `chrom`.
+        chunk_size : int, optional
+            Default is 2**22. The number of bases read at a time.
+
+        Returns
+        -------
+        numpy.ndarray, dtype=bool
+            An array of length `end - start` that is `True` at the
+            unknown bases.
+
+        Raises
+        ------
+        ValueError
+            If `chrom` is not in the genome, or the region is not within
+            its bounds.
+
+        """
+        if chrom not in self.len_chrs or \
+                not 0 <= start <= end <= self.len_chrs[chrom]:
+            raise ValueError(
+                "The region {0}:{1}-{2} is not within the bounds of the "
+                "chromosome.".format(chrom, start, end))
+        lookup_table = get_lookup_table(self.BASE_TO_INDEX)
+        mask = np.empty(end - start, dtype=bool)
+        for chunk_start in range(start, end, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, end)
+            sequence = self._genome_sequence(chrom, chunk_start, chunk_end)
+            codes = np.frombuffer(
+                sequence.encode("ascii", "replace"), dtype=np.uint8)
+            mask[chunk_start - start:chunk_end - start] = \
+                lookup_table[codes] < 0
+        return mask
+
     @init
     def get_encoding_from_coords(self,
                                  chrom,
@@ -480,9 +733,8 @@ class Genome(Sequence):
             (Raised in the call to `self.get_sequence_from_coords`)
 
         """
-        sequence = self.get_sequence_from_coords(
+        encoding, _ = self._get_encoding_and_sequence(
             chrom, start, end, strand=strand, pad=pad)
-        encoding = self.sequence_to_encoding(sequence)
         return encoding
 
     @init
@@ -536,11 +788,162 @@ class Genome(Sequence):
             choices.
             (Raised in the call to `self.get_sequence_from_coords`)
         """
-        sequence = self.get_sequence_from_coords(
+        encoding, sequence = self._get_encoding_and_sequence(
             chrom, start, end, strand=strand, pad=pad)
-        encoding = self.sequence_to_encoding(sequence)
         return encoding, self.UNK_BASE in sequence
 
+    @init
+    def get_encodings_from_coords(self,
+                                  chroms,
+                                  starts,
+                                  ends,
+                                  strands=None,
+                                  pad=False,
+                                  out=None):
+        """Gets the one-hot encodings of a batch of genomic sequences,
+        writing them directly into a single :math:`B \\times L \\times 4`
+        array. All queried regions must have the same length
+        :math:`L`.
+
+        Parameters
+        ----------
+        chroms : list(str) or numpy.ndarray
+            The names of the chromosomes, e.g. "chr1", one per region.
+        starts : list(int) or numpy.ndarray
+            The 0-based start coordinates of the regions.
+        ends : list(int) or numpy.ndarray
+            One past the 0-based last positions of the regions.
+        strands : list(str) or numpy.ndarray or None, optional
+            Default is None (every region is on the '+' strand). The
+            strand of each region, one of {'+', '-', '.'}. '.' is
+            treated as '+'.
+        pad : bool, optional
+            Default is `False`. Pad the output sequences with 'N' if
+            `start` and/or `end` are out of bounds.
+        out : numpy.ndarray or None, optional
+            Default is None. A preallocated, writable `numpy.float32`
+            array of shape :math:`B \\times L \\times 4` to write the
+            encodings into. If None, a new array is allocated.
+
+        Returns
+        -------
+        encodings, valid, n_unknown : \
+        tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+            * `encodings` is the :math:`B \\times L \\times 4` array of\
+            encodings (`out`, if it was specified).
+            * `valid` is a boolean array of length :math:`B`. It is\
+            `False` for a region that could not be retrieved--i.e.\
+            `chrom` is not in the FASTA file, the coordinates are out of\
+            bounds, or the region overlaps with a blacklist region. The\
+            rows for these regions are filled with zeros.
+            * `n_unknown` is an integer array of length :math:`B` with\
+            the number of unknown bases (including padding) in each\
+            region.
+
+        Raises
+        ------
+        ValueError
+            If the regions do not all have the same length, if `out` does
+            not have the expected shape, or if a strand is not one of the
+            specified choices.
+
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        n_regions = len(chroms)
+        lengths = np.unique(ends - starts)
+        if len(lengths) > 1:
+            raise ValueError(
+                "All regions must have the same length, but found lengths "
+                "{0}.".format(lengths.tolist()))
+        sequence_length = int(lengths[0]) if n_regions else 0
+        if out is None:
+            out = np.zeros((n_regions, sequence_length, len(self.BASES_ARR)),
+                           dtype=np.float32)
+        elif out.shape != (n_regions, sequence_length, len(self.BASES_ARR)):
+            raise ValueError(
+                "Expected `out` to have shape {0} but it has shape "
+                "{1}.".format(
+                    (n_regions, sequence_length, len(self.BASES_ARR)),
+                    out.shape))
+        valid = np.zeros(n_regions, dtype=bool)
+        n_unknown = np.zeros(n_regions, dtype=np.int64)
+        for i in range(n_regions):
+            strand = '+' if strands is None else strands[i]
+            n_unknown_row = self._encoding_into(
+                chroms[i], int(starts[i]), int(ends[i]), strand, pad, out[i])
+            if n_unknown_row is None:
+                out[i] = 0
+                continue
+            n_unknown[i] = n_unknown_row
+            valid[i] = True
+        return out, valid, n_unknown
+
+    def _encoding_into(self, chrom, start, end, strand, pad, out):
+        """
+        Writes the encoding of a single region into `out`. Returns the
+        number of unknown bases in the region, or None if the region
+        could not be retrieved.
+        """
+        sequence, n_unknown = self._sequence_encoding_into(
+            chrom, start, end, strand, pad, out)
+        if not sequence:
+            return None
+        return n_unknown
+
+    def _get_encoding_and_sequence(self, chrom, start, end, strand, pad):
+        """
+        Returns the encoding of a single region (empty if the region
+        could not be retrieved) and its forward-strand sequence.
+        """
+        encoding = np.empty((max(end - start, 0), len(self.BASES_ARR)),
+                            dtype=np.float32)
+        sequence, _ = self._sequence_encoding_into(
+            chrom, start, end, strand, pad, encoding)
+        if not sequence:
+            encoding = encoding[:0]
+        return encoding, sequence
+
+    def _sequence_encoding_into(self, chrom, start, end, strand, pad, out):
+        """
+        Writes the encoding of a single region into `out`, and returns
+        the forward-strand sequence of the region (empty if the region
+        could not be retrieved) along with its number of unknown bases.
+        The '-' strand is encoded by writing the forward-strand sequence
+        backwards through a complemented lookup table, instead of
+        building its reverse complement string.
+        """
+        if strand != '-':
+            sequence = self.get_sequence_from_coords(
+                chrom, start, end, strand=strand, pad=pad)
+            if not sequence:
+                return sequence, 0
+            return sequence, _fast_sequence_into_encoding(
+                sequence, get_lookup_table(self.BASE_TO_INDEX), out)
+
+        sequence = self.get_sequence_from_coords(
+            chrom, start, end, strand='+', pad=pad)
+        if not sequence:
+            return sequence, 0
+        # padding stays at the ends where `get_sequence_from_coords` puts it
+        start_pad = max(0, -start)
+        end_pad = max(0, end - self.len_chrs[chrom])
+        n_unknown = _fast_sequence_into_encoding(
+            sequence[start_pad:len(sequence) - end_pad],
+            get_lookup_table(self._get_complement_base_to_index()),
+            out[start_pad:len(out) - end_pad][::-1])
+        out[:start_pad] = 1 / len(self.BASES_ARR)
+        out[len(out) - end_pad:] = 1 / len(self.BASES_ARR)
+        return sequence, n_unknown + start_pad + end_pad
+
+    def _get_complement_base_to_index(self):
+        """
+        Returns a dict that maps each base to the column of its
+        complementary base in the encoding.
+        """
+        return {b: self.BASE_TO_INDEX[c]
+                for (b, c) in self.COMPLEMENTARY_BASE_DICT.items()
+                if c in self.BASE_TO_INDEX}
 
     @classmethod
     def sequence_to_encoding(cls, sequence):
@@ -577,3 +980,24 @@ class Genome(Sequence):
 
         """
         return encoding_to_sequence(encoding, cls.BASES_ARR, cls.UNK_BASE)
+
+    @classmethod
+    def encodings_to_sequences(cls, encodings, as_bytes=False):
+        """Converts a batch of one-hot encodings to their DNA sequences.
+
+        Parameters
+        ----------
+        encodings : numpy.ndarray, dtype=numpy.float32
+            A :math:`B \\times L \\times 4` batch of one-hot encodings.
+        as_bytes : bool, optional
+            Default is False. Return a :math:`B \\times L` `numpy.uint8`
+            array of character codes instead of a list of strings.
+
+        Returns
+        -------
+        list(str) or numpy.ndarray, dtype=numpy.uint8
+            The :math:`B` sequences decoded from the input array.
+
+        """
+        return encodings_to_sequences(
+            encodings, cls.BASES_ARR, cls.UNK_BASE, as_bytes=as_bytes)
@@ -0,0 +1,404 @@
+"""
+This module provides the `OneHotGenome` class. This class stores the
+one-hot encoding of an organism's whole genome in a memory-mapped
+`numpy.uint8` file that is created once from an indexed FASTA file.
+Encodings are read from the memory-mapped file as views, so neither the
+FASTA file nor the encoding step is on the sampling hot path.
+
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+import pyfaidx
+
+from .genome import Genome
+from .genome import _check_coords
+from .genome import _get_fasta_signature
+from .genome import _is_built_from_current_fasta
+from .sequence import get_lookup_table
+from ._sequence import _fast_onehot_into_encoding
+
+
+ONEHOT_BASES = "ACGT"
+"""
+The order of the columns in the one-hot encoded file. Unknown bases are
+stored as rows of zeros.
+"""
+
+_CHUNK_SIZE = 2 ** 24
+
+
+@lru_cache(maxsize=None)
+def _get_columns(bases_arr, reverse_complement):
+    """
+    Returns the columns of the encoded file to read for each column of
+    an encoding with the base ordering `bases_arr` (complemented if
+    `reverse_complement`), both as a read-only array and as an index
+    that selects them from a view without copying when possible.
+    """
+    if reverse_complement:
+        bases_arr = [Genome.COMPLEMENTARY_BASE_DICT[b] for b in bases_arr]
+    columns = np.array([ONEHOT_BASES.index(b) for b in bases_arr],
+                       dtype=np.intp)
+    columns.setflags(write=False)
+    in_order = np.arange(len(ONEHOT_BASES))
+    if np.array_equal(columns, in_order):
+        column_index = slice(None)
+    elif np.array_equal(columns, in_order[::-1]):
+        column_index = slice(None, None, -1)
+    else:
+        column_index = columns
+    return columns, column_index
+
+
+def _read_onehot_index(index_path):
+    """
+    Reads the index written by `onehot_encode_fasta`.
+
+    Returns
+    -------
+    len_chrs, offsets : tuple(dict, dict)
+        A dictionary mapping chromosome names to lengths, and a
+        dictionary mapping chromosome names to the row of the encoded
+        file at which each chromosome starts.
+
+    """
+    len_chrs = {}
+    offsets = {}
+    with open(index_path, 'r') as file_handle:
+        for line in file_handle:
+            if line.startswith('#'):
+                continue
+            chrom, length, offset = line.rstrip('\n').split('\t')
+            len_chrs[chrom] = int(length)
+            offsets[chrom] = int(offset)
+    return len_chrs, offsets
+
+
+def onehot_encode_fasta(input_path, output_path):
+    """
+    Converts an indexed FASTA file into a file of one-hot encoded rows,
+    along with an index file `<output_path>.idx`. Each base is stored as
+    4 `numpy.uint8` values in the column order `ONEHOT_BASES`; any base
+    that is not one of `A`, `C`, `G`, `T` (upper or lowercase) is stored
+    as a row of zeros.
+
+    The index is a tab-separated file with the columns
+    `[chrom, length, offset]`, where `offset` is the row at which the
+    chromosome starts, preceded by a `#source` line that records the
+    size and modification time of `input_path`.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to an indexed FASTA file.
+    output_path : str
+        Path to the encoded file to create.
+
+    """
+    base_to_index = {}
+    for index, base in enumerate(ONEHOT_BASES):
+        base_to_index[base] = index
+        base_to_index[base.lower()] = index
+    lookup_table = get_lookup_table(base_to_index)
+    columns = np.arange(len(ONEHOT_BASES), dtype=np.int8)
+
+    signature = _get_fasta_signature(input_path)
+    fasta = pyfaidx.Fasta(input_path)
+    index_rows = []
+    offset = 0
+    tmp_path = "{0}.{1}.tmp".format(output_path, os.getpid())
+    with open(tmp_path, 'wb') as file_handle:
+        for chrom in sorted(fasta.keys()):
+            len_chrom = len(fasta[chrom])
+            index_rows.append((chrom, len_chrom, offset))
+            for chunk_start in range(0, len_chrom, _CHUNK_SIZE):
+                chunk_end = min(chunk_start + _CHUNK_SIZE, len_chrom)
+                sequence = fasta[chrom][chunk_start:chunk_end].seq
+                indices = lookup_table[np.frombuffer(
+                    sequence.encode("ascii", "replace"), dtype=np.uint8)]
+                onehot = (indices[:, None] == columns).astype(np.uint8)
+                file_handle.write(onehot.tobytes())
+            offset += len_chrom
+    fasta.close()
+
+    # the index is written last, so that an encoded file is only used
+    # once it has been fully written
+    index_path = "{0}.idx".format(output_path)
+    tmp_index_path = "{0}.{1}.tmp".format(index_path, os.getpid())
+    with open(tmp_index_path, 'w') as file_handle:
+        file_handle.write("{0}\n".format(signature))
+        for row in index_rows:
+            file_handle.write("{0}\n".format('\t'.join(str(c) for c in row)))
+    os.replace(tmp_path, output_path)
+    os.replace(tmp_index_path, index_path)
+
+
+class OneHotGenome(Genome):
+    """This class provides access to an organism's genomic sequence
+    together with a precomputed, memory-mapped one-hot encoding of the
+    whole genome.
+
+    The encoded file is created from `input_path` the first time a
+    `OneHotGenome` is constructed for it (see `onehot_encode_fasta`) and
+    is reused afterwards, until the FASTA file is modified. It takes 4
+    bytes per base (about 12 GB for hg38). Encodings are converted from
+    views of the memory-mapped file instead of being read from the FASTA
+    file and encoded, and `get_onehot_view_from_coords` returns the
+    stored `numpy.uint8` encoding without copying it. Sequences are
+    still read from the FASTA file.
+
+    `OneHotGenome` can be used anywhere a `Genome` is expected, and its
+    encodings are the same as those from `Genome`.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to an indexed FASTA file, that is, a `*.fasta` file with
+        a corresponding `*.fai` file in the same directory.
+    encoded_path : str or None, optional
+        Default is None (use `<input_path>.onehot`). Path to the encoded
+        file. Its index is stored at `<encoded_path>.idx`.
+    blacklist_regions : str or None, optional
+        Default is None. See `selene_sdk.sequences.Genome`.
+    bases_order : list(str) or None, optional
+        Default is None. See `selene_sdk.sequences.Genome`. The encoded
+        file does not depend on the base ordering.
+    init_unpicklable : bool, optional
+        Default is False. See `selene_sdk.sequences.Genome`.
+    blacklist_in_memory : bool, optional
+        Default is False. See `selene_sdk.sequences.Genome`.
+
+    Attributes
+    ----------
+    genome : pyfaidx.Fasta
+        The FASTA file containing the genome sequence.
+    encoded_path : str
+        The path to the encoded file.
+    chrs : list(str)
+        The list of chromosome names.
+    len_chrs : dict
+        A dictionary mapping the names of each chromosome in the file to
+        the length of said chromosome.
+
+    """
+
+    def __init__(self,
+                 input_path,
+                 encoded_path=None,
+                 blacklist_regions=None,
+                 bases_order=None,
+                 init_unpicklable=False,
+                 blacklist_in_memory=False):
+        """
+        Constructs a `OneHotGenome` object.
+        """
+        if encoded_path is None:
+            encoded_path = "{0}.onehot".format(input_path)
+        self.encoded_path = encoded_path
+        if not _is_built_from_current_fasta(input_path, self.encoded_path):
+            onehot_encode_fasta(input_path, self.encoded_path)
+
+        super(OneHotGenome, self).__init__(
+            input_path,
+            blacklist_regions=blacklist_regions,
+            bases_order=bases_order,
+            init_unpicklable=init_unpicklable,
+            blacklist_in_memory=blacklist_in_memory)
+
+    def _unpicklable_init(self):
+        if not self._initialized:
+            len_chrs, self._offsets = _read_onehot_index(
+                "{0}.idx".format(self.encoded_path))
+            n_rows = sum(len_chrs.values())
+            # slicing a plain ndarray view of the memory map is much
+            # cheaper than slicing the `numpy.memmap` itself
+            self._data = np.memmap(self.encoded_path,
+                                   dtype=np.uint8,
+                                   mode='r',
+                                   shape=(n_rows, len(ONEHOT_BASES))).view(
+                                       np.ndarray)
+            super(OneHotGenome, self)._unpicklable_init()
+
+    def _get_onehot(self, chrom, start, end, strand='+'):
+        """
+        Returns a view of the stored encoding of the in-bounds region
+        `[start, end)`, reversed if `strand` is '-', along with the
+        columns to read from it (see `_get_columns`).
+        """
+        offset = self._offsets[chrom]
+        onehot = self._data[offset + start:offset + end]
+        if strand == '-':
+            onehot = onehot[::-1]
+        return onehot, _get_columns(tuple(self.BASES_ARR), strand == '-')
+
+    def _check_region(self, chrom, start, end, strand, pad):
+        """
+        Returns whether the region is valid (see `_check_coords`), and
+        raises a ValueError if `strand` is not one of '+', '-' or '.'.
+        """
+        if not _check_coords(self.len_chrs,
+                             chrom,
+                             start,
+                             end,
+                             pad=pad,
+                             blacklist_tabix=self._blacklist_tabix):
+            return False
+        if strand != '+' and strand != '-' and strand != '.':
+            raise ValueError(
+                "Strand must be one of '+', '-', or '.'. Input was {0}".format(
+                    strand))
+        return True
+
+    def _encoding_into(self, chrom, start, end, strand, pad, out):
+        if not self._check_region(chrom, start, end, strand, pad):
+            return None
+        start_pad = max(0, -start)
+        end_pad = max(0, end - self.len_chrs[chrom])
+        onehot, (columns, _) = self._get_onehot(
+            chrom, start + start_pad, end - end_pad, strand=strand)
+        n_unknown = _fast_onehot_into_encoding(
+            onehot, columns, out[start_pad:len(out) - end_pad])
+        if start_pad or end_pad:
+            out[:start_pad] = 1 / len(self.BASES_ARR)
+            out[len(out) - end_pad:] = 1 / len(self.BASES_ARR)
+        return n_unknown + start_pad + end_pad
+
+    @Genome.init
+    def get_onehot_view_from_coords(self, chrom, start, end, strand='+'):
+        """Gets the stored one-hot encoding of the genomic sequence at
+        the queried coordinates without copying it from the
+        memory-mapped file.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome or region, e.g. "chr1".
+        start : int
+            The 0-based start coordinate of the first position in the
+            sequence.
+        end : int
+            One past the 0-based last position in the sequence.
+        strand : {'+', '-', '.'}, optional
+            Default is '+'. The strand the sequence is located on. '.' is
+            treated as '+'.
+
+        Returns
+        -------
+        numpy.ndarray, dtype=numpy.uint8
+            The read-only :math:`L \\times 4` encoding of the sequence,
+            where unknown bases are rows of zeros, or an empty encoding
+            if the coordinates are invalid. The encoding is a view of the
+            memory-mapped file if the columns can be read in order, that
+            is, when `BASES_ARR` matches `ONEHOT_BASES` (or its
+            complement, for the '-' strand). Otherwise it is a copy.
+
+        Raises
+        ------
+        ValueError
+            If the input char to `strand` is not one of the specified
+            choices.
+
+        """
+        if not self._check_region(chrom, start, end, strand, False):
+            return np.zeros((0, len(self.BASES_ARR)), dtype=np.uint8)
+        onehot, (_, column_index) = self._get_onehot(
+            chrom, start, end, strand=strand)
+        return onehot[:, column_index]
+
+    @Genome.init
+    def get_encoding_from_coords(self,
+                                 chrom,
+                                 start,
+                                 end,
+                                 strand='+',
+                                 pad=False):
+        """Gets the one-hot encoding of the genomic sequence at the
+        queried coordinates. See
+        `selene_sdk.sequences.Genome.get_encoding_from_coords`.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome or region, e.g. "chr1".
+        start : int
+            The 0-based start coordinate of the first position in the
+            sequence.
+        end : int
+            One past the 0-based last position in the sequence.
+        strand : {'+', '-', '.'}, optional
+            Default is '+'. The strand the sequence is located on. '.' is
+            treated as '+'.
+        pad : bool, optional
+            Default is `False`. Pad the output sequence with 'N' if `start`
+            and/or `end` are out of bounds to return a sequence of length
+            `end - start`.
+
+        Returns
+        -------
+        numpy.ndarray, dtype=numpy.float32
+            The :math:`L \\times 4` encoding of the sequence, or an empty
+            encoding if the coordinates are invalid.
+
+        Raises
+        ------
+        ValueError
+            If the input char to `strand` is not one of the specified
+            choices.
+
+        """
+        encoding, _ = self.get_encoding_from_coords_check_unk(
+            chrom, start, end, strand=strand, pad=pad)
+        return encoding
+
+    @Genome.init
+    def get_encoding_from_coords_check_unk(self,
+                                           chrom,
+                                           start,
+                                           end,
+                                           strand='+',
+                                           pad=False):
+        """Gets the one-hot encoding of the genomic sequence at the
+        queried coordinates and check whether the sequence contains
+        unknown base(s). See
+        `selene_sdk.sequences.Genome.get_encoding_from_coords_check_unk`.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome or region, e.g. "chr1".
+        start : int
+            The 0-based start coordinate of the first position in the
+            sequence.
+        end : int
+            One past the 0-based last position in the sequence.
+        strand : {'+', '-', '.'}, optional
+            Default is '+'. The strand the sequence is located on. '.' is
+            treated as '+'.
+        pad : bool, optional
+            Default is `False`. Pad the output sequence with 'N' if `start`
+            and/or `end` are out of bounds to return a sequence of length
+            `end - start`.
+
+        Returns
+        -------
+        tuple(numpy.ndarray, bool)
+            The :math:`L \\times 4` encoding of the sequence (empty if the
+            coordinates are invalid) and whether the sequence contains
+            any unknown base(s).
+
+        Raises
+        ------
+        ValueError
+            If the input char to `strand` is not one of the specified
+            choices.
+
+        """
+        encoding = np.empty((max(end - start, 0), len(self.BASES_ARR)),
+                            dtype=np.float32)
+        n_unknown = self._encoding_into(
+            chrom, start, end, strand, pad, encoding)
+        if n_unknown is None:
+            return np.zeros((0, len(self.BASES_ARR)), dtype=np.float32), False
+        return encoding, n_unknown > 0
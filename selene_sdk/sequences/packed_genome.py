@@ -0,0 +1,420 @@
+"""
+This module provides the `PackedGenome` class. This class stores an
+organism's genomic sequence in a 2-bit packed, memory-mapped file that
+is created once from an indexed FASTA file. Sequences and their one-hot
+encodings are decoded directly from the memory-mapped file, so all
+processes that use the same file share a single page-cached copy of
+the genome.
+
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+import pyfaidx
+
+from .genome import Genome
+from .genome import _check_coords
+from .genome import _get_fasta_signature
+from .genome import _is_built_from_current_fasta
+from ._sequence import _fast_codes_into_encoding
+from ._sequence import _fast_unpack_codes
+
+
+PACKED_BASES = "ACGT"
+"""
+The order in which bases are stored in the 2-bit packed file. Position
+`i` in this string is stored as the 2-bit code `i`. Unknown bases are
+stored as code 0 and flagged in the N-mask.
+"""
+
+_UNK_CODE = len(PACKED_BASES)
+
+_CHUNK_SIZE = 2 ** 24  # must be a multiple of 8
+
+
+def _get_pack_table():
+    pack_table = np.full(256, _UNK_CODE, dtype=np.uint8)
+    for code, base in enumerate(PACKED_BASES):
+        pack_table[ord(base)] = code
+        pack_table[ord(base.lower())] = code
+    return pack_table
+
+
+_PACK_TABLE = _get_pack_table()
+_CODE_TO_CHAR = np.frombuffer(
+    (PACKED_BASES + Genome.UNK_BASE).encode("ascii"), dtype=np.uint8)
+
+
+@lru_cache(maxsize=None)
+def _get_code_encodings(bases_arr):
+    """
+    Returns the read-only :math:`5 \\times 4` table mapping each packed
+    code to its row in the one-hot encoding for the base ordering
+    `bases_arr`.
+    """
+    code_encodings = np.zeros(
+        (len(PACKED_BASES) + 1, len(bases_arr)), dtype=np.float32)
+    for code, base in enumerate(PACKED_BASES):
+        code_encodings[code, bases_arr.index(base)] = 1
+    code_encodings[_UNK_CODE, :] = 1 / len(bases_arr)
+    code_encodings.setflags(write=False)
+    return code_encodings
+
+
+def _pack_codes(codes):
+    """
+    Packs an array of 2-bit codes (values in [0, 3]) into bytes, 4 codes
+    per byte with the first code in the most significant bits.
+    """
+    n_pad = -len(codes) % 4
+    if n_pad:
+        codes = np.concatenate([codes, np.zeros(n_pad, dtype=np.uint8)])
+    codes = codes.reshape(-1, 4)
+    return ((codes[:, 0] << 6) | (codes[:, 1] << 4) |
+            (codes[:, 2] << 2) | codes[:, 3]).astype(np.uint8)
+
+
+def _read_packed_index(index_path):
+    """
+    Reads the index written by `pack_fasta`.
+
+    Returns
+    -------
+    len_chrs, offsets : tuple(dict, dict)
+        A dictionary mapping chromosome names to lengths, and a
+        dictionary mapping chromosome names to the byte offsets of their
+        packed bases and N-mask in the packed file.
+
+    """
+    len_chrs = {}
+    offsets = {}
+    with open(index_path, 'r') as file_handle:
+        for line in file_handle:
+            if line.startswith('#'):
+                continue
+            chrom, length, bases_offset, mask_offset = \
+                line.rstrip('\n').split('\t')
+            len_chrs[chrom] = int(length)
+            offsets[chrom] = (int(bases_offset), int(mask_offset))
+    return len_chrs, offsets
+
+
+def pack_fasta(input_path, output_path):
+    """
+    Converts an indexed FASTA file into a 2-bit packed file with an
+    N-mask, along with an index file `<output_path>.idx`. Any base that
+    is not one of `A`, `C`, `G`, `T` (upper or lowercase) is stored as
+    unknown.
+
+    The packed file contains, for each chromosome, :math:`\\lceil L/4
+    \\rceil` bytes of packed bases followed by :math:`\\lceil L/8 \\rceil`
+    bytes of N-mask (see `numpy.packbits`). The index is a tab-separated
+    file with the columns `[chrom, length, bases_offset, mask_offset]`,
+    preceded by a `#source` line that records the size and modification
+    time of `input_path`.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to an indexed FASTA file.
+    output_path : str
+        Path to the packed file to create.
+
+    """
+    signature = _get_fasta_signature(input_path)
+    fasta = pyfaidx.Fasta(input_path)
+    index_rows = []
+    offset = 0
+    tmp_path = "{0}.{1}.tmp".format(output_path, os.getpid())
+    with open(tmp_path, 'wb') as file_handle:
+        for chrom in sorted(fasta.keys()):
+            len_chrom = len(fasta[chrom])
+            masks = []
+            bases_offset = offset
+            for chunk_start in range(0, len_chrom, _CHUNK_SIZE):
+                chunk_end = min(chunk_start + _CHUNK_SIZE, len_chrom)
+                sequence = fasta[chrom][chunk_start:chunk_end].seq
+                codes = _PACK_TABLE[np.frombuffer(
+                    sequence.encode("ascii", "replace"), dtype=np.uint8)]
+                is_unk = codes == _UNK_CODE
+                codes[is_unk] = 0
+                packed = _pack_codes(codes)
+                file_handle.write(packed.tobytes())
+                offset += len(packed)
+                masks.append(np.packbits(is_unk))
+            mask_offset = offset
+            for mask in masks:
+                file_handle.write(mask.tobytes())
+                offset += len(mask)
+            index_rows.append((chrom, len_chrom, bases_offset, mask_offset))
+    fasta.close()
+
+    # the index is written last, so that a packed file is only used
+    # once it has been fully written
+    index_path = "{0}.idx".format(output_path)
+    tmp_index_path = "{0}.{1}.tmp".format(index_path, os.getpid())
+    with open(tmp_index_path, 'w') as file_handle:
+        file_handle.write("{0}\n".format(signature))
+        for row in index_rows:
+            file_handle.write("{0}\n".format('\t'.join(str(c) for c in row)))
+    os.replace(tmp_path, output_path)
+    os.replace(tmp_index_path, index_path)
+
+
+class PackedGenome(Genome):
+    """This class provides access to an organism's genomic sequence
+    through a 2-bit packed, memory-mapped copy of a FASTA file.
+
+    The packed file is created from `input_path` the first time a
+    `PackedGenome` is constructed for it (see `pack_fasta`) and is reused
+    afterwards. Queries decode bases directly from the memory-mapped
+    file, without per-process file handles or string processing, so
+    DataLoader workers share one page-cached copy of the genome.
+
+    `PackedGenome` can be used anywhere a `Genome` is expected. Note that
+    the packed file does not store soft-masking or ambiguity codes:
+    sequences are returned in uppercase and any base that is not one of
+    `A`, `C`, `G`, `T` is returned as `N`. One-hot encodings are the same
+    as those from `Genome`.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to an indexed FASTA file, that is, a `*.fasta` file with
+        a corresponding `*.fai` file in the same directory. Only read if
+        the packed file does not exist yet, or was packed from a
+        different version of the FASTA file.
+    packed_path : str or None, optional
+        Default is None (use `<input_path>.packed`). Path to the packed
+        file. Its index is stored at `<packed_path>.idx`.
+    blacklist_regions : str or None, optional
+        Default is None. See `selene_sdk.sequences.Genome`.
+    bases_order : list(str) or None, optional
+        Default is None. See `selene_sdk.sequences.Genome`.
+    init_unpicklable : bool, optional
+        Default is False. See `selene_sdk.sequences.Genome`. Unlike
+        `Genome`, a `PackedGenome` remains picklable after it has been
+        initialized: the memory map is reopened in the receiving process.
+    blacklist_in_memory : bool, optional
+        Default is False. See `selene_sdk.sequences.Genome`.
+
+    Attributes
+    ----------
+    packed_path : str
+        The path to the packed file.
+    chrs : list(str)
+        The list of chromosome names.
+    len_chrs : dict
+        A dictionary mapping the names of each chromosome in the file to
+        the length of said chromosome.
+
+    """
+
+    def __init__(self,
+                 input_path,
+                 packed_path=None,
+                 blacklist_regions=None,
+                 bases_order=None,
+                 init_unpicklable=False,
+                 blacklist_in_memory=False):
+        """
+        Constructs a `PackedGenome` object.
+        """
+        if packed_path is None:
+            packed_path = "{0}.packed".format(input_path)
+        self.packed_path = packed_path
+        if not _is_built_from_current_fasta(input_path, self.packed_path):
+            pack_fasta(input_path, self.packed_path)
+
+        super(PackedGenome, self).__init__(
+            input_path,
+            blacklist_regions=blacklist_regions,
+            bases_order=bases_order,
+            init_unpicklable=init_unpicklable,
+            blacklist_in_memory=blacklist_in_memory)
+
+    def _unpicklable_init(self):
+        if not self._initialized:
+            self._data = np.memmap(self.packed_path, dtype=np.uint8, mode='r')
+            self.len_chrs, self._offsets = _read_packed_index(
+                "{0}.idx".format(self.packed_path))
+            self.chrs = sorted(self.len_chrs.keys())
+            self._init_blacklist()
+            self._initialized = True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in ("_data", "_blacklist_tabix"):
+            state.pop(attr, None)
+        state["_initialized"] = False
+        return state
+
+    def _get_codes(self, chrom, start, end, strand='+'):
+        """
+        Decodes the bases in the in-bounds region `[start, end)` as
+        codes indexing into `PACKED_BASES`, where unknown bases have the
+        code `len(PACKED_BASES)`.
+
+        Raises
+        ------
+        ValueError
+            If the region is not within the bounds of `chrom`.
+        """
+        n_bases = end - start
+        codes = np.empty(max(n_bases, 0), dtype=np.uint8)
+        if n_bases <= 0:
+            return codes
+        # the packed file is read without bounds checks
+        if chrom not in self.len_chrs or start < 0 or \
+                end > self.len_chrs[chrom]:
+            raise ValueError(
+                "The region {0}:{1}-{2} is not within the bounds of the "
+                "chromosome.".format(chrom, start, end))
+        bases_offset, mask_offset = self._offsets[chrom]
+        # the packed bases are stored in ACGT order, so the complement
+        # of code `c` is `3 - c`
+        _fast_unpack_codes(self._data, bases_offset, mask_offset,
+                           start, end, strand == '-', _UNK_CODE, codes)
+        return codes
+
+    def _get_codes_from_coords(self, chrom, start, end, strand='+', pad=False):
+        """
+        Same as `Genome.get_sequence_from_coords`, but returns the
+        decoded codes (see `_get_codes`) instead of a string, or None if
+        the coordinates are invalid.
+        """
+        if not _check_coords(self.len_chrs,
+                             chrom,
+                             start,
+                             end,
+                             pad=pad,
+                             blacklist_tabix=self._blacklist_tabix):
+            return None
+
+        if strand != '+' and strand != '-' and strand != '.':
+            raise ValueError(
+                "Strand must be one of '+', '-', or '.'. Input was {0}".format(
+                    strand))
+
+        start_pad = max(0, -start)
+        end_pad = max(0, end - self.len_chrs[chrom])
+        codes = self._get_codes(
+            chrom, start + start_pad, end - end_pad, strand=strand)
+        if start_pad or end_pad:
+            codes = np.concatenate([
+                np.full(start_pad, _UNK_CODE, dtype=np.uint8),
+                codes,
+                np.full(end_pad, _UNK_CODE, dtype=np.uint8)])
+        return codes
+
+    def _genome_sequence(self, chrom, start, end, strand='+'):
+        codes = self._get_codes(chrom, start, end, strand=strand)
+        return _CODE_TO_CHAR[codes].tobytes().decode("ascii")
+
+    def _encoding_into(self, chrom, start, end, strand, pad, out):
+        codes = self._get_codes_from_coords(
+            chrom, start, end, strand=strand, pad=pad)
+        if codes is None:
+            return None
+        return _fast_codes_into_encoding(
+            codes, _get_code_encodings(tuple(self.BASES_ARR)), _UNK_CODE, out)
+
+    @Genome.init
+    def get_encoding_from_coords(self,
+                                 chrom,
+                                 start,
+                                 end,
+                                 strand='+',
+                                 pad=False):
+        """Gets the one-hot encoding of the genomic sequence at the
+        queried coordinates. See
+        `selene_sdk.sequences.Genome.get_encoding_from_coords`.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome or region, e.g. "chr1".
+        start : int
+            The 0-based start coordinate of the first position in the
+            sequence.
+        end : int
+            One past the 0-based last position in the sequence.
+        strand : {'+', '-', '.'}, optional
+            Default is '+'. The strand the sequence is located on. '.' is
+            treated as '+'.
+        pad : bool, optional
+            Default is `False`. Pad the output sequence with 'N' if `start`
+            and/or `end` are out of bounds to return a sequence of length
+            `end - start`.
+
+        Returns
+        -------
+        numpy.ndarray, dtype=numpy.float32
+            The :math:`L \\times 4` encoding of the sequence, or an empty
+            encoding if the coordinates are invalid.
+
+        Raises
+        ------
+        ValueError
+            If the input char to `strand` is not one of the specified
+            choices.
+
+        """
+        encoding, _ = self.get_encoding_from_coords_check_unk(
+            chrom, start, end, strand=strand, pad=pad)
+        return encoding
+
+    @Genome.init
+    def get_encoding_from_coords_check_unk(self,
+                                           chrom,
+                                           start,
+                                           end,
+                                           strand='+',
+                                           pad=False):
+        """Gets the one-hot encoding of the genomic sequence at the
+        queried coordinates and check whether the sequence contains
+        unknown base(s). See
+        `selene_sdk.sequences.Genome.get_encoding_from_coords_check_unk`.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the chromosome or region, e.g. "chr1".
+        start : int
+            The 0-based start coordinate of the first position in the
+            sequence.
+        end : int
+            One past the 0-based last position in the sequence.
+        strand : {'+', '-', '.'}, optional
+            Default is '+'. The strand the sequence is located on. '.' is
+            treated as '+'.
+        pad : bool, optional
+            Default is `False`. Pad the output sequence with 'N' if `start`
+            and/or `end` are out of bounds to return a sequence of length
+            `end - start`.
+
+        Returns
+        -------
+        tuple(numpy.ndarray, bool)
+            The :math:`L \\times 4` encoding of the sequence (empty if the
+            coordinates are invalid) and whether the sequence contains
+            any unknown base(s).
+
+        Raises
+        ------
+        ValueError
+            If the input char to `strand` is not one of the specified
+            choices.
+
+        """
+        codes = self._get_codes_from_coords(
+            chrom, start, end, strand=strand, pad=pad)
+        if codes is None:
+            return np.zeros((0, len(self.BASES_ARR)), dtype=np.float32), False
+        encoding = np.empty((len(codes), len(self.BASES_ARR)),
+                            dtype=np.float32)
+        n_unknown = _fast_codes_into_encoding(
+            codes, _get_code_encodings(tuple(self.BASES_ARR)), _UNK_CODE,
+            encoding)
+        return encoding, n_unknown > 0
@@ -11,6 +11,9 @@ import pyfaidx
 from .sequence import Sequence
 from .sequence import sequence_to_encoding
 from .sequence import encoding_to_sequence
+from .sequence import encodings_to_sequences
+from .sequence import get_lookup_table
+from ._sequence import _fast_sequence_into_encoding
 
 
 def _get_sequence_from_coords(len_prots, proteome_sequence,
@@ -235,6 +238,75 @@ class Proteome(Sequence):
         encoding = self.sequence_to_encoding(sequence)
         return encoding
 
+    def get_encodings_from_coords(self, prots, starts, ends, out=None):
+        """Gets the one-hot encodings of a batch of protein sequences,
+        writing them directly into a single :math:`B \\times L \\times 20`
+        array. All queried regions must have the same length
+        :math:`L`.
+
+        Parameters
+        ----------
+        prots : list(str) or numpy.ndarray
+            The names of the proteins, e.g. "YFP", one per region.
+        starts : list(int) or numpy.ndarray
+            The 0-based start coordinates of the regions.
+        ends : list(int) or numpy.ndarray
+            One past the 0-based last positions of the regions.
+        out : numpy.ndarray or None, optional
+            Default is None. A preallocated, writable `numpy.float32`
+            array of shape :math:`B \\times L \\times 20` to write the
+            encodings into. If None, a new array is allocated.
+
+        Returns
+        -------
+        encodings, valid, n_unknown : \
+        tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+            * `encodings` is the :math:`B \\times L \\times 20` array of\
+            encodings (`out`, if it was specified).
+            * `valid` is a boolean array of length :math:`B`. It is\
+            `False` for a region whose full sequence could not be\
+            retrieved. The rows for these regions are filled with zeros.
+            * `n_unknown` is an integer array of length :math:`B` with\
+            the number of unknown amino acids in each region.
+
+        Raises
+        ------
+        ValueError
+            If the regions do not all have the same length or if `out`
+            does not have the expected shape.
+
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        n_regions = len(prots)
+        lengths = np.unique(ends - starts)
+        if len(lengths) > 1:
+            raise ValueError(
+                "All regions must have the same length, but found lengths "
+                "{0}.".format(lengths.tolist()))
+        sequence_length = int(lengths[0]) if n_regions else 0
+        if out is None:
+            out = np.zeros((n_regions, sequence_length, len(self.BASES_ARR)),
+                           dtype=np.float32)
+        elif out.shape != (n_regions, sequence_length, len(self.BASES_ARR)):
+            raise ValueError(
+                "Expected `out` to have shape {0} but it has shape "
+                "{1}.".format(
+                    (n_regions, sequence_length, len(self.BASES_ARR)),
+                    out.shape))
+        valid = np.zeros(n_regions, dtype=bool)
+        n_unknown = np.zeros(n_regions, dtype=np.int64)
+        for i in range(n_regions):
+            sequence = self.get_sequence_from_coords(
+                prots[i], int(starts[i]), int(ends[i]))
+            if not sequence or len(sequence) != sequence_length:
+                out[i] = 0
+                continue
+            n_unknown[i] = _fast_sequence_into_encoding(
+                sequence, get_lookup_table(self.BASE_TO_INDEX), out[i])
+            valid[i] = True
+        return out, valid, n_unknown
+
     @classmethod
     def sequence_to_encoding(cls, sequence):
         """Converts an input sequence to its one-hot encoding.
@@ -271,3 +343,24 @@ class Proteome(Sequence):
 
         """
         return encoding_to_sequence(encoding, cls.BASES_ARR, cls.UNK_BASE)
+
+    @classmethod
+    def encodings_to_sequences(cls, encodings, as_bytes=False):
+        """Converts a batch of one-hot encodings to their amino acid sequences.
+
+        Parameters
+        ----------
+        encodings : numpy.ndarray, dtype=numpy.float32
+            A :math:`B \\times L \\times 20` batch of one-hot encodings.
+        as_bytes : bool, optional
+            Default is False. Return a :math:`B \\times L` `numpy.uint8`
+            array of character codes instead of a list of strings.
+
+        Returns
+        -------
+        list(str) or numpy.ndarray, dtype=numpy.uint8
+            The :math:`B` sequences decoded from the input array.
+
+        """
+        return encodings_to_sequences(
+            encodings, cls.BASES_ARR, cls.UNK_BASE, as_bytes=as_bytes)
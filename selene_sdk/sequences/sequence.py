@@ -5,13 +5,47 @@ base class for biological sequence collections (e.g. genomes).
 """
 from abc import ABCMeta
 from abc import abstractmethod
+from functools import lru_cache
 
 import numpy as np
 
 from ._sequence import _fast_sequence_to_encoding
+from ._sequence import _fast_sequence_into_encoding
 
 
-def sequence_to_encoding(sequence, base_to_index, bases_arr):
+@lru_cache(maxsize=None)
+def _lookup_table_from_items(base_index_items):
+    lookup_table = np.full(256, -1, dtype=np.int8)
+    for base, index in base_index_items:
+        if len(base) == 1 and ord(base) < 256:
+            lookup_table[ord(base)] = index
+    lookup_table.flags.writeable = False
+    return lookup_table
+
+
+def get_lookup_table(base_to_index):
+    """Builds the 256-entry lookup table used to one-hot encode
+    sequences. Every byte value maps to the column index of its base
+    in the encoding, or to -1 if the character is not in the alphabet
+    (e.g. an unknown base). Tables are cached, so this is cheap to call
+    for every sequence.
+
+    Parameters
+    ----------
+    base_to_index : dict
+        A dict that maps input characters to indices. See
+        `sequence_to_encoding` for more information.
+
+    Returns
+    -------
+    numpy.ndarray, dtype=numpy.int8
+        A read-only array of length 256, indexed by character code.
+
+    """
+    return _lookup_table_from_items(tuple(sorted(base_to_index.items())))
+
+
+def sequence_to_encoding(sequence, base_to_index, bases_arr, out=None):
     """Converts an input sequence to its one-hot encoding.
 
     Parameters
@@ -29,30 +63,102 @@ def sequence_to_encoding(sequence, base_to_index, bases_arr):
         mapping to values of `[0, 1, 2, 3]`.
     bases_arr : list(str)
         The characters in the sequence's alphabet.
+    out : numpy.ndarray or None, optional
+        Default is None. A preallocated, writable :math:`L \\times N`
+        `numpy.float32` array to write the encoding into. If None, a new
+        array is allocated.
 
     Returns
     -------
     numpy.ndarray, dtype=numpy.float32
         The :math:`L \\times N` encoding of the sequence, where
         :math:`L` is the length of the input sequence and :math:`N` is
-        the size of the sequence alphabet.
+        the size of the sequence alphabet. If `out` was specified,
+        `out` is returned.
 
     """
-    return _fast_sequence_to_encoding(sequence, base_to_index, len(bases_arr))
+    lookup_table = get_lookup_table(base_to_index)
+    if out is None:
+        return _fast_sequence_to_encoding(
+            sequence, lookup_table, len(bases_arr))
+    _fast_sequence_into_encoding(sequence, lookup_table, out)
+    return out
+
+
+@lru_cache(maxsize=None)
+def _decode_table(bases_arr, unk_base):
+    return np.frombuffer(
+        "".join(bases_arr + (unk_base,)).encode("ascii"), dtype=np.uint8)
+
+
+@lru_cache(maxsize=None)
+def _bit_weights(n_bases):
+    return (1 << np.arange(n_bases)).astype(np.uint8)
+
+
+@lru_cache(maxsize=None)
+def _bit_mask_decode_table(bases_arr, unk_base):
+    # maps each bit mask of the columns set to 1 in a row to the base of
+    # its lowest set bit, or to `unk_base` if no bit is set
+    first_bits = np.full(256, len(bases_arr), dtype=np.uint8)
+    for bit_mask in range(1, 1 << len(bases_arr)):
+        first_bits[bit_mask] = (bit_mask & -bit_mask).bit_length() - 1
+    return _decode_table(bases_arr, unk_base)[first_bits]
+
+
+def encodings_to_sequences(encodings, bases_arr, unk_base, as_bytes=False):
+    """Converts a batch of one-hot encodings to their sequences. Each
+    row is decoded to the base of its column that is set to 1, and rows
+    without such a column (e.g. rows filled with :math:`1/N`) are
+    decoded to `unk_base`.
+
+    Parameters
+    ----------
+    encodings : numpy.ndarray
+        The :math:`B \\times L \\times N` encodings of the sequences,
+        where :math:`B` is the number of sequences, :math:`L` is the
+        length of each sequence, and :math:`N` is the size of the
+        sequence alphabet.
+    bases_arr : list(str)
+        A list of the bases in the sequence's alphabet that corresponds
+        to the correct columns for those bases in the encoding. Each base
+        must be a single ASCII character.
+    unk_base : str
+        The base corresponding to the "unknown" character in this
+        encoding. See `selene_sdk.sequences.Sequence.UNK_BASE` for more
+        information.
+    as_bytes : bool, optional
+        Default is False. Return the character codes of the sequences as
+        a :math:`B \\times L` `numpy.uint8` array instead of a list of
+        strings.
 
+    Returns
+    -------
+    list(str) or numpy.ndarray, dtype=numpy.uint8
+        The decoded sequences.
 
-def _get_base_index(encoding_row):
-    unk_val = 1 / len(encoding_row)
-    for index, val in enumerate(encoding_row):
-        if np.isclose(val, unk_val) is True:
-            return -1
-        elif val == 1:
-            return index
-    return -1
+    """
+    encodings = np.asarray(encodings)
+    is_base = encodings == 1
+    n_bases = len(bases_arr)
+    if n_bases <= 8:
+        # reductions over a short last axis are slow, so each row is
+        # packed into a bit mask and its first set bit is looked up
+        bit_masks = is_base.view(np.uint8) @ _bit_weights(n_bases)
+        sequences = _bit_mask_decode_table(
+            tuple(bases_arr), unk_base)[bit_masks]
+    else:
+        base_indices = np.argmax(is_base, axis=-1)
+        base_indices[~is_base.any(axis=-1)] = n_bases
+        sequences = _decode_table(tuple(bases_arr), unk_base)[base_indices]
+    if as_bytes:
+        return sequences
+    return [sequence.tobytes().decode("ascii") for sequence in sequences]
 
 
 def encoding_to_sequence(encoding, bases_arr, unk_base):
     """Converts a sequence one-hot encoding to its string sequence.
+    See `encodings_to_sequences` to decode a batch of encodings.
 
     Parameters
     ----------
@@ -75,14 +181,60 @@ def encoding_to_sequence(encoding, bases_arr, unk_base):
         input array.
 
     """
-    sequence = []
-    for row in encoding:
-        base_pos = _get_base_index(row)
-        if base_pos == -1:
-            sequence.append(unk_base)
-        else:
-            sequence.append(bases_arr[base_pos])
-    return "".join(sequence)
+    encoding = np.asarray(encoding)
+    if encoding.size == 0:
+        return ""
+    return encodings_to_sequences(
+        encoding[np.newaxis], bases_arr, unk_base)[0]
+
+
+@lru_cache(maxsize=None)
+def _complement_index_from_items(bases_arr, complement_items):
+    complementary_base_dict = dict(complement_items)
+    base_to_index = {b: ix for (ix, b) in enumerate(bases_arr)}
+    complement_indices = np.array(
+        [base_to_index[complementary_base_dict[b]] for b in bases_arr])
+    in_order = np.arange(len(bases_arr))
+    if np.array_equal(complement_indices, in_order[::-1]):
+        return slice(None, None, -1)
+    elif np.array_equal(complement_indices, in_order):
+        return slice(None)
+    complement_indices.flags.writeable = False
+    return complement_indices
+
+
+def reverse_complement_encoding(encoding,
+                                bases_arr,
+                                complementary_base_dict):
+    """Reverse complements a one-hot encoding, or a batch of encodings.
+    The encoding is flipped along the sequence axis and its columns are
+    permuted to those of the complementary bases. Unknown bases, whose
+    rows are filled with :math:`1/N`, are left unknown.
+
+    Parameters
+    ----------
+    encoding : numpy.ndarray
+        The :math:`L \\times N` encoding of a sequence, or a
+        :math:`B \\times L \\times N` batch of encodings.
+    bases_arr : list(str)
+        The characters in the sequence's alphabet, in the order of the
+        columns of the encoding.
+    complementary_base_dict : dict
+        A dict that maps bases (`str`) to their complementary bases
+        (`str`).
+
+    Returns
+    -------
+    numpy.ndarray
+        The reverse complement of the encoding, with the same shape. This
+        is a view of `encoding` (no copy is made) when complementing the
+        bases reverses the column order, as it does for the default
+        `['A', 'C', 'G', 'T']` ordering. Otherwise, it is a copy.
+
+    """
+    complement_index = _complement_index_from_items(
+        tuple(bases_arr), tuple(complementary_base_dict.items()))
+    return encoding[..., ::-1, :][..., complement_index]
 
 
 def get_reverse_encoding(encoding,
@@ -90,8 +242,8 @@ def get_reverse_encoding(encoding,
                          base_to_index,
                          complementary_base_dict):
     """
-    The Genome DNA bases encoding is created such that the reverse
-    encoding can be quickly computed.
+    Gets a copy of the reverse complement of an encoding. See
+    `reverse_complement_encoding`, which avoids the copy when possible.
 
     Parameters
     ----------
@@ -105,18 +257,8 @@ def get_reverse_encoding(encoding,
     numpy.ndarray
 
     """
-
-    reverse_encoding = np.zeros(encoding.shape)
-    for index, row in enumerate(encoding):
-        base_pos = _get_base_index(row)
-        if base_pos == -1:
-            reverse_encoding[index, :] = 1 / len(bases_arr)
-        else:
-            base = complementary_base_dict[bases_arr[base_pos]]
-            complem_base_pos = base_to_index[base]
-            rev_index = encoding.shape[0] - row - 1
-            reverse_encoding[rev_index, complem_base_pos] = 1
-    return reverse_encoding
+    return np.array(reverse_complement_encoding(
+        encoding, bases_arr, complementary_base_dict))
 
 
 def reverse_complement_sequence(sequence, complementary_base_dict):
@@ -1,10 +1,17 @@
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
 
 import numpy as np
 
+from selene_sdk.sequences import Genome
+from selene_sdk.sequences.genome import _BlacklistIndex
 from selene_sdk.sequences.genome import _get_sequence_from_coords
 from selene_sdk.sequences.sequence import sequence_to_encoding, \
-    encoding_to_sequence
+    encoding_to_sequence, encodings_to_sequences, get_lookup_table, \
+    reverse_complement_encoding
 
 
 class TestGenome(unittest.TestCase):
@@ -59,6 +66,32 @@ class TestGenome(unittest.TestCase):
         ])
         self.assertSequenceEqual(observed.tolist(), expected.tolist())
 
+    def test_sequence_to_encoding_into_buffer(self):
+        sequence = "AnGt"
+        out = np.full((4, 4), -1., dtype=np.float32)
+        observed = sequence_to_encoding(
+            sequence, self.bases_encoding, self.bases_arr, out=out)
+        expected = np.array([
+            [1., 0., 0., 0.], [.25, .25, .25, .25],  # An
+            [0., 0., 1., 0.], [0., 0., 0., 1.]       # Gt
+        ])
+        self.assertIs(observed, out)
+        self.assertSequenceEqual(out.tolist(), expected.tolist())
+
+    def test_sequence_to_encoding_buffer_length_mismatch(self):
+        out = np.zeros((3, 4), dtype=np.float32)
+        with self.assertRaises(ValueError):
+            sequence_to_encoding(
+                "ACGT", self.bases_encoding, self.bases_arr, out=out)
+
+    def test_get_lookup_table(self):
+        lookup_table = get_lookup_table(self.bases_encoding)
+        self.assertEqual(lookup_table.shape, (256,))
+        self.assertEqual(lookup_table[ord('g')], 2)
+        self.assertEqual(lookup_table[ord('T')], 3)
+        self.assertEqual(lookup_table[ord('N')], -1)
+        self.assertFalse(lookup_table.flags.writeable)
+
     def test_encoding_to_sequence(self):
         encoding = np.array([
             [1., 0., 0., 0.], [1., 0., 0., 0.],
@@ -77,6 +110,18 @@ class TestGenome(unittest.TestCase):
         expected = "GNATNN"
         self.assertEqual(observed, expected)
 
+    def test_encodings_to_sequences(self):
+        sequences = ["ACGTN", "NNcga", "TTTTT"]
+        encodings = np.stack(
+            [Genome.sequence_to_encoding(s) for s in sequences])
+        observed = encodings_to_sequences(encodings, self.bases_arr, "N")
+        self.assertSequenceEqual(observed, ["ACGTN", "NNCGA", "TTTTT"])
+
+        observed = encodings_to_sequences(
+            encodings, self.bases_arr, "N", as_bytes=True)
+        self.assertEqual(observed.dtype, np.uint8)
+        self.assertEqual(observed[1].tobytes(), b"NNCGA")
+
     def test__get_sequence_from_coords_pos_strand(self):
         observed = _get_sequence_from_coords(
             self.len_chrs, self._genome_sequence, "chr1", 0, 14, '+')
@@ -105,6 +150,129 @@ class TestGenome(unittest.TestCase):
         self.assertEqual(observed1, "")
         self.assertEqual(observed2, "")
 
+    def test_get_encodings_from_coords(self):
+        genome = Genome("selene_sdk/sequences/tests/files/small.fasta")
+        out = np.full((4, 6, 4), -1., dtype=np.float32)
+        encodings, valid, n_unknown = genome.get_encodings_from_coords(
+            ["chr2", "chr2", "chr3", "chr5"],
+            [0, 0, 7, 0],
+            [6, 6, 13, 6],
+            strands=['+', '-', '+', '+'],
+            pad=True,
+            out=out)
+        self.assertIs(encodings, out)
+        self.assertSequenceEqual(valid.tolist(), [True, True, True, False])
+        self.assertSequenceEqual(n_unknown.tolist(), [0, 0, 3, 0])
+        for row, sequence in enumerate(["ttgctg", "cagcaa", "AtCNNN"]):
+            self.assertSequenceEqual(
+                encodings[row].tolist(),
+                Genome.sequence_to_encoding(sequence).tolist())
+        self.assertFalse(encodings[3].any())
+
+    def test_reverse_complement_encoding(self):
+        encoding = Genome.sequence_to_encoding("ACNGTT")
+        observed = reverse_complement_encoding(
+            encoding, Genome.BASES_ARR, Genome.COMPLEMENTARY_BASE_DICT)
+        expected = Genome.sequence_to_encoding("AACNGT")
+        self.assertSequenceEqual(observed.tolist(), expected.tolist())
+        self.assertTrue(np.shares_memory(observed, encoding))
+
+    def test_reverse_complement_encoding_batch(self):
+        encodings = np.stack([Genome.sequence_to_encoding("ACNG"),
+                              Genome.sequence_to_encoding("TTAC")])
+        observed = reverse_complement_encoding(
+            encodings, Genome.BASES_ARR, Genome.COMPLEMENTARY_BASE_DICT)
+        for row, sequence in enumerate(["CNGT", "GTAA"]):
+            self.assertSequenceEqual(
+                observed[row].tolist(),
+                Genome.sequence_to_encoding(sequence).tolist())
+
+    def test_get_encoding_from_coords_neg_strand(self):
+        genome = Genome("selene_sdk/sequences/tests/files/small.fasta")
+        observed, has_unk = genome.get_encoding_from_coords_check_unk(
+            "chr2", 0, 6, strand='-')
+        self.assertSequenceEqual(
+            observed.tolist(),
+            Genome.sequence_to_encoding("cagcaa").tolist())
+        self.assertFalse(has_unk)
+
+        observed = genome.get_encoding_from_coords(
+            "chr2", -2, 4, strand='-', pad=True)
+        self.assertSequenceEqual(
+            observed.tolist(),
+            Genome.sequence_to_encoding("NNgcaa").tolist())
+
+    def test_get_encodings_from_coords_unequal_lengths(self):
+        genome = Genome("selene_sdk/sequences/tests/files/small.fasta")
+        with self.assertRaises(ValueError):
+            genome.get_encodings_from_coords(
+                ["chr1", "chr2"], [0, 0], [10, 12])
+
+    def test_blacklist_index(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            bed_path = os.path.join(tmp_dir, "blacklist.bed")
+            with open(bed_path, 'w') as file_handle:
+                file_handle.write("chr2\t20\t30\nchr2\t5\t10\n"
+                                  "chr2\t8\t12\n")
+            blacklist = _BlacklistIndex(bed_path)
+            self.assertTrue(blacklist.overlaps("chr2", 0, 6))
+            self.assertTrue(blacklist.overlaps("chr2", 11, 13))
+            self.assertFalse(blacklist.overlaps("chr2", 12, 20))
+            self.assertTrue(blacklist.overlaps("chr2", 29, 40))
+            self.assertFalse(blacklist.overlaps("chr1", 0, 40))
+            self.assertSequenceEqual(
+                blacklist.overlaps_batch(
+                    ["chr2", "chr2", "chr1", "chr2"],
+                    [0, 12, 0, 29],
+                    [6, 20, 40, 40]).tolist(),
+                [True, False, False, True])
+
+            genome = Genome("selene_sdk/sequences/tests/files/small.fasta",
+                            blacklist_regions=bed_path,
+                            blacklist_in_memory=True)
+            self.assertFalse(genome.coords_in_bounds("chr2", 0, 6))
+            self.assertTrue(genome.coords_in_bounds("chr2", 12, 20))
+            self.assertEqual(
+                genome.get_encoding_from_coords("chr2", 0, 6).shape, (0, 4))
+            starts, ends = genome.get_blacklist_intervals("chr2")
+            self.assertSequenceEqual(starts.tolist(), [5, 20])
+            self.assertSequenceEqual(ends.tolist(), [12, 30])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_pickle(self):
+        genome = Genome("selene_sdk/sequences/tests/files/small.fasta")
+        expected = genome.get_encoding_from_coords("chr1", 0, 8)
+        unpickled = pickle.loads(pickle.dumps(genome))
+        self.assertFalse(unpickled._initialized)
+        self.assertSequenceEqual(
+            unpickled.get_encoding_from_coords("chr1", 0, 8).tolist(),
+            expected.tolist())
+
+    def test_get_unknown_mask_from_coords(self):
+        genome = Genome("selene_sdk/sequences/tests/files/small.fasta")
+        for chrom, length in genome.get_chr_lens():
+            sequence = genome.get_sequence_from_coords(chrom, 0, length)
+            expected = [b not in genome.BASE_TO_INDEX for b in sequence]
+            self.assertSequenceEqual(
+                genome.get_unknown_mask_from_coords(
+                    chrom, 0, length, chunk_size=7).tolist(),
+                expected)
+            self.assertSequenceEqual(
+                genome.get_unknown_mask_from_coords(chrom, 3, 9).tolist(),
+                expected[3:9])
+
+    def test_get_unknown_mask_from_coords_out_of_bounds(self):
+        genome = Genome("selene_sdk/sequences/tests/files/small.fasta")
+        len_chr1 = dict(genome.get_chr_lens())["chr1"]
+        for chrom, start, end in [("chr1", len_chr1 - 2, len_chr1 + 2),
+                                  ("chr1", -1, 4),
+                                  ("chr1", 5, 4),
+                                  ("chrX", 0, 4)]:
+            with self.assertRaises(ValueError):
+                genome.get_unknown_mask_from_coords(chrom, start, end)
+
 
 if __name__ == "__main__":
     unittest.main()
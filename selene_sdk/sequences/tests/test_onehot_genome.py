@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from selene_sdk.sequences.genome import Genome
+from selene_sdk.sequences.onehot_genome import OneHotGenome
+
+
+class TestOneHotGenome(unittest.TestCase):
+    def setUp(self):
+        self.input_path = "selene_sdk/sequences/tests/files/small.fasta"
+        self.tmp_dir = tempfile.mkdtemp()
+        self.encoded_path = os.path.join(self.tmp_dir, "small.onehot")
+        self.genome = Genome(self.input_path)
+        self.len_chrs = dict(self.genome.get_chr_lens())
+        self.onehot_genome = OneHotGenome(
+            self.input_path, encoded_path=self.encoded_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_creates_encoded_file(self):
+        self.assertTrue(os.path.exists(self.encoded_path))
+        self.assertTrue(os.path.exists("{0}.idx".format(self.encoded_path)))
+        self.assertEqual(os.path.getsize(self.encoded_path),
+                         4 * sum(self.len_chrs.values()))
+
+    def test_get_encoding_from_coords(self):
+        for chrom in ["chr1", "chr2", "chr4"]:
+            len_chrom = self.len_chrs[chrom]
+            for start in range(-2, len_chrom):
+                for end in range(start + 1, len_chrom + 3):
+                    for strand in ('+', '-'):
+                        observed = self.onehot_genome.get_encoding_from_coords(
+                            chrom, start, end, strand=strand, pad=True)
+                        expected = self.genome.get_encoding_from_coords(
+                            chrom, start, end, strand=strand, pad=True)
+                        self.assertSequenceEqual(observed.tolist(),
+                                                 expected.tolist())
+
+    def test_get_encoding_from_coords_invalid(self):
+        observed = self.onehot_genome.get_encoding_from_coords(
+            "chr1", 0, 101)
+        self.assertEqual(observed.shape, (0, 4))
+
+    def test_get_encoding_from_coords_check_unk(self):
+        _, has_unk = self.onehot_genome.get_encoding_from_coords_check_unk(
+            "chr2", 0, 4)
+        self.assertFalse(has_unk)
+        _, has_unk = self.onehot_genome.get_encoding_from_coords_check_unk(
+            "chr2", -1, 4, pad=True)
+        self.assertTrue(has_unk)
+
+    def test_get_onehot_view_from_coords(self):
+        observed = self.onehot_genome.get_onehot_view_from_coords(
+            "chr2", 0, 4)
+        expected = [[0, 0, 0, 1], [0, 0, 0, 1], [0, 0, 1, 0], [0, 1, 0, 0]]
+        self.assertEqual(observed.dtype, np.uint8)
+        self.assertSequenceEqual(observed.tolist(), expected)
+        self.assertTrue(np.shares_memory(observed, self.onehot_genome._data))
+
+        observed = self.onehot_genome.get_onehot_view_from_coords(
+            "chr2", 0, 4, strand='-')
+        expected = [[0, 0, 1, 0], [0, 1, 0, 0], [1, 0, 0, 0], [1, 0, 0, 0]]
+        self.assertSequenceEqual(observed.tolist(), expected)
+        self.assertTrue(np.shares_memory(observed, self.onehot_genome._data))
+
+    def test_get_encodings_from_coords(self):
+        observed, valid, n_unknown = \
+            self.onehot_genome.get_encodings_from_coords(
+                ["chr1", "chr2", "chr1"], [0, 2, 100], [4, 6, 104],
+                strands=['+', '-', '+'])
+        expected, expected_valid, expected_n_unknown = \
+            self.genome.get_encodings_from_coords(
+                ["chr1", "chr2", "chr1"], [0, 2, 100], [4, 6, 104],
+                strands=['+', '-', '+'])
+        self.assertSequenceEqual(observed.tolist(), expected.tolist())
+        self.assertSequenceEqual(valid.tolist(), expected_valid.tolist())
+        self.assertSequenceEqual(n_unknown.tolist(),
+                                 expected_n_unknown.tolist())
+
+    def test_reencodes_modified_fasta(self):
+        input_path = os.path.join(self.tmp_dir, "modified.fasta")
+        with open(input_path, 'w') as file_handle:
+            file_handle.write(">chr1\nACGT\n")
+        encoded_path = os.path.join(self.tmp_dir, "modified.onehot")
+        OneHotGenome(input_path, encoded_path=encoded_path)
+
+        with open(input_path, 'w') as file_handle:
+            file_handle.write(">chr1\nTTTTAC\n")
+        os.utime(input_path, ns=(0, 10 ** 18))
+        os.remove("{0}.fai".format(input_path))
+        observed = OneHotGenome(
+            input_path, encoded_path=encoded_path).get_onehot_view_from_coords(
+                "chr1", 0, 6)
+        expected = [[0, 0, 0, 1]] * 4 + [[1, 0, 0, 0], [0, 1, 0, 0]]
+        self.assertSequenceEqual(observed.tolist(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
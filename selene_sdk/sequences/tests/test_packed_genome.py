@@ -0,0 +1,124 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from selene_sdk.sequences.genome import Genome
+from selene_sdk.sequences.packed_genome import PackedGenome
+
+
+class TestPackedGenome(unittest.TestCase):
+    def setUp(self):
+        self.input_path = "selene_sdk/sequences/tests/files/small.fasta"
+        self.tmp_dir = tempfile.mkdtemp()
+        self.packed_path = os.path.join(self.tmp_dir, "small.packed")
+        self.genome = Genome(self.input_path)
+        self.len_chrs = dict(self.genome.get_chr_lens())
+        self.packed_genome = PackedGenome(
+            self.input_path, packed_path=self.packed_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_creates_packed_file(self):
+        self.assertTrue(os.path.exists(self.packed_path))
+        self.assertTrue(os.path.exists("{0}.idx".format(self.packed_path)))
+
+    def test_get_chrs(self):
+        self.assertSequenceEqual(self.packed_genome.get_chrs(),
+                                 sorted(self.genome.get_chrs()))
+        self.assertSequenceEqual(self.packed_genome.get_chr_lens(),
+                                 sorted(self.genome.get_chr_lens()))
+
+    def test_get_sequence_from_coords(self):
+        for chrom in ["chr1", "chr2", "chr4"]:
+            len_chrom = self.len_chrs[chrom]
+            for strand in ('+', '-'):
+                observed = self.packed_genome.get_sequence_from_coords(
+                    chrom, 0, len_chrom, strand=strand)
+                expected = self.genome.get_sequence_from_coords(
+                    chrom, 0, len_chrom, strand=strand)
+                expected = "".join(
+                    b if b in "ACGT" else "N" for b in expected.upper())
+                self.assertEqual(observed, expected)
+
+    def test_get_encoding_from_coords(self):
+        for chrom in ["chr1", "chr2", "chr4"]:
+            len_chrom = self.len_chrs[chrom]
+            for start in range(-2, len_chrom):
+                for end in range(start + 1, len_chrom + 3):
+                    for strand in ('+', '-'):
+                        observed = self.packed_genome.get_encoding_from_coords(
+                            chrom, start, end, strand=strand, pad=True)
+                        expected = self.genome.get_encoding_from_coords(
+                            chrom, start, end, strand=strand, pad=True)
+                        self.assertSequenceEqual(observed.tolist(),
+                                                 expected.tolist())
+
+    def test_get_encoding_from_coords_invalid(self):
+        observed = self.packed_genome.get_encoding_from_coords(
+            "chr1", 0, 101)
+        self.assertEqual(observed.shape, (0, 4))
+
+    def test_get_encoding_from_coords_check_unk(self):
+        _, has_unk = self.packed_genome.get_encoding_from_coords_check_unk(
+            "chr2", 0, 4)
+        self.assertFalse(has_unk)
+        _, has_unk = self.packed_genome.get_encoding_from_coords_check_unk(
+            "chr2", -1, 4, pad=True)
+        self.assertTrue(has_unk)
+
+    def test_get_encodings_from_coords(self):
+        observed, valid, n_unknown = \
+            self.packed_genome.get_encodings_from_coords(
+                ["chr1", "chr2", "chr1"], [0, 2, 100], [4, 6, 104],
+                strands=['+', '-', '+'])
+        expected, expected_valid, expected_n_unknown = \
+            self.genome.get_encodings_from_coords(
+                ["chr1", "chr2", "chr1"], [0, 2, 100], [4, 6, 104],
+                strands=['+', '-', '+'])
+        self.assertSequenceEqual(observed.tolist(), expected.tolist())
+        self.assertSequenceEqual(valid.tolist(), expected_valid.tolist())
+        self.assertSequenceEqual(n_unknown.tolist(),
+                                 expected_n_unknown.tolist())
+
+    def test_pickle(self):
+        self.packed_genome.get_encoding_from_coords("chr1", 0, 4)
+        unpickled = pickle.loads(pickle.dumps(self.packed_genome))
+        self.assertSequenceEqual(
+            unpickled.get_encoding_from_coords("chr1", 0, 4).tolist(),
+            self.genome.get_encoding_from_coords("chr1", 0, 4).tolist())
+
+    def test_out_of_bounds_region_raises(self):
+        len_chr1 = self.len_chrs["chr1"]
+        with self.assertRaises(ValueError):
+            self.packed_genome.get_unknown_mask_from_coords(
+                "chr1", len_chr1 - 10, len_chr1 + 10)
+        with self.assertRaises(ValueError):
+            self.packed_genome.get_unknown_mask_from_coords(
+                "chr1", 0, 10 ** 7)
+
+    def test_repacks_modified_fasta(self):
+        input_path = os.path.join(self.tmp_dir, "modified.fasta")
+        with open(input_path, 'w') as file_handle:
+            file_handle.write(">chr1\nACGTACGT\n")
+        packed_path = os.path.join(self.tmp_dir, "modified.packed")
+        self.assertEqual(
+            PackedGenome(input_path, packed_path=packed_path)
+                .get_sequence_from_coords("chr1", 0, 8),
+            "ACGTACGT")
+
+        with open(input_path, 'w') as file_handle:
+            file_handle.write(">chr1\nTTTTACGTAA\n")
+        os.utime(input_path, ns=(0, 10 ** 18))
+        os.remove("{0}.fai".format(input_path))
+        genome = PackedGenome(input_path, packed_path=packed_path)
+        self.assertEqual(genome.get_sequence_from_coords("chr1", 0, 10),
+                         "TTTTACGTAA")
+
+
+if __name__ == "__main__":
+    unittest.main()
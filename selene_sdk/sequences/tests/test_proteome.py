@@ -56,5 +56,14 @@ class TestProteome(unittest.TestCase):
         sequence = self.proteome.get_sequence_from_coords("prot0", 55, 59)
         self.assertEqual(sequence, "")
 
+    def test_get_encodings_from_coords(self):
+        encodings, valid, n_unknown = self.proteome.get_encodings_from_coords(
+            ["prot0", "prot0"], [0, 55], [21, 76])
+        expected = np.vstack([np.identity(20), np.full(20, self.fill_value)])
+        self.assertSequenceEqual(valid.tolist(), [True, False])
+        self.assertSequenceEqual(n_unknown.tolist(), [1, 0])
+        self.assertSequenceEqual(encodings[0].tolist(), expected.tolist())
+        self.assertFalse(encodings[1].any())
+
 if __name__ == "__main__":
     unittest.main()
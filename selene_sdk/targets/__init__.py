@@ -5,5 +5,6 @@ as a label or annotation on an input sequence.
 """
 from .target import Target
 from .genomic_features import GenomicFeatures
+from .genomic_features import InMemoryGenomicFeatures
 
-__all__ = ["Target", "GenomicFeatures"]
+__all__ = ["Target", "GenomicFeatures", "InMemoryGenomicFeatures"]
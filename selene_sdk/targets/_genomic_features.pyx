@@ -8,35 +8,283 @@ ctypedef np.int_t DTYPE_t
 ctypedef np.float32_t FDTYPE_t
 
 @cython.boundscheck(False)
-@cython.wraparound(False) 
+@cython.wraparound(False)
+cdef void _threshold_targets(long start,
+                             long end,
+                             const FDTYPE_t[:] thresholds,
+                             const np.int64_t[:] feature_starts,
+                             const np.int64_t[:] feature_ends,
+                             const np.int32_t[:] feature_indices,
+                             Py_ssize_t first_row,
+                             Py_ssize_t last_row,
+                             long min_end,
+                             np.int64_t[:] covered_until,
+                             np.int64_t[:] coverage,
+                             DTYPE_t[:] targets) nogil:
+    # counts the bases of the query covered by each feature by sweeping
+    # over rows `[first_row, last_row)` sorted by start, so that
+    # overlapping rows of the same feature are only counted once. Rows
+    # ending before `min_end` are skipped.
+    cdef Py_ssize_t n_features = targets.shape[0]
+    cdef Py_ssize_t row, index_feat
+    cdef long query_length = end - start
+    cdef long index_start, index_end
+    cdef FDTYPE_t min_overlap
+
+    for index_feat in range(n_features):
+        covered_until[index_feat] = 0
+        coverage[index_feat] = 0
+
+    for row in range(first_row, last_row):
+        if feature_ends[row] < min_end:
+            continue
+        index_start = max(0, feature_starts[row] - start)
+        index_end = min(feature_ends[row] - start, query_length)
+        if index_start == index_end:
+            index_end = min(index_end + 1, query_length)
+        index_feat = feature_indices[row]
+        if index_start < covered_until[index_feat]:
+            index_start = covered_until[index_feat]
+        if index_end > index_start:
+            coverage[index_feat] += index_end - index_start
+            covered_until[index_feat] = index_end
+
+    for index_feat in range(n_features):
+        min_overlap = thresholds[index_feat] * query_length - 1
+        if min_overlap < 0:
+            min_overlap = 0
+        targets[index_feat] = coverage[index_feat] > <long> min_overlap
+
+
+def _fast_get_feature_data_from_arrays(long start,
+                                       long end,
+                                       const FDTYPE_t[:] thresholds,
+                                       const np.int64_t[:] feature_starts,
+                                       const np.int64_t[:] feature_ends,
+                                       const np.int32_t[:] feature_indices):
+    cdef Py_ssize_t n_features = thresholds.shape[0]
+    cdef np.ndarray[DTYPE_t, ndim=1] targets = np.zeros(
+        n_features, dtype=np.int_)
+    cdef np.int64_t[:] covered_until = np.empty(n_features, dtype=np.int64)
+    cdef np.int64_t[:] coverage = np.empty(n_features, dtype=np.int64)
+    cdef DTYPE_t[:] targets_view = targets
+    with nogil:
+        _threshold_targets(start, end, thresholds,
+                           feature_starts, feature_ends, feature_indices,
+                           0, feature_starts.shape[0], 0,
+                           covered_until, coverage, targets_view)
+    return targets
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _fast_get_feature_data_batch(const np.int64_t[:] query_starts,
+                                 const np.int64_t[:] query_ends,
+                                 const np.int64_t[:] query_rows,
+                                 const np.int64_t[:] first_rows,
+                                 const np.int64_t[:] last_rows,
+                                 const FDTYPE_t[:] thresholds,
+                                 const np.int64_t[:] feature_starts,
+                                 const np.int64_t[:] feature_ends,
+                                 const np.int32_t[:] feature_indices,
+                                 DTYPE_t[:, :] targets):
+    # writes the target vector of query `i` into `targets[query_rows[i]]`.
+    # Only the rows `[first_rows[i], last_rows[i])` that end after the
+    # query start are considered.
+    cdef Py_ssize_t n_features = thresholds.shape[0]
+    cdef Py_ssize_t index
+    cdef np.int64_t[:] covered_until = np.empty(n_features, dtype=np.int64)
+    cdef np.int64_t[:] coverage = np.empty(n_features, dtype=np.int64)
+    with nogil:
+        for index in range(query_starts.shape[0]):
+            _threshold_targets(query_starts[index], query_ends[index],
+                               thresholds,
+                               feature_starts, feature_ends, feature_indices,
+                               first_rows[index], last_rows[index],
+                               query_starts[index] + 1,
+                               covered_until, coverage,
+                               targets[query_rows[index]])
+
+
 def _fast_get_feature_data(int start,
                            int end,
-                           np.ndarray[FDTYPE_t, ndim=1] thresholds,
+                           const FDTYPE_t[:] thresholds,
                            dict feature_index_dict,
                            rows):
     cdef int n_features = len(feature_index_dict)
-    cdef int query_length = end - start
-    cdef int feature_start, feature_end, index_start, index_end, index_feat
-    cdef np.ndarray[DTYPE_t, ndim=2] encoding = np.zeros(
-        (query_length, n_features), dtype=np.int)
-    cdef np.ndarray[DTYPE_t, ndim=1] targets = np.zeros(
-        n_features, dtype=np.int)
     cdef list row
+    cdef list feature_starts = []
+    cdef list feature_ends = []
+    cdef list feature_indices = []
 
     if rows is None:
         return np.zeros((n_features,))
-    
+
     for row in rows:
-        feature_start = int(row[1])
-        feature_end = int(row[2])
-        index_start = max(0, feature_start - start)
-        index_end = min(feature_end - start, query_length)
-        index_feat = feature_index_dict[row[3]]
-        if index_start == index_end:
-            index_end += 1
-        encoding[index_start:index_end, index_feat] = 1
+        feature_starts.append(int(row[1]))
+        feature_ends.append(int(row[2]))
+        feature_indices.append(feature_index_dict[row[3]])
 
-    thresholds = (thresholds * query_length - 1).clip(min=0)
-    targets = (np.sum(encoding, axis=0) > thresholds.astype(int)).astype(int)
-    return targets
+    starts_arr = np.array(feature_starts, dtype=np.int64)
+    # the sweep in `_threshold_targets` expects rows sorted by start
+    order = np.argsort(starts_arr, kind="stable")
+    return _fast_get_feature_data_from_arrays(
+        start, end, thresholds,
+        starts_arr[order],
+        np.array(feature_ends, dtype=np.int64)[order],
+        np.array(feature_indices, dtype=np.int32)[order])
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _advance_base(long base,
+                        const np.int64_t[:] feature_starts,
+                        const np.int64_t[:] feature_ends,
+                        const np.int32_t[:] feature_indices,
+                        const np.int64_t[:] end_order,
+                        np.int64_t[:] state,
+                        np.int64_t[:] depth,
+                        np.int64_t[:] active,
+                        np.int64_t[:] active_pos) nogil:
+    # updates the number of rows of each feature covering `base`, and the
+    # list of features that cover it. `state` holds the next row in
+    # start order, the next row in end order and the number of active
+    # features.
+    cdef Py_ssize_t n_rows = feature_starts.shape[0]
+    cdef Py_ssize_t feat, last
+    while state[0] < n_rows and feature_starts[state[0]] <= base:
+        feat = feature_indices[state[0]]
+        depth[feat] += 1
+        if depth[feat] == 1:
+            active_pos[feat] = state[2]
+            active[state[2]] = feat
+            state[2] += 1
+        state[0] += 1
+    while state[1] < n_rows and feature_ends[end_order[state[1]]] <= base:
+        feat = feature_indices[end_order[state[1]]]
+        depth[feat] -= 1
+        if depth[feat] == 0:
+            state[2] -= 1
+            last = active[state[2]]
+            active[active_pos[feat]] = last
+            active_pos[last] = active_pos[feat]
+        state[1] += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bint _update_target_bit(Py_ssize_t feat,
+                                    const np.int64_t[:] coverage,
+                                    const np.int64_t[:] min_overlaps,
+                                    unsigned char[:] packed_targets) nogil:
+    # sets the bit of `feat` (packed most significant bit first, as in
+    # `numpy.packbits`) and returns whether it changed
+    cdef unsigned char mask = 1 << (7 - feat % 8)
+    cdef bint target = coverage[feat] > min_overlaps[feat]
+    if target == ((packed_targets[feat // 8] & mask) != 0):
+        return False
+    packed_targets[feat // 8] ^= mask
+    return True
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def _fast_interval_target_segments(long interval_start,
+                                   long interval_end,
+                                   long start_radius,
+                                   long end_radius,
+                                   const FDTYPE_t[:] thresholds,
+                                   const np.int64_t[:] feature_starts,
+                                   const np.int64_t[:] feature_ends,
+                                   const np.int32_t[:] feature_indices,
+                                   const np.int64_t[:] end_order,
+                                   np.int64_t[:] segment_offsets,
+                                   unsigned char[:, :] segment_targets):
+    # computes the target vector of the query
+    # `[p - start_radius, p + end_radius)` for every position `p` in
+    # `[interval_start, interval_end)`, by sliding the query one base at
+    # a time and updating the covered bases of the features that cover
+    # the bases entering and leaving it. Consecutive positions with the
+    # same targets form a segment: the offset of each segment from
+    # `interval_start` and its bit-packed targets are written to the
+    # buffers, and the number of segments is returned (-1 if the buffers
+    # are too small). Rows must be sorted by start, and `end_order` sorts
+    # them by end.
+    cdef Py_ssize_t n_features = thresholds.shape[0]
+    cdef Py_ssize_t n_bytes = segment_targets.shape[1]
+    cdef Py_ssize_t capacity = segment_offsets.shape[0]
+    cdef long query_length = start_radius + end_radius
+    cdef np.int64_t[:] depth_front = np.zeros(n_features, dtype=np.int64)
+    cdef np.int64_t[:] depth_back = np.zeros(n_features, dtype=np.int64)
+    cdef np.int64_t[:] active_front = np.empty(n_features, dtype=np.int64)
+    cdef np.int64_t[:] active_back = np.empty(n_features, dtype=np.int64)
+    cdef np.int64_t[:] pos_front = np.empty(n_features, dtype=np.int64)
+    cdef np.int64_t[:] pos_back = np.empty(n_features, dtype=np.int64)
+    cdef np.int64_t[:] state_front = np.zeros(3, dtype=np.int64)
+    cdef np.int64_t[:] state_back = np.zeros(3, dtype=np.int64)
+    cdef np.int64_t[:] coverage = np.zeros(n_features, dtype=np.int64)
+    cdef np.int64_t[:] min_overlaps = np.empty(n_features, dtype=np.int64)
+    cdef unsigned char[:] packed_targets = np.zeros(n_bytes, dtype=np.uint8)
+    cdef Py_ssize_t n_segments = 0
+    cdef Py_ssize_t index, feat
+    cdef long base, offset
+    cdef FDTYPE_t min_overlap
+    cdef bint changed
+
+    with nogil:
+        for feat in range(n_features):
+            min_overlap = thresholds[feat] * query_length - 1
+            if min_overlap < 0:
+                min_overlap = 0
+            min_overlaps[feat] = <long> min_overlap
+
+        for base in range(interval_start - start_radius,
+                          interval_start + end_radius):
+            _advance_base(base, feature_starts, feature_ends,
+                          feature_indices, end_order,
+                          state_front, depth_front, active_front, pos_front)
+            for index in range(state_front[2]):
+                coverage[active_front[index]] += 1
+        for feat in range(n_features):
+            _update_target_bit(feat, coverage, min_overlaps, packed_targets)
+
+        for offset in range(interval_end - interval_start):
+            if offset > 0:
+                # the base `start_radius` before the previous position
+                # leaves the query and the base `end_radius` after it
+                # enters
+                _advance_base(interval_start + offset - 1 - start_radius,
+                              feature_starts, feature_ends,
+                              feature_indices, end_order,
+                              state_back, depth_back, active_back, pos_back)
+                for index in range(state_back[2]):
+                    coverage[active_back[index]] -= 1
+                _advance_base(interval_start + offset - 1 + end_radius,
+                              feature_starts, feature_ends,
+                              feature_indices, end_order,
+                              state_front, depth_front, active_front,
+                              pos_front)
+                for index in range(state_front[2]):
+                    coverage[active_front[index]] += 1
+
+                # only the features covering these bases can change
+                changed = False
+                for index in range(state_back[2]):
+                    changed |= _update_target_bit(
+                        active_back[index], coverage, min_overlaps,
+                        packed_targets)
+                for index in range(state_front[2]):
+                    changed |= _update_target_bit(
+                        active_front[index], coverage, min_overlaps,
+                        packed_targets)
+                if not changed:
+                    continue
 
+            if n_segments == capacity:
+                n_segments = -1
+                break
+            segment_offsets[n_segments] = offset
+            segment_targets[n_segments, :] = packed_targets
+            n_segments += 1
+    return n_segments
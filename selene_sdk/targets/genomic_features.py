@@ -11,14 +11,24 @@ Additionally, the column names should be omitted from the file itself
 (i.e. there is no header and the first line in the file is the first
 row of genome coordinates for a feature).
 """
+import os
 import types
 
 import tabix
 import numpy as np
+import pandas as pd
 
 from functools import wraps
 from .target import Target
 from ._genomic_features import _fast_get_feature_data
+from ._genomic_features import _fast_get_feature_data_batch
+from ._genomic_features import _fast_get_feature_data_from_arrays
+from ._genomic_features import _fast_interval_target_segments
+
+
+# regions of a batch on the same chromosome that are at most this many
+# bases apart are answered from a single tabix query
+_TABIX_SWEEP_GAP = 10000
 
 
 def _any_positive_rows(rows, start, end, thresholds):
@@ -138,6 +148,20 @@ def _get_feature_data(chrom, start, end,
         start, end, thresholds, feature_index_dict, rows)
 
 
+def _targets_buffer(targets, n_queries, n_features):
+    """
+    Checks a caller-provided buffer of target vectors, or allocates a
+    new one if `targets` is None.
+    """
+    if targets is None:
+        return np.zeros((n_queries, n_features))
+    if targets.shape != (n_queries, n_features):
+        raise ValueError(
+            "Targets buffer has shape {0} but {1} queries of {2} features "
+            "were given.".format(targets.shape, n_queries, n_features))
+    return targets
+
+
 def _define_feature_thresholds(feature_thresholds, features):
     """
     Defines the minimal overlap thresholds for the various features.
@@ -295,6 +319,14 @@ class GenomicFeatures(Target):
             self.data = tabix.open(self.input_path)
             self._initialized = True
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if "data" in state:
+            # the tabix handle is reopened when needed
+            state.pop("data")
+            state["_initialized"] = False
+        return state
+
     def init(func):
         # delay initialization to allow multiprocessing
         @wraps(func)
@@ -399,3 +431,552 @@ class GenomicFeatures(Target):
         return _get_feature_data(
             chrom, start, end, self._feature_thresholds_vec,
             self.feature_index_dict, self._query_tabix)
+
+    @init
+    def get_feature_rows(self, chrom, start, end):
+        """
+        Gets the feature annotations that overlap the given region.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the region (e.g. '1', '2', ..., 'X', 'Y').
+        start : int
+            The 0-based first position in the region.
+        end : int
+            One past the 0-based last position in the region.
+
+        Returns
+        -------
+        starts, ends, feature_indices : \
+        tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+            The coordinates `[starts[i], ends[i])` of the annotations,
+            sorted by start, and the index of the feature of each.
+
+        """
+        rows = self._query_tabix(chrom, start, end)
+        feature_starts = []
+        feature_ends = []
+        feature_indices = []
+        for row in (rows or []):
+            feature_starts.append(int(row[1]))
+            feature_ends.append(int(row[2]))
+            feature_indices.append(self.feature_index_dict[row[3]])
+        order = np.argsort(feature_starts, kind="stable")
+        return (np.array(feature_starts, dtype=np.int64)[order],
+                np.array(feature_ends, dtype=np.int64)[order],
+                np.array(feature_indices, dtype=np.int32)[order])
+
+    def get_feature_data_segments(self,
+                                  chrom,
+                                  start,
+                                  end,
+                                  start_radius,
+                                  end_radius):
+        """
+        Computes the target vectors of the regions
+        `[p - start_radius, p + end_radius)` centered at every position
+        `p` in `[start, end)`, e.g. the bins around all the positions
+        that can be drawn from an interval. Since neighboring positions
+        usually have the same targets, they are returned as segments of
+        positions with the same targets.
+
+        Zero-length annotations are treated as covering one base.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the region (e.g. '1', '2', ..., 'X', 'Y').
+        start : int
+            The first position.
+        end : int
+            One past the last position.
+        start_radius : int
+            The number of bases in each region before its center.
+        end_radius : int
+            The number of bases in each region from its center on.
+
+        Returns
+        -------
+        segment_starts, segment_ends, packed_targets : \
+        tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+            The positions `[segment_starts[i], segment_ends[i])` have the
+            target vector `numpy.unpackbits(packed_targets[i],
+            count=self.n_features)`, which is the one
+            `get_feature_data` returns for their regions.
+
+        """
+        if end <= start:
+            return (np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.int64),
+                    np.zeros((0, (self.n_features + 7) // 8), dtype=np.uint8))
+        thresholds = self._feature_thresholds_vec
+        if thresholds is None:
+            # with a threshold of 0, any overlapping row is positive
+            thresholds = np.zeros(self.n_features, dtype=np.float32)
+        feature_starts, feature_ends, feature_indices = self.get_feature_rows(
+            chrom, start - start_radius, end - 1 + end_radius)
+        feature_ends = np.maximum(feature_ends, feature_starts + 1)
+        end_order = np.argsort(feature_ends, kind="stable")
+
+        capacity = 16
+        n_segments = -1
+        while n_segments < 0:
+            capacity *= 4
+            segment_offsets = np.empty(capacity, dtype=np.int64)
+            packed_targets = np.empty(
+                (capacity, (self.n_features + 7) // 8), dtype=np.uint8)
+            n_segments = _fast_interval_target_segments(
+                start, end, start_radius, end_radius, thresholds,
+                feature_starts, feature_ends, feature_indices, end_order,
+                segment_offsets, packed_targets)
+        segment_starts = start + segment_offsets[:n_segments]
+        segment_ends = np.append(segment_starts[1:], end)
+        return segment_starts, segment_ends, packed_targets[:n_segments]
+
+    def get_feature_data_batch(self, chroms, starts, ends, targets=None):
+        """
+        Computes which features overlap with each of a batch of regions.
+        The regions on each chromosome are sorted by start and split
+        into runs wherever the gap to the regions before exceeds
+        `_TABIX_SWEEP_GAP` bases. The rows of each run are fetched
+        with one tabix query, and all the target vectors are computed
+        in a single call to the compiled sweep that
+        `InMemoryGenomicFeatures` uses. Batches drawn all over the
+        genome still take about one query per region, so
+        `InMemoryGenomicFeatures` remains much faster for them.
+
+        Parameters
+        ----------
+        chroms : list(str) or numpy.ndarray
+            The names of the regions (e.g. '1', '2', ..., 'X', 'Y').
+        starts : list(int) or numpy.ndarray
+            The 0-based first positions in the regions.
+        ends : list(int) or numpy.ndarray
+            One past the 0-based last positions in the regions.
+        targets : numpy.ndarray or None, optional
+            Default is None. A :math:`B \\times F` buffer to write the
+            target vectors into, where :math:`B` is the number of
+            regions and :math:`F` is `self.n_features`. If None, a new
+            `float` array is allocated.
+
+        Returns
+        -------
+        numpy.ndarray
+            The :math:`B \\times F` array `targets`, where row `i` is
+            the target vector that `get_feature_data` returns for the
+            `i`th region.
+
+        """
+        chroms = np.asarray(chroms, dtype=str)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        targets = _targets_buffer(targets, len(starts), self.n_features)
+        thresholds = self._feature_thresholds_vec
+        if thresholds is None:
+            # with a threshold of 0, any overlapping row is positive
+            thresholds = np.zeros(self.n_features, dtype=np.float32)
+
+        query_rows, first_rows, last_rows = [], [], []
+        feature_starts, feature_ends, feature_indices = [], [], []
+        n_feature_rows = 0
+        unique_chroms, chrom_queries = np.unique(chroms, return_inverse=True)
+        for index, chrom in enumerate(unique_chroms):
+            rows = np.nonzero(chrom_queries == index)[0]
+            rows = rows[np.argsort(starts[rows], kind="stable")]
+            covered_until = np.maximum.accumulate(ends[rows])
+            run_breaks = np.nonzero(
+                starts[rows[1:]] - covered_until[:-1] > _TABIX_SWEEP_GAP)[0]
+            for run in np.split(rows, run_breaks + 1):
+                run_starts, run_ends, run_indices = self.get_feature_rows(
+                    chrom, int(starts[run[0]]), int(ends[run].max()))
+                max_ends = np.maximum.accumulate(run_ends)
+                query_rows.append(run)
+                first_rows.append(n_feature_rows + np.searchsorted(
+                    max_ends, starts[run], side="right"))
+                last_rows.append(n_feature_rows + np.searchsorted(
+                    run_starts, ends[run], side="left"))
+                feature_starts.append(run_starts)
+                feature_ends.append(run_ends)
+                feature_indices.append(run_indices)
+                n_feature_rows += len(run_starts)
+
+        batch_targets = np.zeros(targets.shape, dtype=np.int_)
+        if query_rows:
+            query_rows = np.concatenate(query_rows)
+            _fast_get_feature_data_batch(
+                starts[query_rows],
+                ends[query_rows],
+                query_rows,
+                np.concatenate(first_rows).astype(np.int64),
+                np.concatenate(last_rows).astype(np.int64),
+                thresholds,
+                np.concatenate(feature_starts),
+                np.concatenate(feature_ends),
+                np.concatenate(feature_indices),
+                batch_targets)
+        targets[...] = batch_targets
+        return targets
+
+
+def _load_feature_arrays(input_path, features):
+    """
+    Loads the rows of a `*.bed` file of features into arrays sorted by
+    chromosome and start coordinate. Rows whose feature is not in
+    `features` are skipped.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to a (optionally gzipped) `*.bed` file with the columns
+        `[chrom, start, end, feature]`.
+    features : list(str)
+        The list of feature names.
+
+    Returns
+    -------
+    dict
+        A dictionary with the arrays `chroms` and `chrom_offsets` (the
+        rows of chromosome `chroms[i]` are
+        `chrom_offsets[i]:chrom_offsets[i + 1]`), `starts`, `ends`,
+        `feature_indices` and `features`.
+
+    """
+    rows = pd.read_csv(input_path,
+                       sep='\t',
+                       header=None,
+                       usecols=[0, 1, 2, 3],
+                       names=["chrom", "start", "end", "feature"],
+                       dtype={"chrom": str, "start": np.int64,
+                              "end": np.int64, "feature": str},
+                       comment='#')
+    feature_indices = rows["feature"].map(
+        {feature: index for index, feature in enumerate(features)})
+    rows = rows[feature_indices.notna()]
+    rows = rows.assign(feature=feature_indices[feature_indices.notna()])
+    rows = rows.sort_values(["chrom", "start"], kind="mergesort")
+
+    chroms, chrom_counts = np.unique(rows["chrom"].values, return_counts=True)
+    return {
+        "chroms": chroms.astype(str),
+        "chrom_offsets": np.concatenate([[0], np.cumsum(chrom_counts)]),
+        "starts": rows["start"].values.astype(np.int64),
+        "ends": rows["end"].values.astype(np.int64),
+        "feature_indices": rows["feature"].values.astype(np.int32),
+        "features": np.array(features, dtype=str),
+    }
+
+
+class InMemoryGenomicFeatures(GenomicFeatures):
+    """
+    Stores the dataset specifying sequence regions and features in
+    memory. The `*.bed` file is loaded once into per-chromosome arrays of
+    feature starts, ends and indices sorted by start coordinate, so a
+    query is a binary search followed by a vectorized overlap check
+    instead of a tabix query whose rows must be parsed from strings.
+
+    This class can be used anywhere a `GenomicFeatures` is expected, and
+    returns the same targets. Rows of the `*.bed` file whose feature is
+    not in `features` are ignored.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to the dataset, a `*.bed` file (optionally gzipped) with the
+        columns `[chrom, start, end, feature]`. It does not need to be
+        sorted or tabix-indexed.
+    features : list(str)
+        The non-redundant list of genomic features (i.e. labels)
+        that will be predicted.
+    feature_thresholds : float or dict or types.FunctionType or None
+        Default is None. See `selene_sdk.targets.GenomicFeatures`.
+    cache_path : str or None, optional
+        Default is None. Path to a `*.npz` file in which the loaded
+        arrays are cached, so that later runs (and each DataLoader
+        worker) skip parsing the `*.bed` file. The cache is rebuilt if
+        it was created for a different list of features, or if
+        `input_path` was modified since. If `input_path` does not exist,
+        the cache is used as is.
+    init_unpicklable : bool, optional
+        Default is False. See `selene_sdk.targets.GenomicFeatures`.
+
+    Attributes
+    ----------
+    n_features : int
+        The number of distinct features.
+    feature_index_dict : dict
+        A dictionary mapping feature names (`str`) to indices (`int`),
+        where the index is the position of the feature in `features`.
+    index_feature_dict : dict
+        A dictionary mapping indices (`int`) to feature names (`str`),
+        where the index is the position of the feature in the input
+        features.
+    feature_thresholds : dict or None
+        See `selene_sdk.targets.GenomicFeatures`.
+
+    """
+
+    def __init__(self,
+                 input_path,
+                 features,
+                 feature_thresholds=None,
+                 cache_path=None,
+                 init_unpicklable=False):
+        """
+        Constructs a new `InMemoryGenomicFeatures` object.
+        """
+        self.cache_path = cache_path
+        self._features = list(features)
+        super(InMemoryGenomicFeatures, self).__init__(
+            input_path,
+            features,
+            feature_thresholds=feature_thresholds,
+            init_unpicklable=init_unpicklable)
+
+    def _get_source(self):
+        """
+        Returns the path, size and modification time of `input_path`,
+        which identify the version of the file that the cache was built
+        from, or None if it does not exist.
+        """
+        if not os.path.exists(self.input_path):
+            return None
+        stat = os.stat(self.input_path)
+        return np.array([self.input_path,
+                         str(stat.st_size),
+                         str(stat.st_mtime_ns)])
+
+    def _load_arrays(self):
+        source = self._get_source()
+        if self.cache_path is not None and os.path.exists(self.cache_path):
+            with np.load(self.cache_path) as cache:
+                arrays = dict(cache)
+            # a cache whose `*.bed` file does not exist anymore is used
+            # as is
+            if arrays["features"].tolist() == self._features and \
+                    (source is None or
+                     np.array_equal(arrays.get("source"), source)):
+                return arrays
+
+        arrays = _load_feature_arrays(self.input_path, self._features)
+        arrays["source"] = source
+        if self.cache_path is not None:
+            tmp_path = "{0}.{1}.tmp".format(self.cache_path, os.getpid())
+            with open(tmp_path, 'wb') as file_handle:
+                np.savez(file_handle, **arrays)
+            os.replace(tmp_path, self.cache_path)
+        return arrays
+
+    def _unpicklable_init(self):
+        if not self._initialized:
+            arrays = self._load_arrays()
+            self._chrom_arrays = {}
+            self._chrom_offsets = {}
+            self._feature_starts = arrays["starts"]
+            self._feature_ends = arrays["ends"]
+            self._feature_indices = arrays["feature_indices"]
+            offsets = arrays["chrom_offsets"]
+            for i, chrom in enumerate(arrays["chroms"]):
+                rows = slice(offsets[i], offsets[i + 1])
+                self._chrom_offsets[chrom] = offsets[i]
+                ends = arrays["ends"][rows]
+                # rows are sorted by start, so the running maximum of
+                # the ends locates the first row that can overlap a
+                # query with a binary search
+                self._chrom_arrays[chrom] = (arrays["starts"][rows],
+                                             ends,
+                                             arrays["feature_indices"][rows],
+                                             np.maximum.accumulate(ends))
+            if self.feature_thresholds is not None:
+                self._feature_thresholds_arr = np.array(
+                    [self.feature_thresholds[f] for f in self._features],
+                    dtype=np.float64)
+            self._initialized = True
+
+    def _query_arrays(self, chrom, start, end):
+        """
+        Gets the starts, ends and feature indices of the rows that
+        overlap the region `[start, end)`, sorted by start.
+        """
+        if chrom not in self._chrom_arrays:
+            return None
+        starts, ends, feature_indices, max_ends = self._chrom_arrays[chrom]
+        first_row = np.searchsorted(max_ends, start, side="right")
+        last_row = np.searchsorted(starts, end, side="left")
+        overlaps = ends[first_row:last_row] > start
+        return (starts[first_row:last_row][overlaps],
+                ends[first_row:last_row][overlaps],
+                feature_indices[first_row:last_row][overlaps])
+
+    @GenomicFeatures.init
+    def get_feature_rows(self, chrom, start, end):
+        """
+        Gets the feature annotations that overlap the given region.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the region (e.g. '1', '2', ..., 'X', 'Y').
+        start : int
+            The 0-based first position in the region.
+        end : int
+            One past the 0-based last position in the region.
+
+        Returns
+        -------
+        starts, ends, feature_indices : \
+        tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+            The coordinates `[starts[i], ends[i])` of the annotations,
+            sorted by start, and the index of the feature of each.
+
+        """
+        rows = self._query_arrays(chrom, start, end)
+        if rows is None:
+            return (np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.int32))
+        return rows
+
+    @GenomicFeatures.init
+    def is_positive(self, chrom, start, end):
+        """
+        Determines whether the query the `chrom` queried contains any
+        genomic features within the :math:`[start, end)` region. If so,
+        the query is considered positive.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the region (e.g. '1', '2', ..., 'X', 'Y').
+        start : int
+            The 0-based first position in the region.
+        end : int
+            One past the 0-based last position in the region.
+
+        Returns
+        -------
+        bool
+            `True` if this meets the criterion for a positive example,
+            `False` otherwise.
+
+        """
+        rows = self._query_arrays(chrom, start, end)
+        if rows is None or len(rows[0]) == 0:
+            return False
+        if self.feature_thresholds is None:
+            return True
+        feature_starts, feature_ends, feature_indices = rows
+        overlaps = (np.minimum(feature_ends, end) -
+                    np.maximum(feature_starts, start))
+        min_overlaps = np.maximum(
+            ((end - start) * self._feature_thresholds_arr[feature_indices] -
+             1).astype(np.int64), 0)
+        return bool(np.any(overlaps > min_overlaps))
+
+    @GenomicFeatures.init
+    def get_feature_data(self, chrom, start, end):
+        """
+        Computes which features overlap with the given region.
+
+        Parameters
+        ----------
+        chrom : str
+            The name of the region (e.g. '1', '2', ..., 'X', 'Y').
+        start : int
+            The 0-based first position in the region.
+        end : int
+            One past the 0-based last position in the region.
+
+        Returns
+        -------
+        numpy.ndarray
+            A target vector of size `self.n_features` where the `i`th
+            position is equal to one if the `i`th feature is positive,
+            and zero otherwise.
+
+        """
+        rows = self._query_arrays(chrom, start, end)
+        if self._feature_thresholds_vec is None:
+            features = np.zeros(self.n_features)
+            if rows is not None:
+                features[rows[2]] = 1
+            return features
+        if rows is None:
+            return np.zeros((self.n_features,))
+        return _fast_get_feature_data_from_arrays(
+            start, end, self._feature_thresholds_vec, *rows)
+
+    @GenomicFeatures.init
+    def get_feature_data_batch(self, chroms, starts, ends, targets=None):
+        """
+        Computes which features overlap with each of a batch of regions.
+        The queries on each chromosome are sorted by start so that the
+        rows that can overlap them are located with one vectorized
+        binary search, and all the target vectors are computed in a
+        single call to a compiled sweep.
+
+        Parameters
+        ----------
+        chroms : list(str) or numpy.ndarray
+            The names of the regions (e.g. '1', '2', ..., 'X', 'Y').
+        starts : list(int) or numpy.ndarray
+            The 0-based first positions in the regions.
+        ends : list(int) or numpy.ndarray
+            One past the 0-based last positions in the regions.
+        targets : numpy.ndarray or None, optional
+            Default is None. A :math:`B \\times F` buffer to write the
+            target vectors into, where :math:`B` is the number of
+            regions and :math:`F` is `self.n_features`. If None, a new
+            `float` array is allocated.
+
+        Returns
+        -------
+        numpy.ndarray
+            The :math:`B \\times F` array `targets`, where row `i` is
+            the target vector that `get_feature_data` returns for the
+            `i`th region.
+
+        """
+        chroms = np.asarray(chroms, dtype=str)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        targets = _targets_buffer(targets, len(starts), self.n_features)
+        thresholds = self._feature_thresholds_vec
+        if thresholds is None:
+            # with a threshold of 0, any overlapping row is positive
+            thresholds = np.zeros(self.n_features, dtype=np.float32)
+
+        query_rows, query_starts, query_ends = [], [], []
+        first_rows, last_rows = [], []
+        unique_chroms, chrom_queries = np.unique(chroms, return_inverse=True)
+        for index, chrom in enumerate(unique_chroms):
+            if chrom not in self._chrom_arrays:
+                continue
+            rows = np.nonzero(chrom_queries == index)[0]
+            rows = rows[np.argsort(starts[rows], kind="stable")]
+            feature_starts, _, _, max_ends = self._chrom_arrays[chrom]
+            # row offsets into the concatenation of all chromosomes
+            offset = self._chrom_offsets[chrom]
+            query_rows.append(rows)
+            query_starts.append(starts[rows])
+            query_ends.append(ends[rows])
+            first_rows.append(offset + np.searchsorted(
+                max_ends, starts[rows], side="right"))
+            last_rows.append(offset + np.searchsorted(
+                feature_starts, ends[rows], side="left"))
+
+        batch_targets = np.zeros(targets.shape, dtype=np.int_)
+        if query_rows:
+            _fast_get_feature_data_batch(
+                np.concatenate(query_starts),
+                np.concatenate(query_ends),
+                np.concatenate(query_rows),
+                np.concatenate(first_rows).astype(np.int64),
+                np.concatenate(last_rows).astype(np.int64),
+                thresholds,
+                self._feature_starts,
+                self._feature_ends,
+                self._feature_indices,
+                batch_targets)
+        targets[...] = batch_targets
+        return targets
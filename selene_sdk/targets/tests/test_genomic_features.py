@@ -1,9 +1,13 @@
 import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
 import numpy as np
 
 from selene_sdk.targets import GenomicFeatures
+from selene_sdk.targets import InMemoryGenomicFeatures
 from selene_sdk.targets.genomic_features import _any_positive_rows, \
     _is_positive_row, _get_feature_data
 
@@ -192,6 +196,35 @@ class TestGenomicFeatures(unittest.TestCase):
         self.assertSequenceEqual(
             observed_encoding.tolist(), expected_encoding)
 
+    def test__get_feature_data_unsorted_rows(self):
+        query_start, query_end = 8619, 8719
+        threshold = np.array([0.50] * self.n_features).astype(np.float32)
+
+        def get_reversed_rows(chrom, start, end):
+            return list(reversed(self.rows_example3))
+
+        expected_encoding = [1, 1, 0, 0, 0, 1]
+        observed_encoding = _get_feature_data(
+            "3", query_start, query_end, threshold,
+            self.feature_index_map, get_reversed_rows)
+
+        self.assertSequenceEqual(
+            observed_encoding.tolist(), expected_encoding)
+
+    def test__get_feature_data_overlapping_rows_long_query(self):
+        query_start, query_end = 0, 100000
+        threshold = np.array([0.0015] * self.n_features).astype(np.float32)
+
+        # the CTCF rows cover 16110 to 16239 (129 bases), which is less
+        # than 0.15% of the query even though their lengths sum to 190
+        expected_encoding = [0, 0, 0, 0, 0, 0]
+        observed_encoding = _get_feature_data(
+            "1", query_start, query_end, threshold,
+            self.feature_index_map, self.get_feature_rows)
+
+        self.assertSequenceEqual(
+            observed_encoding.tolist(), expected_encoding)
+
     ############################################
     # GenomicFeatures integration tests
     ############################################
@@ -290,6 +323,157 @@ class TestGenomicFeatures(unittest.TestCase):
             expected_feature_data
         )
 
+    ############################################
+    # InMemoryGenomicFeatures integration tests
+    ############################################
+
+    def test_InMemoryGenomicFeatures_matches_GenomicFeatures(self):
+        data_path = os.path.join(
+            "selene_sdk", "targets", "tests",
+            "files", "sorted_aggregate.bed.gz")
+        queries = [('1', 16000, 17000), ('1', 16000, 16500),
+                   ('1', 16110, 16111), ('1', 10, 1000),
+                   ('10', 100000, 110000), ('2', 0, 1000)]
+        for feature_thresholds in [None, 0.5, {"default": 0.3, "CTCF": 0.9}]:
+            query_features = GenomicFeatures(
+                data_path, self.features,
+                feature_thresholds=feature_thresholds)
+            in_memory_features = InMemoryGenomicFeatures(
+                data_path, self.features,
+                feature_thresholds=feature_thresholds)
+            for chrom, start, end in queries:
+                np.testing.assert_array_equal(
+                    in_memory_features.get_feature_data(chrom, start, end),
+                    query_features.get_feature_data(chrom, start, end))
+                if feature_thresholds is not None:
+                    self.assertEqual(
+                        in_memory_features.is_positive(chrom, start, end),
+                        query_features.is_positive(chrom, start, end))
+
+    def test_InMemoryGenomicFeatures_cache(self):
+        data_path = os.path.join(
+            "selene_sdk", "targets", "tests",
+            "files", "sorted_aggregate.bed.gz")
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            cache_path = os.path.join(tmp_dir, "features.npz")
+            InMemoryGenomicFeatures(
+                data_path, self.features, feature_thresholds=0.5,
+                cache_path=cache_path, init_unpicklable=True)
+            self.assertTrue(os.path.exists(cache_path))
+
+            query_features = InMemoryGenomicFeatures(
+                "missing.bed.gz", self.features, feature_thresholds=0.5,
+                cache_path=cache_path)
+            expected_feature_data = np.zeros(self.n_features)
+            expected_feature_data[self.feature_index_map['CTCF']] = 1.
+            np.testing.assert_array_almost_equal(
+                query_features.get_feature_data('1', 16000, 16500),
+                expected_feature_data)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_InMemoryGenomicFeatures_cache_is_rebuilt(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            data_path = os.path.join(tmp_dir, "features.bed")
+            cache_path = os.path.join(tmp_dir, "features.npz")
+            with open(data_path, 'w') as file_handle:
+                file_handle.write("1\t100\t200\tCTCF\n")
+            os.utime(data_path, ns=(0, 10 ** 18))
+            query_features = InMemoryGenomicFeatures(
+                data_path, self.features, cache_path=cache_path)
+            self.assertTrue(query_features.is_positive('1', 150, 160))
+
+            with open(data_path, 'w') as file_handle:
+                file_handle.write("1\t300\t400\tCTCF\n")
+            os.utime(data_path, ns=(0, 2 * 10 ** 18))
+            query_features = InMemoryGenomicFeatures(
+                data_path, self.features, cache_path=cache_path)
+            self.assertFalse(query_features.is_positive('1', 150, 160))
+            self.assertTrue(query_features.is_positive('1', 350, 360))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_get_feature_data_batch(self):
+        data_path = os.path.join(
+            "selene_sdk", "targets", "tests",
+            "files", "sorted_aggregate.bed.gz")
+        queries = [('1', 16000, 17000), ('2', 0, 1000),
+                   ('1', 16110, 16111), ('1', 10, 1000),
+                   ('10', 100000, 110000), ('1', 16000, 16500)]
+        chroms, starts, ends = zip(*queries)
+        for feature_thresholds in [None, 0.5, {"default": 0.3, "CTCF": 0.9}]:
+            for features_class in [GenomicFeatures, InMemoryGenomicFeatures]:
+                query_features = features_class(
+                    data_path, self.features,
+                    feature_thresholds=feature_thresholds)
+                targets = np.full((len(queries), self.n_features), -1.)
+                observed = query_features.get_feature_data_batch(
+                    chroms, starts, ends, targets=targets)
+                self.assertIs(observed, targets)
+                for index, (chrom, start, end) in enumerate(queries):
+                    np.testing.assert_array_equal(
+                        observed[index],
+                        query_features.get_feature_data(chrom, start, end))
+
+        with self.assertRaises(ValueError):
+            query_features.get_feature_data_batch(
+                chroms, starts, ends, targets=np.zeros((1, self.n_features)))
+
+    def test_get_feature_data_batch_groups_tabix_queries(self):
+        data_path = os.path.join(
+            "selene_sdk", "targets", "tests",
+            "files", "sorted_aggregate.bed.gz")
+        random_state = np.random.RandomState(0)
+        chroms = random_state.choice(['1', '10', '2'], 200)
+        starts = np.where(chroms == '10',
+                          random_state.randint(110000, 130000, 200),
+                          random_state.randint(10000, 60000, 200))
+        ends = starts + random_state.randint(1, 2000, 200)
+        for feature_thresholds in [None, 0.5, {"default": 0.3, "CTCF": 0.9}]:
+            query_features = GenomicFeatures(
+                data_path, self.features,
+                feature_thresholds=feature_thresholds)
+            expected = np.array([
+                query_features.get_feature_data(chrom, start, end)
+                for chrom, start, end in zip(chroms, starts, ends)])
+            with mock.patch.object(
+                    query_features, "_query_tabix",
+                    wraps=query_features._query_tabix) as query_tabix:
+                observed = query_features.get_feature_data_batch(
+                    chroms, starts, ends)
+            np.testing.assert_array_equal(observed, expected)
+            self.assertTrue(np.any(observed))
+            self.assertEqual(query_tabix.call_count, 3)
+
+    def test_get_feature_data_segments(self):
+        data_path = os.path.join(
+            "selene_sdk", "targets", "tests",
+            "files", "sorted_aggregate.bed.gz")
+        start, end = 15900, 16700
+        positions = np.arange(start, end)
+        for feature_thresholds in [None, 0.5, {"default": 0.3, "CTCF": 0.9}]:
+            for features_class in [GenomicFeatures, InMemoryGenomicFeatures]:
+                query_features = features_class(
+                    data_path, self.features,
+                    feature_thresholds=feature_thresholds)
+                segment_starts, segment_ends, packed_targets = \
+                    query_features.get_feature_data_segments(
+                        '1', start, end, 100, 101)
+                self.assertEqual(segment_starts[0], start)
+                self.assertEqual(segment_ends[-1], end)
+                observed = np.repeat(
+                    np.unpackbits(packed_targets, axis=1,
+                                  count=self.n_features),
+                    segment_ends - segment_starts, axis=0)
+                np.testing.assert_array_equal(
+                    observed,
+                    query_features.get_feature_data_batch(
+                        ['1'] * len(positions),
+                        positions - 100,
+                        positions + 101))
+
 
 if __name__ == "__main__":
     unittest.main()
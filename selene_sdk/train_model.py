@@ -439,8 +439,8 @@ class TrainModel(object):
         self.sampler.set_mode("train")
 
         inputs, targets = self._get_batch()
-        inputs = torch.Tensor(inputs)
-        targets = torch.Tensor(targets)
+        inputs = torch.from_numpy(np.asarray(inputs, dtype=np.float32))
+        targets = torch.from_numpy(np.asarray(targets, dtype=np.float32))
 
         if self.use_cuda:
             inputs = inputs.cuda()
@@ -488,8 +488,8 @@ class TrainModel(object):
         all_predictions = []
 
         for (inputs, targets) in data_in_batches:
-            inputs = torch.Tensor(inputs)
-            targets = torch.Tensor(targets)
+            inputs = torch.from_numpy(np.asarray(inputs, dtype=np.float32))
+            targets = torch.from_numpy(np.asarray(targets, dtype=np.float32))
 
             if self.use_cuda:
                 inputs = inputs.cuda()
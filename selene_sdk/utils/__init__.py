@@ -10,6 +10,8 @@ from .utils import get_indices_and_probabilities
 from .utils import initialize_logger
 from .utils import load_features_list
 from .utils import load_model_from_state_dict
+from .utils import WeightedIndices
+from .utils import EpochPermutation
 from .performance_metrics import PerformanceMetrics
 from .performance_metrics import visualize_roc_curves
 from .performance_metrics import visualize_precision_recall_curves
@@ -33,6 +35,8 @@ __all__ = ["_is_lua_trained_model",
            "load_path",
            "instantiate",
            "get_indices_and_probabilities",
+           "WeightedIndices",
+           "EpochPermutation",
            "visualize_roc_curves",
            "visualize_precision_recall_curves",
            "initialize_model",
@@ -208,6 +208,20 @@ def execute(operations, configs, output_dir):
                 evaluate_model = instantiate(evaluate_model_info)
                 evaluate_model.evaluate()
 
+        elif op == "export":
+            sampler_info = configs["sampler"]
+            # the samples are written by the exporter, not the sampler
+            sampler_info.bind(save_datasets=[])
+            if output_dir is not None:
+                sampler_info.bind(output_dir=output_dir)
+            sampler = instantiate(sampler_info)
+            export_info = configs["export_h5"]
+            export_info.bind(data_sampler=sampler)
+            if output_dir is not None:
+                export_info.bind(output_dir=output_dir)
+            h5_exporter = instantiate(export_info)
+            h5_exporter.export()
+
         elif op == "analyze":
             if not model:
                 model, _ = initialize_model(
@@ -261,7 +275,7 @@ def parse_configs_and_run(configs,
         for the following top-level parameters:
 
             * `ops`: A list of 1 or more of the values \
-            {"train", "evaluate", "analyze"}. The operations specified\
+            {"train", "evaluate", "analyze", "export"}. The operations specified\
             determine what objects and information we expect to parse\
             in order to run these operations. This is required.
             * `output_dir`: Output directory to use for all the operations.\
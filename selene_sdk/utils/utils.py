@@ -56,15 +56,254 @@ def get_indices_and_probabilities(interval_lengths, indices):
     select_interval_lens = np.array(interval_lengths)[indices]
     weights = select_interval_lens / float(np.sum(select_interval_lens))
 
-    keep_indices = []
-    for index, weight in enumerate(weights):
-        if weight > 1e-10:
-            keep_indices.append(indices[index])
-    if len(keep_indices) == len(indices):
+    keep = weights > 1e-10
+    if np.all(keep):
         return indices, weights.tolist()
     else:
         return get_indices_and_probabilities(
-            interval_lengths, keep_indices)
+            interval_lengths, np.asarray(indices)[keep].tolist())
+
+
+class WeightedIndices(object):
+    """
+    Draws indices at random, with replacement, according to a weight for
+    each index. The cumulative weights are computed once, so that each
+    draw is a binary search instead of a pass over all the weights as in
+    `numpy.random.choice`. Given the same state of `numpy.random`, the
+    indices drawn are the same as those of
+    `numpy.random.choice(indices, size, replace=True, p=weights)`.
+
+    Parameters
+    ----------
+    indices : list(int) or numpy.ndarray
+        The indices to draw from, e.g. as returned by
+        `get_indices_and_probabilities`.
+    weights : list(float) or numpy.ndarray
+        The probability of drawing each index.
+
+    Attributes
+    ----------
+    indices : numpy.ndarray
+        The indices to draw from.
+
+    """
+
+    def __init__(self, indices, weights):
+        """
+        Constructs a new `WeightedIndices` object.
+        """
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self._cumulative_weights = np.cumsum(
+            np.asarray(weights, dtype=np.float64))
+        if len(self._cumulative_weights):
+            self._cumulative_weights /= self._cumulative_weights[-1]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def draw(self, size):
+        """
+        Draws indices at random according to their weights.
+
+        Parameters
+        ----------
+        size : int
+            The number of indices to draw.
+
+        Returns
+        -------
+        numpy.ndarray, dtype=numpy.int64
+            The `size` indices drawn.
+
+        Raises
+        ------
+        ValueError
+            If there are no indices to draw from.
+
+        """
+        if len(self.indices) == 0:
+            raise ValueError("Cannot draw from an empty set of indices.")
+        draws = self._cumulative_weights.searchsorted(
+            np.random.random_sample(size), side="right")
+        return self.indices[draws]
+
+
+class EpochPermutation(object):
+    """
+    Draws the indices `0, 1, ..., n - 1` without replacement, in a
+    shuffled order, and starts again with a new order once all of them
+    have been drawn. The order is generated a chunk of indices at a time,
+    so memory use depends on `chunk_size` rather than on `n`.
+
+    Each epoch maps the indices through a random bijection
+    :math:`j \\mapsto (a j + b) \\bmod n`, with :math:`a` coprime to
+    :math:`n`, and visits the chunks of :math:`j` in a random order,
+    shuffling each chunk. The indices of a chunk are therefore spread
+    across the whole range instead of being contiguous.
+
+    Copies of a permutation in several worker processes can divide each
+    epoch among themselves (see `set_partition`), if the order of the
+    epochs is drawn from `seed` rather than from `numpy.random`.
+
+    Parameters
+    ----------
+    n : int
+        The number of indices to draw from.
+    chunk_size : int, optional
+        Default is 65536. The number of indices shuffled at a time.
+    seed : int or list(int) or None, optional
+        Default is None. If None, the order of each epoch is drawn from
+        `numpy.random`. Otherwise, it only depends on `seed` and the
+        epoch, so it is the same in every process.
+
+    Attributes
+    ----------
+    n : int
+        The number of indices to draw from.
+    epoch : int
+        The number of times that all `n` indices (or, with a partition,
+        the share of this worker) have been drawn.
+    partition : tuple(int, int)
+        The ID of the worker that draws from this permutation and the
+        number of workers. Default is `(0, 1)`.
+
+    """
+
+    def __init__(self, n, chunk_size=65536, seed=None):
+        """
+        Constructs a new `EpochPermutation` object.
+        """
+        self.n = int(n)
+        self.epoch = 0
+        self.partition = (0, 1)
+        self._chunk_size = chunk_size
+        self._seed = seed
+        self._start_epoch()
+
+    def __len__(self):
+        return self.n
+
+    def set_partition(self, worker_id, num_workers):
+        """
+        Divides each epoch among `num_workers` copies of this
+        permutation: the worker `worker_id` only draws the indices at
+        positions `worker_id`, `worker_id + num_workers`, ... of the
+        order of the epoch. The permutation is started again from its
+        first epoch.
+
+        Parameters
+        ----------
+        worker_id : int
+            The ID of the worker, from 0 to `num_workers` - 1.
+        num_workers : int
+            The number of workers.
+
+        Raises
+        ------
+        ValueError
+            If the permutation has no `seed` and `num_workers` is
+            greater than 1, since the workers would then draw different
+            orders, or if there are fewer indices than workers.
+
+        """
+        if num_workers > 1 and self._seed is None:
+            raise ValueError(
+                "A permutation can only be divided among workers if it "
+                "has a seed.")
+        if num_workers > self.n:
+            raise ValueError(
+                "Cannot divide {0} indices among {1} workers.".format(
+                    self.n, num_workers))
+        self.partition = (worker_id, num_workers)
+        self.epoch = 0
+        self._start_epoch()
+
+    def _start_epoch(self):
+        n = self.n
+        # the order of the epoch is drawn from `numpy.random` if there
+        # is no seed
+        self._random_state = None
+        if self._seed is not None:
+            self._random_state = np.random.RandomState(np.random.SeedSequence(
+                self._seed, spawn_key=(self.epoch,)).generate_state(4))
+        random_state = self._get_random_state()
+        # the multiplier is bounded so that a * j does not overflow
+        max_multiplier = min(n, np.iinfo(np.int64).max // max(n, 1))
+        multiplier = 1
+        if max_multiplier > 2:
+            multiplier = random_state.randint(
+                max_multiplier // 2, max_multiplier)
+            while np.gcd(multiplier, n) != 1:
+                multiplier = random_state.randint(
+                    max_multiplier // 2, max_multiplier)
+        self._multiplier = multiplier
+        self._offset = random_state.randint(n) if n > 0 else 0
+        self._chunk_order = random_state.permutation(
+            -(-n // self._chunk_size))
+        self._next_chunk = 0
+        # the number of positions of the epoch's order before the buffer
+        self._epoch_position = 0
+        self._buffer = np.empty(0, dtype=np.int64)
+        self._buffer_position = 0
+
+    def _get_random_state(self):
+        if self._random_state is None:
+            return np.random
+        return self._random_state
+
+    def _fill_buffer(self):
+        chunk_start = self._chunk_order[self._next_chunk] * self._chunk_size
+        self._next_chunk += 1
+        draws = np.arange(chunk_start,
+                          min(chunk_start + self._chunk_size, self.n),
+                          dtype=np.int64)
+        self._get_random_state().shuffle(draws)
+        worker_id, num_workers = self.partition
+        first = (worker_id - self._epoch_position) % num_workers
+        self._epoch_position += len(draws)
+        draws = draws[first::num_workers]
+        self._buffer = (draws * self._multiplier % self.n +
+                        self._offset) % self.n
+        self._buffer_position = 0
+
+    def draw(self, size):
+        """
+        Draws the next indices of the permutation.
+
+        Parameters
+        ----------
+        size : int
+            The number of indices to draw.
+
+        Returns
+        -------
+        numpy.ndarray, dtype=numpy.int64
+            The `size` indices drawn.
+
+        Raises
+        ------
+        ValueError
+            If there are no indices to draw from.
+
+        """
+        if self.n == 0:
+            raise ValueError("Cannot draw from an empty set of indices.")
+        draws = np.empty(size, dtype=np.int64)
+        n_drawn = 0
+        while n_drawn < size:
+            if self._buffer_position == len(self._buffer):
+                self._fill_buffer()
+            n_taken = min(size - n_drawn,
+                          len(self._buffer) - self._buffer_position)
+            draws[n_drawn:n_drawn + n_taken] = self._buffer[
+                self._buffer_position:self._buffer_position + n_taken]
+            self._buffer_position += n_taken
+            n_drawn += n_taken
+            if self._buffer_position == len(self._buffer) and \
+                    self._next_chunk == len(self._chunk_order):
+                self.epoch += 1
+                self._start_epoch()
+        return draws
 
 
 def load_model_from_state_dict(state_dict, model):